@@ -11,17 +11,37 @@ Toda a lógica compartilhada (MetricsDB, retry, relatórios, etc.) vem de core/.
 MIT License — Copyright (c) 2025 lsardim1
 """
 
-import datetime
 import json
 import logging
+import os
+import random
+import sys
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import IO, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import ijson  # opcional: parsing incremental da resposta UDM Search
+except ImportError:
+    ijson = None
 
 from collectors.base import SIEMClient
 from core.db import MetricsDB
-from core.utils import _retry_with_backoff, _stable_id
+from core.utils import (
+    RETRYABLE_HTTP_STATUSES,
+    ErrorCounter,
+    _json_loads,
+    _parse_retry_after,
+    _retry_with_backoff,
+    _stable_id,
+    wait_for_stop,
+)
 
 logger = logging.getLogger("siem_collector")
 
@@ -30,10 +50,52 @@ SCOPES = ["https://www.googleapis.com/auth/chronicle-backstory"]
 
 UDM_SEARCH_MAX_EVENTS = 10000
 UDM_SEARCH_TIMEOUT = 600  # 10 minutes per API docs (600s)
+UDM_SEARCH_MAX_PARALLEL = 8  # Sub-janelas consultadas em paralelo (slice_minutes)
+# Pool de conexões HTTP dimensionado para as sub-janelas paralelas
+# (o default do urllib3 é 10 conexões por host)
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 32
+TEST_CONNECTION_CACHE_TTL = 300  # Reaproveita o último test_connection OK por 5 min
+
+# Campos de metadata usados na agregação (camelCase e snake_case)
+UDM_METADATA_FIELDS = frozenset({
+    "logType", "log_type", "productName", "product_name", "vendorName", "vendor_name",
+})
+_UDM_METADATA_PREFIX = "events.item.udm.metadata."
+
+ISO_8601_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Statistics search (YARA-L match/outcome): GROUP BY no servidor, sem baixar
+# eventos nem o limite de 10.000. Opt-in — nem todo tenant/endpoint suporta.
+UDM_STATS_QUERY = (
+    'metadata.event_type != ""\n'
+    "match:\n"
+    "  metadata.log_type, metadata.product_name, metadata.vendor_name\n"
+    "outcome:\n"
+    "  $event_count = count(metadata.id)"
+)
+UDM_STATS_COLUMNS = (
+    "metadata.log_type", "metadata.product_name", "metadata.vendor_name", "event_count",
+)
+# Status que indicam statistics search indisponível (desativa para a instância)
+UDM_STATS_UNSUPPORTED_STATUSES = (400, 404, 501)
+
+# Cota documentada da UDM Search — limitador client-side evita chegar ao 429
+UDM_SEARCH_QUOTA_PER_HOUR = 360
+RATE_LIMIT_WINDOW_SECONDS = 3600
+
+# HTTP 429: backoff exponencial com full jitter, respeitando Retry-After
+RATE_LIMIT_MAX_ATTEMPTS = 5
+RATE_LIMIT_BASE_DELAY = 1
+RATE_LIMIT_MAX_DELAY = 30
+# Teto da espera por HTTP 429 mesmo com Retry-After maior: a thread não fica
+# presa por um valor arbitrário do servidor (a espera é interrompível)
+RATE_LIMIT_RETRY_AFTER_MAX = RATE_LIMIT_MAX_DELAY * 4
 
 # Regional Backstory API endpoints
 # Ref: https://docs.cloud.google.com/chronicle/docs/reference/search-api#regional_endpoints
-BACKSTORY_ENDPOINTS: Dict[str, str] = {
+# (somente leitura — MappingProxyType impede alteração acidental em runtime)
+BACKSTORY_ENDPOINTS: Mapping[str, str] = MappingProxyType({
     "us": "https://backstory.googleapis.com",
     "europe": "https://europe-backstory.googleapis.com",
     "europe-west2": "https://europe-west2-backstory.googleapis.com",
@@ -53,7 +115,137 @@ BACKSTORY_ENDPOINTS: Dict[str, str] = {
     "northamerica-northeast2": "https://northamerica-northeast2-backstory.googleapis.com",
     "southamerica-east1": "https://southamerica-east1-backstory.googleapis.com",
     "africa-south1": "https://africa-south1-backstory.googleapis.com",
-}
+})
+DEFAULT_BASE_URL = BACKSTORY_ENDPOINTS["us"]
+UDM_SEARCH_ENDPOINT = "v1/events:udmSearch"
+
+
+# ─── Helpers ─────────────────────────────────────────────────────────────────
+class QuotaWaitInterrupted(RuntimeError):
+    """Parada (SIGINT/SIGTERM) solicitada enquanto aguardava cota da UDM Search.
+
+    Vale para as duas esperas: o limitador client-side e o retry de HTTP 429.
+    """
+
+
+def _ms_to_iso(ms: int) -> str:
+    """Converte epoch milliseconds para ISO 8601 UTC (formato aceito pela UDM Search)."""
+    return time.strftime(ISO_8601_FORMAT, time.gmtime(ms / 1000.0))
+
+
+def _metric_entry(log_type: str, product_name: str, vendor_name: str, count: int) -> Dict:
+    """Monta uma linha de métrica no formato unificado do SIEMClient."""
+    return {
+        "logsourceid": _stable_id(f"{log_type}|{product_name}"),
+        "log_source_name": (
+            f"{product_name} ({vendor_name})" if vendor_name != "Unknown" else product_name
+        ),
+        "log_source_type": log_type,
+        "aggregated_event_count": count,
+        "total_event_count": count,
+        "total_payload_bytes": 0.0,   # Not available via UDM Search
+        "avg_payload_bytes": 0.0,      # Not available via UDM Search
+    }
+
+
+def _metadata_key(metadata: Mapping[str, Any]) -> Tuple[str, str, str]:
+    """Chave de agregação ``(log_type, product_name, vendor_name)`` de um evento.
+
+    Os valores têm baixa cardinalidade (dezenas) mas chegam como strings novas
+    a cada evento; ``sys.intern`` faz todas as ocorrências apontarem para o
+    mesmo objeto, com hash já calculado e comparação por identidade no Counter.
+    """
+    return (
+        sys.intern(metadata.get("logType") or metadata.get("log_type") or "UNKNOWN"),
+        sys.intern(metadata.get("productName") or metadata.get("product_name") or "Unknown"),
+        sys.intern(metadata.get("vendorName") or metadata.get("vendor_name") or "Unknown"),
+    )
+
+
+_NO_METADATA: Mapping[str, Any] = MappingProxyType({})
+
+
+def _iter_event_metadata(events: List[Dict]) -> Iterator[Mapping[str, Any]]:
+    """Produz ``udm.metadata`` de cada evento (vazio se ausente).
+
+    EAFP: em dados UDM bem formados as chaves existem, então o acesso direto
+    evita os dicts vazios temporários de ``.get("udm", {}).get("metadata", {})``.
+    """
+    for event_wrapper in events:
+        try:
+            yield event_wrapper["udm"]["metadata"]
+        except KeyError:
+            yield _NO_METADATA
+
+
+def _iter_stream_metadata(fp: IO[bytes], state: Dict) -> Iterator[Dict]:
+    """Percorre a resposta UDM Search via ``ijson`` e produz um dict de metadata por evento.
+
+    Só os campos de ``UDM_METADATA_FIELDS`` são materializados — o restante do
+    evento UDM é descartado durante o parsing. ``moreDataAvailable`` é gravado
+    em ``state`` (pode vir antes ou depois de ``events`` no JSON).
+    """
+    metadata: Dict[str, Any] = {}
+    for prefix, event, value in ijson.parse(fp):
+        if prefix.startswith(_UDM_METADATA_PREFIX):
+            field = prefix[len(_UDM_METADATA_PREFIX):]
+            if field in UDM_METADATA_FIELDS:
+                metadata[field] = value
+        elif prefix == "events.item" and event == "end_map":
+            yield metadata
+            metadata = {}
+        elif prefix == "moreDataAvailable":
+            state["moreDataAvailable"] = bool(value)
+
+
+def _stats_cell(cell: Any) -> Any:
+    """Extrai o valor escalar de uma célula ``{"value": {"stringVal": ...}}``."""
+    value = cell.get("value") if isinstance(cell, dict) else None
+    if not isinstance(value, dict) or not value:
+        return None
+    return next(iter(value.values()))
+
+
+def _parse_stats_results(result: Any) -> Optional[Counter]:
+    """Converte a resposta colunar da statistics search em Counter.
+
+    Formato esperado: ``{"stats": {"results": [{"column": ..., "values": [...]}]}}``.
+    Retorna None se a resposta não tiver esse formato (ex: endpoint ignorou
+    a seção ``match:`` e devolveu eventos).
+    """
+    try:
+        columns = {col["column"]: col.get("values", []) for col in result["stats"]["results"]}
+        log_types, products, vendors, totals = (columns[c] for c in UDM_STATS_COLUMNS)
+    except (KeyError, TypeError):
+        return None
+
+    counts: Counter = Counter()
+    for lt, pn, vn, total in zip(log_types, products, vendors, totals):
+        counts[_metadata_key({
+            "logType": _stats_cell(lt),
+            "productName": _stats_cell(pn),
+            "vendorName": _stats_cell(vn),
+        })] += int(_stats_cell(total) or 0)
+    return counts
+
+
+# Credenciais de Service Account compartilhadas entre instâncias do client:
+# evita reler o JSON e refazer o parse da chave RSA a cada GoogleSecOpsClient.
+# A chave inclui o mtime do arquivo — uma chave rotacionada é recarregada.
+_SA_CACHE: Dict[Tuple[str, float, Tuple[str, ...]], Any] = {}
+_SA_CACHE_LOCK = threading.Lock()
+
+
+def _load_sa_credentials(credentials_cls: Any, sa_file: str, scopes: Tuple[str, ...]) -> Any:
+    """Carrega (ou reaproveita do cache) as credenciais de um Service Account JSON."""
+    path = os.path.abspath(sa_file)
+    key = (path, os.path.getmtime(path), scopes)
+    with _SA_CACHE_LOCK:
+        creds = _SA_CACHE.get(key)
+        if creds is None:
+            creds = credentials_cls.from_service_account_file(path, scopes=list(scopes))
+            _SA_CACHE[key] = creds
+    return creds
 
 
 # ─── Google SecOps Client ───────────────────────────────────────────────────
@@ -71,13 +263,41 @@ class GoogleSecOpsClient(SIEMClient):
         token: str = "",
         region: str = "us",
         verify_ssl: bool = True,
+        slice_minutes: Optional[float] = None,
+        stream_json: Optional[bool] = None,
+        test_cache_ttl: float = TEST_CONNECTION_CACHE_TTL,
+        rate_limit_per_hour: int = UDM_SEARCH_QUOTA_PER_HOUR,
+        stats_search: bool = False,
     ):
         self.verify_ssl = verify_ssl
         self.region = region
-        self.base_url = BACKSTORY_ENDPOINTS.get(region, BACKSTORY_ENDPOINTS["us"])
+        # Divide cada janela em sub-janelas consultadas em paralelo (None/0 = serial)
+        self.slice_minutes = slice_minutes if slice_minutes and slice_minutes > 0 else None
+        # Parsing incremental da UDM Search (None = automático se ijson instalado)
+        if stream_json and ijson is None:
+            raise ImportError(
+                "Pacote 'ijson' é necessário para parsing incremental (stream_json). "
+                "Instale com: pip install ijson"
+            )
+        self.stream_json = (ijson is not None) if stream_json is None else bool(stream_json)
+        self.base_url = BACKSTORY_ENDPOINTS.get(region, DEFAULT_BASE_URL)
+        self._search_url = f"{self.base_url}/{UDM_SEARCH_ENDPOINT}"
         self.session = requests.Session()
         self.session.verify = self.verify_ssl
         self._credentials = None
+        # (time.monotonic() do sucesso, info) — evita gastar a cota de 360 q/h
+        self._test_cache: Optional[Tuple[float, Dict]] = None
+        self._test_ttl = test_cache_ttl
+        # Tenta a statistics search antes da lista de eventos; desativada
+        # automaticamente na primeira resposta que indicar falta de suporte
+        self.stats_search = stats_search
+        # Janela deslizante de 1h com os instantes (monotonic) das requisições;
+        # lock porque as sub-janelas paralelas compartilham o limitador
+        self._rate_limit = rate_limit_per_hour
+        self._call_log: deque = deque()
+        self._rate_lock = threading.Lock()
+        # Telemetria: throttle preventivo vs HTTP 429 recebido
+        self.rate_limit_stats = ErrorCounter()
 
         if service_account_file:
             self.auth_mode = "service_account"
@@ -91,7 +311,22 @@ class GoogleSecOpsClient(SIEMClient):
                 "para autenticação no Google SecOps."
             )
 
-        self.session.headers.update({"Accept": "application/json"})
+        # Montado após a autenticação: _init_service_account substitui a sessão.
+        # max_retries=0 — retries ficam a cargo de _send/_retry_with_backoff;
+        # TCP_NODELAY já é o default das conexões do urllib3.
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            max_retries=0,
+        )
+        self.session.mount("https://", adapter)
+
+        # Respostas UDM (até 10.000 eventos) são JSON verboso: gzip reduz ~5-10x
+        # o tráfego; requests descomprime resp.content e resp.raw (decode_content)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+        })
 
     def _init_service_account(self, sa_file: str):
         """Inicializa autenticação via Service Account JSON."""
@@ -104,8 +339,8 @@ class GoogleSecOpsClient(SIEMClient):
                 "Instale com: pip install google-auth"
             )
 
-        self._credentials = service_account.Credentials.from_service_account_file(
-            sa_file, scopes=SCOPES
+        self._credentials = _load_sa_credentials(
+            service_account.Credentials, sa_file, tuple(SCOPES)
         )
         # Replace session with AuthorizedSession for automatic token refresh
         self.session = AuthorizedSession(self._credentials)
@@ -128,38 +363,145 @@ class GoogleSecOpsClient(SIEMClient):
                 response=resp,
             )
         if resp.status_code == 429:
-            raise requests.exceptions.HTTPError(
+            exc = requests.exceptions.HTTPError(
                 f"HTTP 429 RESOURCE_EXHAUSTED de {endpoint}. "
                 "Limite de taxa atingido (360 queries/hora para UDM Search). "
                 "Aguarde antes de fazer novas requisições.",
                 response=resp,
             )
+            exc.retry_after = _parse_retry_after(resp.headers.get("Retry-After"))  # type: ignore[attr-defined]
+            raise exc
         resp.raise_for_status()
 
-    def _get(self, endpoint: str, params: Optional[Dict] = None) -> Any:
-        """GET request com retry e validação."""
-        url = f"{self.base_url}/{endpoint}"
+    def _acquire_quota(self) -> None:
+        """Bloqueia até haver cota na janela de 1h (360 UDM Searches/hora).
+
+        Limitador client-side: em vez de só reagir ao HTTP 429, espera o
+        registro mais antigo sair da janela antes de enviar a requisição.
+        ``rate_limit_per_hour=0`` desativa o limitador.
+
+        A espera acontece fora do ``_rate_lock`` (as demais sub-janelas não
+        ficam presas no lock) e via ``wait_for_stop``: SIGINT/SIGTERM a
+        interrompe na hora com ``QuotaWaitInterrupted``. Depois da espera a
+        cota é verificada de novo.
+        """
+        if self._rate_limit <= 0:
+            return
+        call_log = self._call_log
+        while True:
+            with self._rate_lock:
+                now = time.monotonic()
+                while call_log and now - call_log[0] >= RATE_LIMIT_WINDOW_SECONDS:
+                    call_log.popleft()
+                if len(call_log) < self._rate_limit:
+                    call_log.append(now)
+                    return
+                delay = (
+                    RATE_LIMIT_WINDOW_SECONDS - (now - call_log[0])
+                    + random.uniform(0, 1)
+                )
+                self.rate_limit_stats.inc("throttle_preventivo")
+            logger.warning(
+                f"Cota client-side de {self._rate_limit} queries/hora atingida — "
+                f"aguardando {delay:.1f}s antes da próxima UDM Search"
+            )
+            if wait_for_stop(delay):
+                raise QuotaWaitInterrupted(
+                    "Parada solicitada durante a espera por cota da UDM Search"
+                )
+
+    def _send(
+        self, endpoint: str, params: Optional[Dict] = None, stream: bool = False
+    ) -> requests.Response:
+        """GET request com retry e validação; retorna a resposta já verificada.
+
+        HTTP 429 é tratado aqui (Retry-After + full jitter, limitado a
+        ``RATE_LIMIT_RETRY_AFTER_MAX`` e interrompível via ``wait_for_stop``);
+        5xx e erros de conexão continuam com _retry_with_backoff. A cota client-side é
+        reservada uma vez por requisição lógica, antes das tentativas: um
+        retry não volta a esperar pela janela de 1h.
+        """
+        url = (
+            self._search_url if endpoint == UDM_SEARCH_ENDPOINT
+            else f"{self.base_url}/{endpoint}"
+        )
         logger.debug(f"GET {url} params={params}")
 
         def _do_request():
-            resp = self.session.get(url, params=params, timeout=UDM_SEARCH_TIMEOUT)
-            self._check_response(resp, endpoint)
-            return resp.json()
+            for attempt in range(RATE_LIMIT_MAX_ATTEMPTS + 1):
+                resp = self.session.get(
+                    url, params=params, timeout=UDM_SEARCH_TIMEOUT, stream=stream
+                )
+                try:
+                    self._check_response(resp, endpoint)
+                except requests.exceptions.HTTPError as exc:
+                    # Resposta recusada não é lida: devolve a conexão ao pool
+                    # (stream=True) antes de re-levantar ou esperar
+                    resp.close()
+                    if resp.status_code != 429:
+                        raise
+                    self.rate_limit_stats.inc("http_429")
+                    if attempt == RATE_LIMIT_MAX_ATTEMPTS:
+                        raise
+                    jitter = random.uniform(
+                        0, min(RATE_LIMIT_MAX_DELAY, RATE_LIMIT_BASE_DELAY * (2 ** attempt))
+                    )
+                    delay = min(
+                        max(getattr(exc, "retry_after", None) or 0.0, jitter),
+                        RATE_LIMIT_RETRY_AFTER_MAX,
+                    )
+                    logger.warning(
+                        f"HTTP 429 em {endpoint} — nova tentativa "
+                        f"{attempt + 1}/{RATE_LIMIT_MAX_ATTEMPTS} em {delay:.1f}s"
+                    )
+                    if wait_for_stop(delay):
+                        raise QuotaWaitInterrupted(
+                            f"Parada solicitada durante a espera por HTTP 429 de {endpoint}"
+                        )
+                    continue
+                return resp
+
+        self._acquire_quota()
+        retryable = tuple(s for s in RETRYABLE_HTTP_STATUSES if s != 429)
+        return _retry_with_backoff(_do_request, retryable_statuses=retryable)
 
-        return _retry_with_backoff(_do_request)
+    def _get(self, endpoint: str, params: Optional[Dict] = None) -> Any:
+        """GET request com retry e validação; retorna o JSON já decodificado.
+
+        Decodifica ``resp.content`` com orjson quando disponível — o parse de
+        respostas UDM de 10.000 eventos domina o tempo de cada ciclo.
+        """
+        return _json_loads(self._send(endpoint, params).content)
+
+    def _get_stream(self, endpoint: str, params: Optional[Dict] = None) -> requests.Response:
+        """GET com ``stream=True`` — o corpo fica em ``resp.raw`` para parsing incremental.
+
+        O chamador é responsável por fechar a resposta.
+        """
+        resp = self._send(endpoint, params, stream=True)
+        resp.raw.decode_content = True  # descomprime gzip/deflate ao ler resp.raw
+        return resp
 
     # ── SIEMClient interface ─────────────────────────────────────────────
-    def test_connection(self) -> Dict:
-        """Testa conectividade via UDM Search simples."""
+    def test_connection(self, force: bool = False) -> Dict:
+        """Testa conectividade via UDM Search simples.
+
+        O último resultado bem-sucedido é reaproveitado por ``test_cache_ttl``
+        segundos; ``force=True`` ignora o cache (health check explícito).
+        """
+        if not force and self._test_cache is not None:
+            cached_at, cached_info = self._test_cache
+            if time.monotonic() - cached_at < self._test_ttl:
+                logger.debug("test_connection: usando resultado em cache")
+                return dict(cached_info)
+
         logger.info(f"Testando conexão com Google SecOps ({self.region})...")
         try:
-            now = datetime.datetime.now(datetime.timezone.utc)
-            start = (now - datetime.timedelta(hours=1)).strftime(
-                "%Y-%m-%dT%H:%M:%SZ"
-            )
-            end = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+            now_ms = int(time.time() * 1000)
+            start = _ms_to_iso(now_ms - 3600 * 1000)
+            end = _ms_to_iso(now_ms)
 
-            result = self._get("v1/events:udmSearch", params={
+            result = self._get(UDM_SEARCH_ENDPOINT, params={
                 "query": 'metadata.event_type != ""',
                 "time_range.start_time": start,
                 "time_range.end_time": end,
@@ -177,6 +519,7 @@ class GoogleSecOpsClient(SIEMClient):
                 f"Conexão OK — Google SecOps ({self.region}), "
                 f"{event_count} evento(s) de teste"
             )
+            self._test_cache = (time.monotonic(), dict(info))
             return info
         except requests.exceptions.HTTPError as exc:
             status = exc.response.status_code if exc.response is not None else 0
@@ -196,6 +539,17 @@ class GoogleSecOpsClient(SIEMClient):
             raise
 
     # ── UDM Search ───────────────────────────────────────────────────────
+    @staticmethod
+    def _udm_search_params(
+        query: str, start_time_iso: str, end_time_iso: str, limit: int
+    ) -> Dict:
+        return {
+            "query": query,
+            "time_range.start_time": start_time_iso,
+            "time_range.end_time": end_time_iso,
+            "limit": min(limit, UDM_SEARCH_MAX_EVENTS),
+        }
+
     def udm_search(
         self,
         query: str,
@@ -217,12 +571,10 @@ class GoogleSecOpsClient(SIEMClient):
         """
         logger.info(f"Executando UDM Search: {query[:120]}...")
         try:
-            result = self._get("v1/events:udmSearch", params={
-                "query": query,
-                "time_range.start_time": start_time_iso,
-                "time_range.end_time": end_time_iso,
-                "limit": min(limit, UDM_SEARCH_MAX_EVENTS),
-            })
+            result = self._get(
+                UDM_SEARCH_ENDPOINT,
+                params=self._udm_search_params(query, start_time_iso, end_time_iso, limit),
+            )
             events = result.get("events", [])
             more = result.get("moreDataAvailable", False)
             logger.info(
@@ -237,36 +589,193 @@ class GoogleSecOpsClient(SIEMClient):
             logger.error(f"Erro inesperado na UDM Search: {e}")
             return None
 
-    def get_event_metrics_window(
+    def _split_window(
         self, start_time_ms: int, end_time_ms: int
-    ) -> Optional[List[Dict]]:
-        """Coleta métricas de ingestão via UDM Search para um intervalo exato.
+    ) -> List[Tuple[int, int]]:
+        """Divide [start, end) em sub-janelas contíguas de ``slice_minutes``."""
+        if not self.slice_minutes:
+            return [(start_time_ms, end_time_ms)]
+        step = max(1, int(self.slice_minutes * 60 * 1000))
+        slices: List[Tuple[int, int]] = []
+        t0 = start_time_ms
+        while t0 < end_time_ms:
+            t1 = min(t0 + step, end_time_ms)
+            slices.append((t0, t1))
+            t0 = t1
+        return slices or [(start_time_ms, end_time_ms)]
+
+    def _udm_search_counts_stream(
+        self, query: str, start_time_iso: str, end_time_iso: str
+    ) -> Optional[Tuple[Counter, bool]]:
+        """UDM Search com parsing incremental (ijson), agregando direto no Counter.
+
+        Evita materializar até 10.000 eventos UDM completos em memória: apenas
+        os campos de metadata usados na agregação são lidos do stream.
 
-        Agrega eventos por ``metadata.log_type`` e ``metadata.product_name``,
-        retornando métricas no formato unificado do SIEMClient.
+        Returns:
+            ``(counts, more_data_available)`` ou None em caso de erro.
+        """
+        logger.info(f"Executando UDM Search (streaming): {query[:120]}...")
+        state = {"moreDataAvailable": False}
+        try:
+            resp = self._get_stream(
+                UDM_SEARCH_ENDPOINT,
+                params=self._udm_search_params(
+                    query, start_time_iso, end_time_iso, UDM_SEARCH_MAX_EVENTS
+                ),
+            )
+            try:
+                counts = Counter(map(_metadata_key, _iter_stream_metadata(resp.raw, state)))
+            finally:
+                resp.close()
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"Erro na UDM Search: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Erro inesperado na UDM Search: {e}")
+            return None
+        more = state["moreDataAvailable"]
+        logger.info(
+            f"UDM Search retornou {sum(counts.values())} eventos "
+            f"(moreDataAvailable={more})"
+        )
+        return counts, more
 
-        Nota: O UDM Search retorna no máximo 10.000 eventos por consulta.
-        Para ambientes de alto volume, use janelas de coleta menores
-        (ex: ``--interval 0.25`` para janelas de 15 min).
+    def _count_window_stats(
+        self, start_time_ms: int, end_time_ms: int
+    ) -> Optional[Tuple[Counter, bool]]:
+        """Agrega a janela no servidor via statistics search (``UDM_STATS_QUERY``).
+
+        Returns:
+            ``(counts, False)``, ou None para cair no caminho por lista de
+            eventos. HTTP 400/404/501 ou resposta sem ``stats`` desativam a
+            statistics search nesta instância (evita gastar cota a cada janela).
+        """
+        logger.info("Executando UDM Search (statistics)...")
+        try:
+            result = self._get(
+                UDM_SEARCH_ENDPOINT,
+                params=self._udm_search_params(
+                    UDM_STATS_QUERY, _ms_to_iso(start_time_ms), _ms_to_iso(end_time_ms),
+                    UDM_SEARCH_MAX_EVENTS,
+                ),
+            )
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            if status in UDM_STATS_UNSUPPORTED_STATUSES:
+                self.stats_search = False
+                logger.warning(
+                    f"Statistics search indisponível (HTTP {status}) — "
+                    "usando agregação client-side por lista de eventos."
+                )
+            else:
+                logger.error(f"Erro na UDM Search (statistics): {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Erro inesperado na UDM Search (statistics): {e}")
+            return None
+
+        counts = _parse_stats_results(result)
+        if counts is None:
+            self.stats_search = False
+            logger.warning(
+                "Resposta da statistics search sem 'stats' — "
+                "usando agregação client-side por lista de eventos."
+            )
+            return None
+        logger.info(f"Statistics search retornou {len(counts)} grupos")
+        return counts, False
+
+    def _count_window(
+        self, query: str, start_time_ms: int, end_time_ms: int
+    ) -> Optional[Tuple[Counter, bool]]:
+        """Executa a UDM Search de uma (sub-)janela e agrega por (log_type, product, vendor)."""
+        start_iso, end_iso = _ms_to_iso(start_time_ms), _ms_to_iso(end_time_ms)
+        if self.stream_json:
+            return self._udm_search_counts_stream(query, start_iso, end_iso)
+
+        result = self.udm_search(query, start_iso, end_iso, limit=UDM_SEARCH_MAX_EVENTS)
+        if result is None:
+            return None
+        counts = Counter(
+            map(_metadata_key, _iter_event_metadata(result.get("events", [])))
+        )
+        return counts, result.get("moreDataAvailable", False)
+
+    def _count_slices(
+        self, query: str, slices: List[Tuple[int, int]]
+    ) -> List[Optional[Tuple[Counter, bool]]]:
+        """Executa uma UDM Search por sub-janela, em paralelo.
+
+        A sessão HTTP (requests/AuthorizedSession) é compartilhada entre as
+        threads; o I/O de rede libera o GIL, então o tempo total fica próximo
+        ao da sub-janela mais lenta em vez da soma de todas. Cada thread já
+        devolve sua sub-janela agregada, sem manter a lista de eventos.
+        """
+        workers = min(UDM_SEARCH_MAX_PARALLEL, len(slices))
+        logger.info(
+            f"UDM Search em {len(slices)} sub-janelas de {self.slice_minutes} min "
+            f"({workers} em paralelo)"
+        )
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._count_window, query, t0, t1)
+                for t0, t1 in slices
+            ]
+            return [f.result() for f in futures]
+
+    @staticmethod
+    def _iter_metrics(counts: Counter) -> Iterator[Dict]:
+        """Produz as métricas no formato unificado a partir do Counter agregado.
+
+        Consolida por (log_type, product_name), que define o logsourceid;
+        vendor_name = primeiro visto (Counter preserva ordem de inserção).
+        """
+        groups: Dict[Tuple[str, str], List] = {}
+        for (log_type, product_name, vendor_name), count in counts.items():
+            group = groups.get((log_type, product_name))
+            if group is None:
+                groups[(log_type, product_name)] = [vendor_name, count]
+            else:
+                group[1] += count
+
+        # Normalize to unified format (same keys as QRadar/Splunk)
+        for (log_type, product_name), (vendor_name, count) in groups.items():
+            yield _metric_entry(log_type, product_name, vendor_name, count)
+
+    def iter_event_metrics_window(
+        self, start_time_ms: int, end_time_ms: int
+    ) -> Optional[Iterator[Dict]]:
+        """Como ``get_event_metrics_window``, mas devolve um iterador de métricas.
+
+        As consultas e a agregação acontecem na chamada (erros retornam None);
+        só a normalização para o formato unificado é preguiçosa — o chamador
+        pode repassar o iterador direto para a gravação sem lista intermediária.
         """
-        start_iso = datetime.datetime.fromtimestamp(
-            start_time_ms / 1000.0, tz=datetime.timezone.utc
-        ).strftime("%Y-%m-%dT%H:%M:%SZ")
-        end_iso = datetime.datetime.fromtimestamp(
-            end_time_ms / 1000.0, tz=datetime.timezone.utc
-        ).strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        # Query all events in the window
         query = 'metadata.event_type != ""'
-        result = self.udm_search(
-            query, start_iso, end_iso, limit=UDM_SEARCH_MAX_EVENTS
+        stats = (
+            self._count_window_stats(start_time_ms, end_time_ms)
+            if self.stats_search else None
         )
+        slices = self._split_window(start_time_ms, end_time_ms)
 
-        if result is None:
+        if stats is not None:
+            results = [stats]
+        elif len(slices) == 1:
+            results = [self._count_window(query, start_time_ms, end_time_ms)]
+        else:
+            results = self._count_slices(query, slices)
+        # Falha em qualquer sub-janela invalida a janela inteira (catch-up)
+        if any(r is None for r in results):
             return None
 
-        events = result.get("events", [])
-        more_data = result.get("moreDataAvailable", False)
+        # Aggregate by (log_type, product_name, vendor_name) — Counter em C,
+        # sem chave f-string nem teste de pertinência por evento
+        counts: Counter = Counter()
+        more_data = False
+        for slice_counts, slice_more in results:
+            counts.update(slice_counts)
+            more_data = more_data or slice_more
 
         if more_data:
             logger.warning(
@@ -275,68 +784,33 @@ class GoogleSecOpsClient(SIEMClient):
                 "(ex: --interval 0.25 para janelas de 15 min)."
             )
 
-        if not events:
-            return []
-
-        # Aggregate by log_type + product_name
-        aggregation: Dict[str, Dict] = {}
-        for event_wrapper in events:
-            udm = event_wrapper.get("udm", {})
-            metadata = udm.get("metadata", {})
-            log_type = metadata.get(
-                "logType", metadata.get("log_type", "UNKNOWN")
-            )
-            product_name = metadata.get(
-                "productName", metadata.get("product_name", "Unknown")
-            )
-            vendor_name = metadata.get(
-                "vendorName", metadata.get("vendor_name", "Unknown")
-            )
-
-            key = f"{log_type}|{product_name}"
-            if key not in aggregation:
-                aggregation[key] = {
-                    "log_type": log_type,
-                    "product_name": product_name,
-                    "vendor_name": vendor_name,
-                    "count": 0,
-                }
-            aggregation[key]["count"] += 1
+        return self._iter_metrics(counts)
 
-        # Normalize to unified format (same keys as QRadar/Splunk)
-        normalized: List[Dict] = []
-        for key, agg in aggregation.items():
-            log_type = agg["log_type"]
-            product_name = agg["product_name"]
-            vendor_name = agg["vendor_name"]
-            count = agg["count"]
-            source_name = (
-                f"{product_name} ({vendor_name})"
-                if vendor_name != "Unknown"
-                else product_name
-            )
+    def get_event_metrics_window(
+        self, start_time_ms: int, end_time_ms: int
+    ) -> Optional[List[Dict]]:
+        """Coleta métricas de ingestão via UDM Search para um intervalo exato.
 
-            normalized.append({
-                "logsourceid": _stable_id(f"{log_type}|{product_name}"),
-                "log_source_name": source_name,
-                "log_source_type": log_type,
-                "aggregated_event_count": count,
-                "total_event_count": count,
-                "total_payload_bytes": 0.0,   # Not available via UDM Search
-                "avg_payload_bytes": 0.0,      # Not available via UDM Search
-            })
+        Agrega eventos por ``metadata.log_type`` e ``metadata.product_name``,
+        retornando métricas no formato unificado do SIEMClient.
 
-        return normalized
+        Nota: O UDM Search retorna no máximo 10.000 eventos por consulta.
+        Para ambientes de alto volume, use janelas de coleta menores
+        (ex: ``--interval 0.25`` para janelas de 15 min) ou ``slice_minutes``
+        para dividir a janela em sub-janelas consultadas em paralelo.
+        Com ``ijson`` instalado a resposta é processada em streaming.
+        Com ``stats_search=True`` tenta antes a agregação no servidor.
+        """
+        metrics = self.iter_event_metrics_window(start_time_ms, end_time_ms)
+        return None if metrics is None else list(metrics)
 
     # ── Log Types (inventory) ────────────────────────────────────────────
     def get_log_types(self) -> List[str]:
         """Descobre log types existentes via UDM Search nas últimas 24h."""
         logger.info("Descobrindo log types via UDM Search...")
-        now = datetime.datetime.now(datetime.timezone.utc)
-        start = (now - datetime.timedelta(hours=24)).strftime(
-            "%Y-%m-%dT%H:%M:%SZ"
-        )
-        end = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+        now_ms = int(time.time() * 1000)
+        start = _ms_to_iso(now_ms - 24 * 3600 * 1000)
+        end = _ms_to_iso(now_ms)
 
         result = self.udm_search(
             'metadata.event_type != ""',
@@ -347,10 +821,8 @@ class GoogleSecOpsClient(SIEMClient):
             return []
 
         log_types: set = set()
-        for event_wrapper in result.get("events", []):
-            udm = event_wrapper.get("udm", {})
-            metadata = udm.get("metadata", {})
-            lt = metadata.get("logType", metadata.get("log_type", ""))
+        for metadata in _iter_event_metadata(result.get("events", [])):
+            lt = metadata.get("logType") or metadata.get("log_type")
             if lt:
                 log_types.add(lt)
 
@@ -360,22 +832,30 @@ class GoogleSecOpsClient(SIEMClient):
 
 
 # ─── Inventory ───────────────────────────────────────────────────────────────
+def _log_type_inventory(log_types: List[str]) -> List[Dict]:
+    """Monta as entradas de inventário (formato unificado) para log types."""
+    return [
+        {
+            "logsource_id": _stable_id(f"logtype:{lt}"),
+            "name": lt,
+            "type_name": lt,
+            "description": f"Google SecOps Log Type: {lt}",
+        }
+        for lt in log_types
+    ]
+
+
 def collect_inventory(client: GoogleSecOpsClient, db: MetricsDB) -> int:
-    """Coleta inventário de log types do Google SecOps."""
+    """Coleta inventário de log types do Google SecOps.
+
+    Roda uma vez, no início; depois de cada coleta o inventário é atualizado
+    a partir das próprias métricas (``update_inventory_from_results``).
+    """
     logger.info("Coletando inventário de log types...")
     try:
         log_types = client.get_log_types()
         if log_types:
-            inventory = []
-            for lt in log_types:
-                ls_id = _stable_id(f"logtype:{lt}")
-                inventory.append({
-                    "logsource_id": ls_id,
-                    "name": lt,
-                    "type_name": lt,
-                    "description": f"Google SecOps Log Type: {lt}",
-                })
-            db.save_log_sources_inventory(inventory)
+            db.save_log_sources_inventory(_log_type_inventory(log_types))
             logger.info(f"Inventário: {len(log_types)} log types")
         return len(log_types)
     except Exception as e:
@@ -383,15 +863,62 @@ def collect_inventory(client: GoogleSecOpsClient, db: MetricsDB) -> int:
         return 0
 
 
-def update_inventory_from_results(db: MetricsDB, metrics: List[Dict]):
-    """Callback pós-coleta: atualiza inventário com log types descobertos."""
-    inventory_entries = []
-    for m in metrics:
-        inventory_entries.append({
+def collect_inventory_multi(
+    clients: List[GoogleSecOpsClient], db: MetricsDB
+) -> Dict[str, int]:
+    """Coleta inventário de vários clients (ex: regiões distintas) em paralelo.
+
+    As UDM Searches rodam em threads (tempo total ≈ região mais lenta); a
+    gravação acontece uma única vez na thread chamadora, já que a conexão
+    SQLite do MetricsDB não é compartilhável entre threads.
+
+    Returns:
+        Número de log types por região (0 para regiões com falha).
+    """
+    if not clients:
+        return {}
+
+    def _discover(client: GoogleSecOpsClient) -> List[str]:
+        try:
+            return client.get_log_types()
+        except Exception as e:
+            logger.warning(f"Não foi possível coletar inventário ({client.region}): {e}")
+            return []
+
+    logger.info(f"Coletando inventário de log types em {len(clients)} clients...")
+    workers = min(UDM_SEARCH_MAX_PARALLEL, len(clients))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        discovered = list(executor.map(_discover, clients))
+
+    counts: Dict[str, int] = {}
+    inventory: List[Dict] = []
+    for client, log_types in zip(clients, discovered):
+        counts[client.region] = counts.get(client.region, 0) + len(log_types)
+        inventory.extend(_log_type_inventory(log_types))
+    if inventory:
+        try:
+            db.save_log_sources_inventory(inventory)
+        except Exception as e:
+            logger.warning(f"Não foi possível salvar inventário: {e}")
+            return {region: 0 for region in counts}
+    logger.info(f"Inventário: {len(inventory)} log types em {len(counts)} região(ões)")
+    return counts
+
+
+def update_inventory_from_results(db: MetricsDB, metrics: Iterable[Dict]):
+    """Callback pós-coleta: atualiza inventário com log types descobertos.
+
+    Aceita qualquer iterável (lista ou ``iter_event_metrics_window``),
+    percorrido uma única vez.
+    """
+    inventory_entries = [
+        {
             "logsource_id": int(m.get("logsourceid", 0)),
             "name": m.get("log_source_name", "Unknown"),
             "type_name": m.get("log_source_type", "Unknown"),
-        })
+        }
+        for m in metrics
+    ]
     if inventory_entries:
         db.save_log_sources_inventory(inventory_entries)
 
@@ -405,12 +932,22 @@ def create_sample_config(path: str):
         "verify_ssl": True,
         "collection_days": 6,
         "interval_hours": 1,
+        "slice_minutes": 0,
+        "stats_search": False,
         "db_file": "secops_metrics.db",
         "report_dir": "reports",
         "_comment_regions": (
             "Regiões disponíveis: us, europe, southamerica-east1, "
             "asia-southeast1, etc. Veja documentação completa."
         ),
+        "_comment_slice": (
+            "slice_minutes > 0 divide cada janela em sub-janelas consultadas "
+            "em paralelo (evita o limite de 10.000 eventos). 0 = desativado."
+        ),
+        "_comment_stats": (
+            "stats_search=true agrega no servidor (statistics search), sem o "
+            "limite de 10.000 eventos; se indisponível, volta à lista de eventos."
+        ),
         "_comment_auth": (
             "Forneça service_account_file OU auth_token. "
             "Service Account é recomendado para produção."
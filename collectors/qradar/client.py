@@ -8,41 +8,250 @@ queries AQL, paginação com Range headers, e inventário de log sources.
 Toda a lógica compartilhada (MetricsDB, retry, relatórios, etc.) vem de core/.
 """
 
-import datetime
+import functools
+import itertools
 import json
 import logging
+import random
+import re
+import ssl
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+try:
+    import ijson  # opcional: parse incremental dos resultados Ariel
+except ImportError:
+    ijson = None
 
 from collectors.base import SIEMClient
 from core.db import MetricsDB
-from core.utils import _retry_with_backoff
+from core.utils import _json_loads, _retry_with_backoff
 
 logger = logging.getLogger("siem_collector")
 
 # ─── QRadar-specific constants ───────────────────────────────────────────────
 AQL_TIMEOUT_SECONDS = 300
-AQL_POLL_INTERVAL = 5
-ARIEL_MAX_RESULTS = 50000  # Limite máximo de resultados por query AQL
+# Polling de status AQL: backoff exponencial (0,25s × 1,5 até 10s) com full
+# jitter — dorme random(0, teto) para coletores não consultarem o Ariel em
+# sincronia — somado ao long-poll do servidor (Prefer: wait), que responde
+# assim que o status muda. O teto volta ao início quando o progresso avança
+# AQL_POLL_PROGRESS_RESET pontos percentuais.
+AQL_POLL_INITIAL_DELAY = 0.25
+AQL_POLL_BACKOFF = 1.5
+AQL_POLL_MAX_DELAY = 10
+AQL_POLL_PROGRESS_RESET = 20
+AQL_PREFER_WAIT = 30
+ARIEL_MAX_RESULTS = 50000  # Limite máximo de resultados por página Ariel
+# Página dos resultados AQL bufferizados (run_aql_query): corpos JSON menores
+# limitam o pico de memória por requisição; o caminho em streaming (ijson)
+# não bufferiza e usa ARIEL_MAX_RESULTS
+AQL_RESULT_PAGE = 2000
+# Folga (minutos) da dica ``LAST N MINUTES`` das queries de janela: o Ariel
+# descarta partições fora do intervalo antes de aplicar o filtro em ms
+AQL_LAST_SLACK_MINUTES = 5
+# Atraso máximo (minutos) do fim da janela em relação a agora para emitir a
+# dica: ``LAST`` é relativo ao relógio, e numa janela de catch-up antiga ela
+# faria o Ariel varrer todas as partições até agora — melhor omiti-la
+AQL_LAST_MAX_LAG_MINUTES = 15
+# Status do POST ariel/searches que indicam AQL inválida (erro de parse), e
+# não falha transitória — ver AQLQueryRejected
+AQL_REJECTED_STATUSES = (400, 422)
+
+# Pool de conexões keep-alive para o host QRadar (default do urllib3: 10)
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 64
+# Codificações que o urllib3 sabe descomprimir neste ambiente: gzip/deflate
+# sempre; br e zstd quando brotli/zstandard estão instalados (opcionais)
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+PAGINATION_MAX_PARALLEL = 8  # Páginas de Range buscadas em paralelo após a primeira
+AQL_MAX_PARALLEL = 4  # Buscas Ariel simultâneas em run_aql_queries (limite do servidor)
+
+# Mapeamento type_id → nome muda só quando DSMs são instalados: cache em
+# processo por (base_url, api_version), opcionalmente persistido no MetricsDB
+LOG_SOURCE_TYPES_CACHE_TTL = 3600
+# Id nas métricas sem nome conhecido (log source criada/renomeada após o
+# inventário): re-pagina as log sources no máximo uma vez por intervalo
+LOG_SOURCE_NAMES_REFRESH_SECONDS = 900
+# O mesmo para tipos (mapa vazio/expirado ou devicetype desconhecido nas
+# métricas): nova busca no máximo uma vez por intervalo, inclusive após falha
+LOG_SOURCE_TYPES_REFRESH_SECONDS = 900
+_TYPES_CACHE: Dict[Tuple[str, str], Tuple[float, Dict[int, str]]] = {}
+
+_CONTENT_RANGE_TOTAL = re.compile(r"items\s+\d+-\d+/(\d+)")
+_HTML_SNIFF = re.compile(rb"\s*<(?:!doctype|html|head)", re.IGNORECASE)
+_JSON_START = (b"{", b"[")
+_FROM_FLOWS = re.compile(r"\bFROM\s+flows\b", re.IGNORECASE)
+
+# ─── AQL templates ───────────────────────────────────────────────────────────
+# Montadas uma única vez no import; por chamada só ``str.format`` dos limites
+# numéricos da janela ({s}, {e}), da dica de partições ({last_clause}) e do
+# tamanho do bucket ({bucket_ms}). As métricas projetam só os ids
+# (logsourceid, devicetype): os nomes são resolvidos no cliente a partir do
+# inventário e do mapa de tipos, sem LOGSOURCENAME/LOGSOURCETYPENAME por linha.
+_AQL_METRICS_COLUMNS = (
+    "SELECT logsourceid, devicetype, "
+    "COUNT(*) as aggregated_event_count, "
+    "SUM(eventcount) as total_event_count, "
+    "SUM(STRLEN(UTF8(payload))) as total_payload_bytes, "
+    "AVG(STRLEN(UTF8(payload))) as avg_payload_bytes "
+)
+_AQL_UNPARSED_COLUMNS = (
+    ", SUM(CASE WHEN isunparsed=1 THEN 1 ELSE 0 END) as unparsed_aggregated_events, "
+    "SUM(CASE WHEN isunparsed=1 THEN eventcount ELSE 0 END) as unparsed_total_events "
+)
+_AQL_BUCKET_COLUMN = ", LONG((starttime - {s}) / {bucket_ms}) as bucket "
+_AQL_WINDOW = (
+    "FROM events {last_clause}"
+    "WHERE starttime >= {s} AND starttime < {e} "
+)
+_AQL_GROUP = "GROUP BY logsourceid, devicetype ORDER BY total_event_count DESC"
+_AQL_GROUP_BUCKET = "GROUP BY logsourceid, devicetype, bucket ORDER BY bucket"
+
+# (with_unparsed, bucketed) → template completo
+_AQL_METRICS_TEMPLATES: Dict[Tuple[bool, bool], str] = {
+    (True, False): _AQL_METRICS_COLUMNS + _AQL_UNPARSED_COLUMNS + _AQL_WINDOW + _AQL_GROUP,
+    (False, False): _AQL_METRICS_COLUMNS + _AQL_WINDOW + _AQL_GROUP,
+    (True, True): (_AQL_METRICS_COLUMNS + _AQL_UNPARSED_COLUMNS + _AQL_BUCKET_COLUMN
+                   + _AQL_WINDOW + _AQL_GROUP_BUCKET),
+    (False, True): _AQL_METRICS_COLUMNS + _AQL_BUCKET_COLUMN + _AQL_WINDOW + _AQL_GROUP_BUCKET,
+}
+
+_AQL_FLOW_COUNTS = (
+    "SELECT sourceip, "
+    "COUNT(*) as flow_count, "
+    "SUM(sourcebytes + destinationbytes) as total_bytes "
+    "FROM flows WHERE starttime >= {s} AND starttime < {e} "
+    "GROUP BY sourceip "
+    "ORDER BY flow_count DESC"
+)
+
+_AQL_LEGACY_COUNTS = (
+    "SELECT logsourceid, "
+    "LOGSOURCENAME(logsourceid) as log_source_name, "
+    "LOGSOURCETYPENAME(devicetype) as log_source_type, "
+    "SUM(eventcount) as total_event_count, "
+    "COUNT(*) as aggregated_event_count, "
+    "SUM(STRLEN(UTF8(payload))) as total_payload_bytes, "
+    "AVG(STRLEN(UTF8(payload))) as avg_payload_bytes, "
+    "MIN(STRLEN(UTF8(payload))) as min_payload_bytes, "
+    "MAX(STRLEN(UTF8(payload))) as max_payload_bytes "
+    + _AQL_WINDOW
+    + _AQL_GROUP
+)
+
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
+def _last_clause(start_time_ms: int, end_time_ms: int) -> str:
+    """Dica ``LAST N MINUTES `` que cobre ``[start, end)`` a partir de agora.
+
+    ``LAST`` é relativo ao relógio, então a conta vai de ``start`` até
+    ``max(end, agora)``. Só vale a pena para janelas recentes: se ``end``
+    ficou mais de ``AQL_LAST_MAX_LAG_MINUTES`` para trás (catch-up), a dica
+    cobriria todas as partições até agora e é omitida. Em ambos os casos o
+    filtro em ms no WHERE mantém a semântica exata da janela.
+    """
+    now_ms = int(time.time() * 1000)
+    if now_ms - int(end_time_ms) > AQL_LAST_MAX_LAG_MINUTES * 60000:
+        return ""
+    span_ms = max(int(end_time_ms), now_ms) - int(start_time_ms)
+    return f"LAST {max(1, -(-span_ms // 60000)) + AQL_LAST_SLACK_MINUTES} MINUTES "
+
+
 def _validate_json_response(resp: requests.Response, endpoint: str) -> Any:
-    """Valida que a resposta é JSON válido e não HTML de erro."""
-    text = resp.text[:200].lower().lstrip()
-    if text.startswith(('<!doctype', '<html', '<head')):
+    """Valida que a resposta é JSON válido e não HTML de erro.
+
+    Inspeciona só os primeiros 200 bytes de ``resp.content``: não acesse
+    ``resp.text`` antes desta checagem — ele decodifica o corpo inteiro
+    (multi-MB em resultados Ariel) só para olhar o início.
+    O sniff só roda quando o ``Content-Type`` não é JSON (páginas de erro de
+    proxy/load balancer) e o corpo não começa com ``{``/``[`` — o caminho
+    normal nem passa pelo regex. Decodifica ``resp.content`` (bytes) com
+    orjson quando disponível.
+    """
+    content = resp.content
+    if (
+        not resp.headers.get("Content-Type", "").startswith("application/json")
+        and content[:1] not in _JSON_START
+        and _HTML_SNIFF.match(content, 0, 200)
+    ):
         raise ValueError(
-            f"Esperado JSON de {endpoint} mas recebeu HTML: {resp.text[:200]}"
+            f"Esperado JSON de {endpoint} mas recebeu HTML: "
+            f"{content[:200].decode('utf-8', errors='replace')}"
         )
-    return resp.json()
+    return _json_loads(content)
+
+
+def _parse_content_range_total(value: Optional[str]) -> Optional[int]:
+    """Extrai o total de ``Content-Range: items 0-49/1234`` (None se ausente)."""
+    if not value:
+        return None
+    match = _CONTENT_RANGE_TOTAL.search(value)
+    return int(match.group(1)) if match else None
+
+
+class AQLQueryRejected(RuntimeError):
+    """O Ariel recusou a AQL no POST (HTTP 400/422: sintaxe ou campo inválido)."""
+
+
+class _TypeMap(dict):
+    """Mapa type_id → nome; ``types[id]`` desconhecido devolve ``Type-<id>``.
+
+    O placeholder não é gravado no mapa: o mesmo objeto fica no cache de
+    tipos, e ``.get()``/``in`` continuam vendo só nomes vindos do servidor.
+    """
+
+    def __missing__(self, type_id):
+        return f"Type-{type_id}"
+
+
+@functools.lru_cache(maxsize=None)
+def _unverified_ssl_context() -> ssl.SSLContext:
+    """SSLContext sem verificação, criado uma vez e compartilhado (verify_ssl=False).
+
+    Sem ele o urllib3 monta um contexto novo a cada conexão TLS aberta.
+    """
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+class _SSLContextAdapter(HTTPAdapter):
+    """HTTPAdapter que entrega um SSLContext fixo ao PoolManager (e proxies)."""
+
+    def __init__(self, *args, ssl_context: Optional[ssl.SSLContext] = None, **kwargs):
+        self._ssl_context = ssl_context  # antes do super(): ele chama init_poolmanager
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._ssl_context is not None:
+            kwargs["ssl_context"] = self._ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if self._ssl_context is not None:
+            proxy_kwargs["ssl_context"] = self._ssl_context
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
 
 
 # ─── QRadar Client ───────────────────────────────────────────────────────────
 class QRadarClient(SIEMClient):
     """Cliente REST para o IBM QRadar."""
 
-    def __init__(self, base_url: str, api_token: str, verify_ssl: bool = False, api_version: str = "26.0"):
+    def __init__(
+        self,
+        base_url: str,
+        api_token: str,
+        verify_ssl: bool = False,
+        api_version: str = "26.0",
+        pool_connections: int = HTTP_POOL_CONNECTIONS,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+    ):
         self.base_url = base_url.rstrip("/")
         self.api_token = api_token
         self.verify_ssl = verify_ssl
@@ -52,8 +261,34 @@ class QRadarClient(SIEMClient):
             "SEC": self.api_token,
             "Accept": "application/json",
             "Version": self.api_version,
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Connection": "keep-alive",
         })
         self.session.verify = self.verify_ssl
+        # None = ainda não testado; ver _run_event_metrics_aql
+        self._supports_unparsed: Optional[bool] = None
+        # logsourceid → nome, preenchido por iter_log_sources (inventário);
+        # resolve os nomes das métricas sem LOGSOURCENAME() na AQL
+        self._log_source_names: Dict[int, str] = {}
+        # time.monotonic() da última paginação completa (None = nunca)
+        self._log_source_names_refreshed: Optional[float] = None
+        # time.monotonic() da última busca de tipos pelas métricas (None = nunca)
+        self._log_source_types_refreshed: Optional[float] = None
+        # Reaproveita conexões TCP/TLS entre páginas e polls de status AQL.
+        # pool_block=True espera uma conexão livre em vez de abrir e descartar
+        # conexões extras ("Connection pool is full"); max_retries=0 porque o
+        # retry fica com _retry_with_backoff. Com verify_ssl=False todas as
+        # conexões reutilizam um único SSLContext sem verificação; o aviso de
+        # SSL não verificado já é desativado uma única vez em core.utils.
+        adapter = _SSLContextAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True,
+            max_retries=0,
+            ssl_context=None if self.verify_ssl else _unverified_ssl_context(),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def _check_response(self, resp: requests.Response, endpoint: str) -> None:
         """Verifica status HTTP e fornece mensagens acionáveis."""
@@ -72,18 +307,48 @@ class QRadarClient(SIEMClient):
         resp.raise_for_status()
 
     def _get(self, endpoint: str, params: Optional[Dict] = None,
-             extra_headers: Optional[Dict] = None) -> Any:
-        """GET request com retry e validação."""
+             extra_headers: Optional[Dict] = None, return_headers: bool = False) -> Any:
+        """GET request com retry e validação.
+
+        Com ``return_headers=True`` retorna ``(json, headers)`` — usado pela
+        paginação para ler ``Content-Range``.
+        """
         url = f"{self.base_url}/api/{endpoint}"
         logger.debug(f"GET {url} params={params} headers={extra_headers}")
 
         def _do_request():
             resp = self.session.get(url, params=params, headers=extra_headers, timeout=60)
             self._check_response(resp, endpoint)
-            return _validate_json_response(resp, endpoint)
+            data = _validate_json_response(resp, endpoint)
+            return (data, resp.headers) if return_headers else data
 
         return _retry_with_backoff(_do_request)
 
+    def _get_stream(self, endpoint: str, extra_headers: Optional[Dict] = None) -> requests.Response:
+        """GET com ``stream=True``: devolve a resposta sem ler o corpo.
+
+        O chamador consome ``resp.raw`` incrementalmente (ijson) e deve
+        fechar a resposta. ``decode_content`` faz o urllib3 descomprimir
+        gzip/deflate durante a leitura. Respostas recusadas por
+        ``_check_response`` são fechadas aqui: com ``pool_block=True`` cada
+        tentativa falha prenderia uma conexão do pool.
+        """
+        url = f"{self.base_url}/api/{endpoint}"
+        logger.debug(f"GET (stream) {url} headers={extra_headers}")
+
+        def _do_request():
+            resp = self.session.get(url, headers=extra_headers, timeout=60, stream=True)
+            try:
+                self._check_response(resp, endpoint)
+            except Exception:
+                resp.close()
+                raise
+            return resp
+
+        resp = _retry_with_backoff(_do_request)
+        resp.raw.decode_content = True
+        return resp
+
     def _post(self, endpoint: str, params: Optional[Dict] = None, data: Any = None) -> Any:
         """POST request com retry e validação."""
         url = f"{self.base_url}/api/{endpoint}"
@@ -96,25 +361,70 @@ class QRadarClient(SIEMClient):
 
         return _retry_with_backoff(_do_request)
 
-    def _paginate_endpoint(self, endpoint: str, page_size: int = 500) -> List[Dict]:
-        """Pagina um endpoint usando Range headers (padrão QRadar)."""
-        all_items: List[Dict] = []
-        offset = 0
-        while True:
-            headers = {"Range": f"items={offset}-{offset + page_size - 1}"}
-            try:
-                batch = self._get(endpoint, extra_headers=headers)
-                if not batch:
-                    break
-                all_items.extend(batch)
+    def _get_page(self, endpoint: str, offset: int, page_size: int) -> List[Dict]:
+        """Busca uma página ``items=offset-(offset+page_size-1)``; HTTP 416 = vazia."""
+        headers = {"Range": f"items={offset}-{offset + page_size - 1}"}
+        try:
+            return self._get(endpoint, extra_headers=headers) or []
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 416:
+                return []
+            raise
+
+    def _iter_paginated(self, endpoint: str, page_size: int = 500) -> Iterator[List[Dict]]:
+        """Gera as páginas de um endpoint usando Range headers (padrão QRadar).
+
+        A primeira página é buscada sozinha para ler o total em
+        ``Content-Range: items 0-N/TOTAL``; as demais são buscadas em paralelo
+        (até ``PAGINATION_MAX_PARALLEL``) pela sessão com pool e geradas na
+        ordem dos offsets. Sem o header, segue página a página com lookahead
+        de uma página: a próxima é buscada em background enquanto o chamador
+        processa a atual.
+        """
+        headers = {"Range": f"items=0-{page_size - 1}"}
+        try:
+            first, resp_headers = self._get(
+                endpoint, extra_headers=headers, return_headers=True
+            )
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 416:
+                return
+            raise
+        first = list(first or [])
+        yield first
+        if len(first) < page_size:
+            return
+
+        total = _parse_content_range_total(resp_headers.get("Content-Range"))
+        if total is not None:
+            offsets = range(page_size, total, page_size)
+            if offsets:
+                workers = min(PAGINATION_MAX_PARALLEL, len(offsets))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(self._get_page, endpoint, offset, page_size)
+                        for offset in offsets
+                    ]
+                    for future in futures:
+                        yield future.result()
+            return
+
+        # Sem Content-Range: sequencial até uma página incompleta, com prefetch
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offset = page_size
+            pending = executor.submit(self._get_page, endpoint, offset, page_size)
+            while True:
+                batch = pending.result()
                 if len(batch) < page_size:
-                    break
+                    yield batch
+                    return
                 offset += page_size
-            except requests.exceptions.HTTPError as e:
-                if e.response is not None and e.response.status_code == 416:
-                    break
-                raise
-        return all_items
+                pending = executor.submit(self._get_page, endpoint, offset, page_size)
+                yield batch
+
+    def _paginate_endpoint(self, endpoint: str, page_size: int = 500) -> List[Dict]:
+        """Pagina um endpoint e concatena todas as páginas (ver ``_iter_paginated``)."""
+        return [item for page in self._iter_paginated(endpoint, page_size) for item in page]
 
     # ── SIEMClient interface ─────────────────────────────────────────────
     def test_connection(self) -> Dict:
@@ -139,17 +449,65 @@ class QRadarClient(SIEMClient):
             raise
 
     # ── Log Sources ──────────────────────────────────────────────────────
+    def iter_log_sources(self) -> Iterator[Dict]:
+        """Gera as log sources configuradas, uma página por vez.
+
+        Registra de passagem o nome de cada uma em ``self._log_source_names``.
+        """
+        names = self._log_source_names
+        for page in self._iter_paginated(
+            "config/event_sources/log_source_management/log_sources", page_size=500
+        ):
+            for ls in page:
+                if "id" in ls:
+                    names[ls["id"]] = ls.get("name", "Unknown")
+            yield from page
+        self._log_source_names_refreshed = time.monotonic()
+
     def get_log_sources(self) -> List[Dict]:
         """Retorna todas as log sources configuradas."""
-        log_sources = self._paginate_endpoint(
-            "config/event_sources/log_source_management/log_sources", page_size=500
-        )
+        log_sources = list(self.iter_log_sources())
         logger.info(f"Total de log sources encontradas: {len(log_sources)}")
         return log_sources
 
-    def get_log_source_types(self) -> Dict[int, str]:
-        """Retorna mapeamento de type_id → nome do tipo."""
-        types_map: Dict[int, str] = {}
+    def get_log_source_types(self, force_refresh: bool = False,
+                             db: Optional[MetricsDB] = None) -> Dict[int, str]:
+        """Retorna mapeamento de type_id → nome do tipo (``_TypeMap``).
+
+        ``types[type_id]`` nunca levanta KeyError: ids desconhecidos resolvem
+        para ``Type-<id>``.
+
+        Usa cache em processo (``LOG_SOURCE_TYPES_CACHE_TTL``) e, se ``db``
+        for informado, o snapshot persistido no MetricsDB — evita paginar
+        centenas de tipos a cada inventário. ``force_refresh=True`` ignora
+        ambos. Falhas na API retornam um mapa vazio e não são cacheadas.
+        """
+        if not force_refresh:
+            cached = self._cached_log_source_types(db)
+            if cached is not None:
+                return cached
+        types_map = self._fetch_log_source_types()
+        self._store_log_source_types(types_map, db)
+        return types_map
+
+    def _cached_log_source_types(self, db: Optional[MetricsDB] = None) -> Optional[_TypeMap]:
+        """Tipos ainda válidos do cache em processo ou do MetricsDB (None se expirados)."""
+        key = (self.base_url, self.api_version)
+        cached = _TYPES_CACHE.get(key)
+        if cached and time.monotonic() - cached[0] < LOG_SOURCE_TYPES_CACHE_TTL:
+            return cached[1]
+        if db is not None:
+            persisted = db.get_log_source_types(max_age_seconds=LOG_SOURCE_TYPES_CACHE_TTL)
+            if persisted:
+                logger.debug(f"Tipos de log source carregados do banco: {len(persisted)}")
+                types_map = _TypeMap(persisted)
+                _TYPES_CACHE[key] = (time.monotonic(), types_map)
+                return types_map
+        return None
+
+    def _fetch_log_source_types(self) -> _TypeMap:
+        """Pagina os tipos na API (só rede: seguro fora da thread do MetricsDB)."""
+        types_map = _TypeMap()
         try:
             types_list = self._paginate_endpoint(
                 "config/event_sources/log_source_management/log_source_types", page_size=1000
@@ -162,13 +520,29 @@ class QRadarClient(SIEMClient):
             logger.warning(f"Não foi possível obter tipos de log source: {e}")
         return types_map
 
+    def _store_log_source_types(self, types_map: _TypeMap, db: Optional[MetricsDB] = None) -> None:
+        """Cacheia (e persiste, se ``db``) um mapa recém-buscado; mapas vazios são ignorados."""
+        if not types_map:
+            return
+        if db is not None:
+            db.save_log_source_types(types_map)
+        _TYPES_CACHE[(self.base_url, self.api_version)] = (time.monotonic(), types_map)
+
     # ── AQL Queries ──────────────────────────────────────────────────────
-    def run_aql_query(self, aql: str) -> Optional[List[Dict]]:
-        """Executa uma query AQL e aguarda resultado."""
+    def _submit_and_wait(self, aql: str, raise_on_reject: bool = False) -> Optional[str]:
+        """Inicia a busca AQL e faz polling até COMPLETED; retorna o search_id.
+
+        Com ``raise_on_reject=True``, um POST recusado com
+        ``AQL_REJECTED_STATUSES`` levanta ``AQLQueryRejected`` em vez de
+        retornar None — separa "AQL inválida" de rede/timeout/5xx.
+        """
         logger.info(f"Executando AQL: {aql[:120]}...")
         try:
             search = self._post("ariel/searches", params={"query_expression": aql})
         except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            if raise_on_reject and status in AQL_REJECTED_STATUSES:
+                raise AQLQueryRejected(f"AQL recusada pelo Ariel (HTTP {status}): {e}") from e
             logger.error(f"Erro ao iniciar query AQL: {e}")
             return None
 
@@ -177,49 +551,88 @@ class QRadarClient(SIEMClient):
             logger.error("Não foi possível obter search_id da query AQL.")
             return None
 
-        # Polling até completar
-        start = time.time()
+        # Polling até completar (relógio monotônico: imune a ajustes de NTP)
+        start = time.monotonic()
+        delay = AQL_POLL_INITIAL_DELAY
+        reset_progress = 0
+        status: Dict = {}
+        etag: Optional[str] = None
         while True:
-            if time.time() - start > AQL_TIMEOUT_SECONDS:
+            if time.monotonic() - start > AQL_TIMEOUT_SECONDS:
                 logger.error(f"Timeout aguardando query AQL {search_id}")
                 return None
 
-            status = self._get(
-                f"ariel/searches/{search_id}",
-                extra_headers={"Prefer": "wait=10"},
-            )
-            progress = status.get("progress", 0)
+            status, etag = self._poll_search_status(search_id, status, etag)
+            progress = status.get("progress", 0) or 0
             query_status = status.get("status", "UNKNOWN")
 
             if query_status == "COMPLETED":
-                break
+                return search_id
             elif query_status in ("CANCELED", "ERROR"):
                 logger.error(f"Query AQL falhou com status: {query_status}")
                 return None
 
-            logger.debug(f"AQL search {search_id}: {query_status} ({progress}%)")
-            time.sleep(AQL_POLL_INTERVAL)
+            if progress - reset_progress >= AQL_POLL_PROGRESS_RESET:
+                reset_progress = progress
+                delay = AQL_POLL_INITIAL_DELAY
+            sleep_for = random.uniform(0, delay)
+            logger.debug(
+                f"AQL search {search_id}: {query_status} ({progress}%) — "
+                f"próximo poll em {sleep_for:.2f}s"
+            )
+            time.sleep(sleep_for)
+            delay = min(AQL_POLL_MAX_DELAY, delay * AQL_POLL_BACKOFF)
+
+    def _poll_search_status(self, search_id: str, last_status: Dict,
+                            etag: Optional[str]) -> Tuple[Dict, Optional[str]]:
+        """GET do status da busca com long-poll (``Prefer: wait``) e ETag.
+
+        Envia ``If-None-Match`` com o ETag da resposta anterior: um 304
+        (status inalterado) reaproveita ``last_status`` sem baixar nem
+        decodificar o corpo. Retorna ``(status, etag)``.
+        """
+        endpoint = f"ariel/searches/{search_id}"
+        url = f"{self.base_url}/api/{endpoint}"
+        headers = {"Prefer": f"wait={AQL_PREFER_WAIT}"}
+        if etag:
+            headers["If-None-Match"] = etag
+
+        def _do_request():
+            resp = self.session.get(url, headers=headers, timeout=60)
+            if resp.status_code == 304:
+                return last_status, etag
+            self._check_response(resp, endpoint)
+            return _validate_json_response(resp, endpoint), resp.headers.get("ETag")
+
+        return _retry_with_backoff(_do_request)
+
+    def run_aql_query(self, aql: str, raise_on_reject: bool = False) -> Optional[List[Dict]]:
+        """Executa uma query AQL e aguarda resultado.
 
-        # Buscar resultados com paginação automática
+        Retorna None em qualquer falha; com ``raise_on_reject=True`` a AQL
+        recusada no POST levanta ``AQLQueryRejected`` (ver ``_submit_and_wait``).
+        """
+        search_id = self._submit_and_wait(aql, raise_on_reject)
+        if search_id is None:
+            return None
+
+        # Buscar resultados com paginação automática (HTTP 416 = fim)
+        endpoint = f"ariel/searches/{search_id}/results"
         try:
             all_events: List[Dict] = []
             offset = 0
             while True:
-                end_idx = offset + ARIEL_MAX_RESULTS - 1
-                results = self._get(
-                    f"ariel/searches/{search_id}/results",
-                    extra_headers={"Range": f"items={offset}-{end_idx}"},
-                )
-                events = results.get("events", results.get("flows", []))
+                results = self._get_page(endpoint, offset, AQL_RESULT_PAGE)
+                events = results.get("events", results.get("flows", [])) if results else []
                 if not events:
                     break
                 all_events.extend(events)
-                if len(events) < ARIEL_MAX_RESULTS:
+                if len(events) < AQL_RESULT_PAGE:
                     break  # Última página — menos resultados que o limite
-                offset += ARIEL_MAX_RESULTS
-                logger.info(
+                offset += AQL_RESULT_PAGE
+                logger.debug(
                     f"Paginando resultados AQL: {len(all_events)} registros até agora "
-                    f"(página {offset // ARIEL_MAX_RESULTS + 1})..."
+                    f"(página {offset // AQL_RESULT_PAGE + 1})..."
                 )
 
             if offset > 0:
@@ -230,104 +643,282 @@ class QRadarClient(SIEMClient):
             logger.error(f"Erro ao buscar resultados AQL: {e}")
             return None
 
-    def get_event_metrics_window(self, start_time_ms: int, end_time_ms: int) -> Optional[List[Dict]]:
-        """Coleta métricas de ingestão via AQL para um intervalo exato."""
-        base_select = (
-            "SELECT logsourceid, "
-            "LOGSOURCENAME(logsourceid) as log_source_name, "
-            "LOGSOURCETYPENAME(devicetype) as log_source_type, "
-            "COUNT(*) as aggregated_event_count, "
-            "SUM(eventcount) as total_event_count, "
-            "SUM(STRLEN(UTF8(payload))) as total_payload_bytes, "
-            "AVG(STRLEN(UTF8(payload))) as avg_payload_bytes "
-        )
+    def iter_aql_query(self, aql: str, raise_on_reject: bool = False) -> Optional[Iterator[Dict]]:
+        """Executa uma query AQL e devolve um iterador lazy sobre os registros.
+
+        Busca e polling acontecem antes do retorno (None em falha e
+        ``raise_on_reject`` como em ``run_aql_query``); os resultados são
+        lidos página a página (``ARIEL_MAX_RESULTS``) conforme o iterador é
+        consumido. Com ijson instalado cada página é parseada direto do
+        socket, sem materializar o corpo JSON. Usado pelas métricas de
+        eventos (``_run_event_metrics_aql``). Erros durante a leitura
+        propagam para quem consome o iterador.
+        """
+        search_id = self._submit_and_wait(aql, raise_on_reject)
+        if search_id is None:
+            return None
+        key = "flows" if _FROM_FLOWS.search(aql) else "events"
+        return self._iter_aql_results(search_id, key)
 
-        where_clause = (
-            f"FROM events WHERE starttime >= {int(start_time_ms)} AND starttime < {int(end_time_ms)} "
-            "GROUP BY logsourceid, devicetype "
-            "ORDER BY total_event_count DESC"
+    def _iter_aql_results(self, search_id: str, key: str) -> Iterator[Dict]:
+        """Gera os registros de ``ariel/searches/<id>/results`` página a página."""
+        endpoint = f"ariel/searches/{search_id}/results"
+        page_size = AQL_RESULT_PAGE if ijson is None else ARIEL_MAX_RESULTS
+        offset = 0
+        while True:
+            count = 0
+            if ijson is None:
+                results = self._get_page(endpoint, offset, page_size)
+                for row in results.get("events", results.get("flows", [])) if results else ():
+                    count += 1
+                    yield row
+            else:
+                headers = {"Range": f"items={offset}-{offset + page_size - 1}"}
+                try:
+                    resp = self._get_stream(endpoint, extra_headers=headers)
+                except requests.exceptions.HTTPError as e:
+                    if e.response is not None and e.response.status_code == 416:
+                        return
+                    raise
+                try:
+                    for row in ijson.items(resp.raw, f"{key}.item", use_float=True):
+                        count += 1
+                        yield row
+                finally:
+                    resp.close()
+            if count < page_size:
+                return  # Última página — menos resultados que o limite
+            offset += page_size
+
+    def run_aql_queries(self, queries: List[str]) -> List[Optional[List[Dict]]]:
+        """Executa várias queries AQL concorrentemente; resultados na ordem de entrada.
+
+        Cada query segue o ciclo completo de ``run_aql_query`` (POST, polling,
+        resultados) em sua própria thread sobre a sessão com pool — os polls
+        de buscas diferentes se sobrepõem em vez de somar. Limitado a
+        ``AQL_MAX_PARALLEL`` buscas simultâneas para não saturar o Ariel.
+        """
+        if not queries:
+            return []
+        workers = min(AQL_MAX_PARALLEL, len(queries))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self.run_aql_query, queries))
+
+    @staticmethod
+    def _event_metrics_aql(start_time_ms: int, end_time_ms: int, with_unparsed: bool,
+                           bucket_ms: Optional[int] = None) -> str:
+        """Monta a AQL de métricas por log source; ``bucket_ms`` agrupa por sub-janela."""
+        template = _AQL_METRICS_TEMPLATES[(with_unparsed, bucket_ms is not None)]
+        return template.format(
+            s=int(start_time_ms), e=int(end_time_ms), bucket_ms=int(bucket_ms or 0),
+            last_clause=_last_clause(start_time_ms, end_time_ms),
         )
 
-        # Tentativa 1: incluir unparsed
-        aql_with_unparsed = (
-            base_select
-            + ", SUM(CASE WHEN isunparsed=1 THEN 1 ELSE 0 END) as unparsed_aggregated_events, "
-              "SUM(CASE WHEN isunparsed=1 THEN eventcount ELSE 0 END) as unparsed_total_events "
-            + where_clause
-        )
+    def _fetch_metrics_rows(self, aql: str, raise_on_reject: bool = False) -> Optional[List[Dict]]:
+        """Consome ``iter_aql_query`` numa lista de linhas (None em falha).
 
+        Só as linhas agregadas ficam em memória: com ijson o corpo de cada
+        página Ariel é parseado do socket em vez de bufferizado.
+        """
+        rows = self.iter_aql_query(aql, raise_on_reject)
+        if rows is None:
+            return None
         try:
-            data = self.run_aql_query(aql_with_unparsed)
-            if data is not None:
-                return data
-        except Exception as exc:
-            logger.debug(f"AQL com unparsed falhou; fallback. Motivo: {exc}")
+            return list(rows)
+        except Exception as e:
+            logger.error(f"Erro ao buscar resultados AQL: {e}")
+            return None
+
+    def _run_event_metrics_aql(self, start_time_ms: int, end_time_ms: int,
+                               bucket_ms: Optional[int] = None) -> Optional[List[Dict]]:
+        """Executa a AQL de métricas com unparsed e, se falhar, sem unparsed.
+
+        O veredito fica em ``self._supports_unparsed``: se o Ariel recusa a
+        variante com ``isunparsed`` (``AQLQueryRejected``) e a sem unparsed
+        funciona, as próximas janelas vão direto para a sem unparsed, sem
+        gastar uma busca Ariel que falha. Falhas transitórias (rede, timeout,
+        5xx) só acionam o fallback desta janela: o veredito continua None e a
+        próxima janela tenta unparsed de novo.
+        """
+        rejected = False
+        if self._supports_unparsed is not False:
+            # Tentativa 1: incluir unparsed
+            try:
+                data = self._fetch_metrics_rows(
+                    self._event_metrics_aql(start_time_ms, end_time_ms, True, bucket_ms),
+                    raise_on_reject=True,
+                )
+                if data is not None:
+                    self._supports_unparsed = True
+                    return self._resolve_log_source_names(data)
+            except AQLQueryRejected as exc:
+                rejected = True
+                logger.debug(f"AQL com unparsed recusada; fallback. Motivo: {exc}")
+            except Exception as exc:
+                logger.debug(f"AQL com unparsed falhou; fallback. Motivo: {exc}")
 
         # Fallback: sem unparsed
-        aql = base_select + where_clause
-        return self.run_aql_query(aql)
+        data = self._fetch_metrics_rows(
+            self._event_metrics_aql(start_time_ms, end_time_ms, False, bucket_ms)
+        )
+        if data is not None and rejected and self._supports_unparsed is None:
+            # O Ariel recusou só a variante com isunparsed
+            self._supports_unparsed = False
+            logger.info("AQL com isunparsed não suportada; coletando sem métricas de unparsed.")
+        return self._resolve_log_source_names(data) if data is not None else None
+
+    def _refresh_log_source_names(self) -> None:
+        """Re-pagina as log sources, no máximo uma vez por ``LOG_SOURCE_NAMES_REFRESH_SECONDS``."""
+        last = self._log_source_names_refreshed
+        if last is not None and time.monotonic() - last < LOG_SOURCE_NAMES_REFRESH_SECONDS:
+            return
+        try:
+            for _ in self.iter_log_sources():
+                pass
+        except Exception as e:
+            # Falha também conta para o intervalo: não insiste a cada janela
+            self._log_source_names_refreshed = time.monotonic()
+            logger.warning(f"Não foi possível carregar nomes de log sources: {e}")
+
+    def _refresh_log_source_types(self) -> Optional[Dict[int, str]]:
+        """Busca os tipos na API, no máximo uma vez por ``LOG_SOURCE_TYPES_REFRESH_SECONDS``.
+
+        Retorna None dentro do intervalo ou se a busca falhou (mapa vazio,
+        que ``get_log_source_types`` não cacheia).
+        """
+        last = self._log_source_types_refreshed
+        if last is not None and time.monotonic() - last < LOG_SOURCE_TYPES_REFRESH_SECONDS:
+            return None
+        # Falha também conta para o intervalo: não insiste a cada janela
+        self._log_source_types_refreshed = time.monotonic()
+        return self.get_log_source_types(force_refresh=True) or None
+
+    def _resolve_log_source_names(self, rows: List[Dict]) -> List[Dict]:
+        """Preenche ``log_source_name``/``log_source_type`` a partir dos ids.
+
+        Usa os nomes do inventário e o mapa de tipos em cache. Se algum id
+        não tem nome (log source criada ou renomeada depois do inventário),
+        re-pagina as log sources (limitado por ``_refresh_log_source_names``);
+        tipos ausentes (cache vazio/expirado ou devicetype desconhecido) são
+        buscados de novo com o mesmo limite (``_refresh_log_source_types``).
+        Nome ou tipo ainda não resolvido fica None: o MetricsDB mantém o
+        valor real já gravado no dia em vez de sobrescrevê-lo com um
+        placeholder. Remove ``devicetype`` das linhas, mantendo o formato
+        unificado.
+        """
+        if not rows:
+            return rows
+        names = self._log_source_names
+        if any(int(row.get("logsourceid", 0) or 0) not in names for row in rows):
+            self._refresh_log_source_names()
+        type_ids = [int(row.pop("devicetype", 0) or 0) for row in rows]
+        types = self._cached_log_source_types()
+        if types is None or any(type_id not in types for type_id in type_ids):
+            types = self._refresh_log_source_types() or types or {}
+        for row, type_id in zip(rows, type_ids):
+            row["log_source_name"] = names.get(int(row.get("logsourceid", 0) or 0))
+            row["log_source_type"] = types.get(type_id)
+        return rows
+
+    def get_event_metrics_window(self, start_time_ms: int, end_time_ms: int) -> Optional[List[Dict]]:
+        """Coleta métricas de ingestão via AQL para um intervalo exato."""
+        return self._run_event_metrics_aql(start_time_ms, end_time_ms)
+
+    def get_event_metrics_windows(
+        self, start_time_ms: int, end_time_ms: int, bucket_hours: float = 1,
+    ) -> Optional[List[Tuple[int, int, List[Dict]]]]:
+        """Coleta métricas de várias janelas contíguas com uma única busca Ariel.
+
+        Agrupa por ``bucket = (starttime - start) / bucket_ms`` além de
+        logsourceid/devicetype, pagando setup + polling do Ariel uma vez só
+        em vez de uma vez por janela (útil em backfill/catch-up longo).
+
+        Returns:
+            Lista ``(window_start_ms, window_end_ms, metrics)`` para cada
+            sub-janela em ordem — inclusive as vazias, para o zero-fill —,
+            ou None em caso de erro. A última sub-janela é truncada em
+            ``end_time_ms``.
+        """
+        bucket_ms = int(bucket_hours * 3600 * 1000)
+        if bucket_ms <= 0:
+            raise ValueError("bucket_hours deve ser positivo")
+        rows = self._run_event_metrics_aql(start_time_ms, end_time_ms, bucket_ms)
+        if rows is None:
+            return None
+
+        by_bucket: Dict[int, List[Dict]] = {}
+        for row in rows:
+            bucket = int(row.pop("bucket", 0) or 0)
+            by_bucket.setdefault(bucket, []).append(row)
+
+        windows = []
+        for index, win_start in enumerate(range(int(start_time_ms), int(end_time_ms), bucket_ms)):
+            win_end = min(win_start + bucket_ms, int(end_time_ms))
+            windows.append((win_start, win_end, by_bucket.get(index, [])))
+        return windows
 
     def get_event_counts_by_logsource(self, start_time: int, end_time: int) -> Optional[List[Dict]]:
         """[DEPRECATED] Use get_event_metrics_window()."""
-        aql = (
-            f"SELECT logsourceid, "
-            f"LOGSOURCENAME(logsourceid) as log_source_name, "
-            f"LOGSOURCETYPENAME(devicetype) as log_source_type, "
-            f"SUM(eventcount) as total_event_count, "
-            f"COUNT(*) as aggregated_event_count, "
-            f"SUM(STRLEN(UTF8(payload))) as total_payload_bytes, "
-            f"AVG(STRLEN(UTF8(payload))) as avg_payload_bytes, "
-            f"MIN(STRLEN(UTF8(payload))) as min_payload_bytes, "
-            f"MAX(STRLEN(UTF8(payload))) as max_payload_bytes "
-            f"FROM events "
-            f"WHERE starttime >= {start_time} AND starttime < {end_time} "
-            f"GROUP BY logsourceid, devicetype "
-            f"ORDER BY total_event_count DESC"
-        )
-        return self.run_aql_query(aql)
+        return self.run_aql_query(_AQL_LEGACY_COUNTS.format(
+            s=int(start_time), e=int(end_time),
+            last_clause=_last_clause(start_time, end_time),
+        ))
 
     def get_event_counts_last_n_hours(self, hours: int = 1) -> Optional[List[Dict]]:
         """Compat: baseada em janela exata."""
-        end_ms = int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000)
-        start_ms = int((datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours)).timestamp() * 1000)
-        return self.get_event_metrics_window(start_ms, end_ms)
+        now_ms = int(time.time() * 1000)
+        start_ms = now_ms - int(hours * 3600 * 1000)
+        return self.get_event_metrics_window(start_ms, now_ms)
 
     def get_flow_counts_by_logsource(self, hours: int = 1) -> Optional[List[Dict]]:
-        """Busca contagem de flows por log source."""
-        time_clause = f"LAST {hours} HOURS" if hours <= 24 else f"LAST {hours // 24} DAYS"
-        aql = (
-            f"SELECT sourceip, "
-            f"COUNT(*) as flow_count, "
-            f"SUM(sourcebytes + destinationbytes) as total_bytes "
-            f"FROM flows "
-            f"GROUP BY sourceip "
-            f"ORDER BY flow_count DESC "
-            f"{time_clause}"
-        )
-        return self.run_aql_query(aql)
+        """Busca contagem de flows por IP de origem nas últimas N horas.
+
+        A janela vai no WHERE com epochs explícitos (como nas queries de
+        eventos), em vez de um ``LAST`` após o ORDER BY — que o Ariel rejeita
+        e que truncava horas > 24 para dias inteiros.
+        """
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - int(hours * 3600 * 1000)
+        return self.run_aql_query(_AQL_FLOW_COUNTS.format(s=start_ms, e=end_ms))
 
 
 # ─── Inventory ───────────────────────────────────────────────────────────────
+def _unified_log_source(ls: Dict, type_name_of) -> Dict:
+    """Converte uma log source da API para o formato unificado do inventário."""
+    get = ls.get
+    type_id = get("type_id", 0)
+    return {
+        "logsource_id": get("id", 0),
+        "name": get("name", "Unknown"),
+        "type_name": type_name_of(type_id),
+        "type_id": type_id,
+        "enabled": get("enabled", False),
+        "description": get("description", ""),
+    }
+
+
 def collect_inventory(client: QRadarClient, db: MetricsDB) -> int:
     """Coleta inventário de log sources do QRadar."""
     logger.info("Coletando inventário de log sources...")
     try:
-        log_sources = client.get_log_sources()
-        type_map = client.get_log_source_types()
-        # Transformar para formato unificado
-        unified = []
-        for ls in log_sources:
-            type_id = ls.get("type_id", 0)
-            unified.append({
-                "logsource_id": ls.get("id", 0),
-                "name": ls.get("name", "Unknown"),
-                "type_name": type_map.get(type_id, f"Type-{type_id}"),
-                "type_id": type_id,
-                "enabled": ls.get("enabled", False),
-                "description": ls.get("description", ""),
-            })
-        db.save_log_sources_inventory(unified)
-        return len(unified)
+        sources = client.iter_log_sources()
+        type_map = client._cached_log_source_types(db)
+        if type_map is None:
+            # Cache expirado: pagina os tipos em background enquanto esta
+            # thread busca a primeira página de log sources. O MetricsDB só
+            # é tocado nesta thread (conexão SQLite não é compartilhada).
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                types_future = executor.submit(client._fetch_log_source_types)
+                first = next(sources, None)
+                type_map = types_future.result()
+            client._store_log_source_types(type_map, db)
+            sources = itertools.chain([first], sources) if first is not None else iter(())
+        # Transformar para formato unificado página a página: nem a lista
+        # bruta nem a unificada ficam inteiras em memória. Cada lote é lido
+        # (rede) antes da sua transação, sem segurar o lock de escrita
+        type_name_of = type_map.__getitem__  # _TypeMap: desconhecido → "Type-<id>"
+        unified = (_unified_log_source(ls, type_name_of) for ls in sources)
+        return db.save_log_sources_inventory_iter(unified)
     except Exception as e:
         logger.error(f"Erro ao coletar inventário: {e}")
         return 0
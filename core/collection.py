@@ -25,10 +25,25 @@ from core.utils import (
     MAX_CATCHUP_WINDOWS,
     ErrorCounter,
     is_stopped,
+    wait_for_stop,
 )
 
 logger = logging.getLogger("siem_collector")
 
+_MS_PER_DAY = 86_400_000
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _collection_date(window_start_ms: int, window_end_ms: int) -> str:
+    """Dia UTC (YYYY-MM-DD) ao qual a janela ``[start, end)`` pertence.
+
+    Usa o último milissegundo da janela (``end - 1``): uma janela que termina
+    exatamente à meia-noite conta para o dia anterior. Aritmética inteira de
+    dias desde a epoch — sem datetime com tzinfo nem strftime.
+    """
+    last_ms = max(window_end_ms - 1, window_start_ms)
+    return datetime.date.fromordinal(_EPOCH_ORDINAL + last_ms // _MS_PER_DAY).isoformat()
+
 
 def run_collection_cycle(
     client: Any,
@@ -57,10 +72,7 @@ def run_collection_cycle(
     """
     now = datetime.datetime.now(datetime.timezone.utc)
     collection_time = now.isoformat()
-    window_end_dt = datetime.datetime.fromtimestamp(
-        (max(window_end_ms - 1, window_start_ms) / 1000.0), tz=datetime.timezone.utc
-    )
-    collection_date = window_end_dt.strftime("%Y-%m-%d")
+    collection_date = _collection_date(window_start_ms, window_end_ms)
     window_seconds = max(0.0, (window_end_ms - window_start_ms) / 1000.0)
 
     logger.info(
@@ -68,44 +80,49 @@ def run_collection_cycle(
         f"janela: {window_seconds:.1f}s ({window_start_ms} -> {window_end_ms})"
     )
 
-    run_id = db.save_collection_run(collection_time, collection_date, float(interval_hours))
-
     try:
         metrics = client.get_event_metrics_window(window_start_ms, window_end_ms)
     except Exception as exc:
         if error_counter:
             error_counter.inc(f"{siem_name}_query_failed")
         logger.error(f"Falha ao coletar métricas: {exc}")
-        db.update_collection_run_status(run_id, "failed")
+        with db.bulk_tx():
+            run_id = db.save_collection_run(collection_time, collection_date, float(interval_hours))
+            db.update_collection_run_status(run_id, "failed")
         return -1  # Sinaliza falha; caller NÃO deve avançar last_window_end_ms
 
     seen_ids: set = set()
     ds_count = 0
 
-    if metrics:
-        db.save_event_metrics(
+    # Run, métricas, callback e zero-fill numa só transação: um commit por
+    # janela (inclusive as de catch-up, até MAX_CATCHUP_WINDOWS intervalos) e,
+    # se algo falhar no meio, nada da janela fica gravado pela metade
+    with db.bulk_tx():
+        run_id = db.save_collection_run(collection_time, collection_date, float(interval_hours))
+
+        if metrics:
+            seen_ids = db.save_event_metrics(
+                run_id, collection_time, collection_date,
+                int(window_start_ms), int(window_end_ms), float(window_seconds),
+                metrics, float(interval_hours),
+            )
+            ds_count = len(metrics)
+            logger.info(f"Coleta #{run_id} concluída: {ds_count} data sources com dados.")
+
+            # Callback pós-coleta (ex: Splunk atualiza inventário a partir dos resultados SPL)
+            if post_collect_callback:
+                post_collect_callback(db, metrics)
+        else:
+            logger.warning(f"Coleta #{run_id} sem resultados (janela vazia ou fontes silenciosas).")
+            if error_counter:
+                error_counter.inc(f"{siem_name}_no_results")
+
+        # Zero-fill: garante que log sources inativos contam como "observados com 0"
+        zero_filled = db.fill_zero_event_rows(
             run_id, collection_time, collection_date,
             int(window_start_ms), int(window_end_ms), float(window_seconds),
-            metrics, float(interval_hours),
+            seen_ids, float(interval_hours),
         )
-        seen_ids = {int(m.get("logsourceid", 0)) for m in metrics}
-        ds_count = len(metrics)
-        logger.info(f"Coleta #{run_id} concluída: {ds_count} data sources com dados.")
-
-        # Callback pós-coleta (ex: Splunk atualiza inventário a partir dos resultados SPL)
-        if post_collect_callback:
-            post_collect_callback(db, metrics)
-    else:
-        logger.warning(f"Coleta #{run_id} sem resultados (janela vazia ou fontes silenciosas).")
-        if error_counter:
-            error_counter.inc(f"{siem_name}_no_results")
-
-    # Zero-fill: garante que log sources inativos contam como "observados com 0"
-    zero_filled = db.fill_zero_event_rows(
-        run_id, collection_time, collection_date,
-        int(window_start_ms), int(window_end_ms), float(window_seconds),
-        seen_ids, float(interval_hours),
-    )
     if zero_filled > 0:
         logger.debug(f"Zero-fill: {zero_filled} sources sem eventos nesta janela.")
 
@@ -235,9 +252,7 @@ def main_collection_loop(
         sleep_seconds = max(0.0, next_run_monotonic - time.monotonic())
         if sleep_seconds > 0:
             logger.info(f"Próxima coleta em ~{sleep_seconds/3600.0:.2f}h. Aguardando...")
-            wait_start = time.monotonic()
-            while (time.monotonic() - wait_start) < sleep_seconds and not is_stopped():
-                time.sleep(min(30.0, sleep_seconds))
+            wait_for_stop(sleep_seconds)
 
     # ── Gerar relatório final ────────────────────────────────────────────
     logger.info("\n")
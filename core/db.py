@@ -8,22 +8,141 @@ Schema é idêntico para todos os SIEMs, garantindo compatibilidade
 cruzada de relatórios e queries.
 """
 
+import contextlib
 import datetime
+import itertools
 import logging
 import sqlite3
-from typing import Dict, List
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 logger = logging.getLogger("siem_collector")
 
+# Aplicados a cada conexão: WAL transforma commits em appends sequenciais e
+# permite ler (relatórios) enquanto o coletor escreve; synchronous=NORMAL é
+# seguro em WAL (perde no máximo o último commit numa queda de energia)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",  # 64 MB
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA busy_timeout=5000",
+)
+# Statements preparados mantidos por conexão (default do sqlite3: 128); os
+# INSERTs abaixo são constantes de módulo, então cada executemany reaproveita
+# o plano já compilado em vez de reparsear o SQL
+SQLITE_CACHED_STATEMENTS = 256
+
+_EVENT_METRICS_COLUMNS = """(run_id, collection_time, collection_date,
+                    window_start_ms, window_end_ms, window_seconds,
+                    logsource_id, logsource_name, logsource_type,
+                    event_count, aggregated_event_count, total_event_count,
+                    unparsed_aggregated_events, unparsed_total_events,
+                    total_payload_bytes, avg_payload_bytes, interval_hours)"""
+_EVENT_METRICS_INSERT = f"""INSERT INTO event_metrics
+                   {_EVENT_METRICS_COLUMNS}
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+_INVENTORY_UPSERT = """INSERT OR REPLACE INTO log_sources_inventory
+                   (logsource_id, name, type_name, type_id, enabled, description, last_updated)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)"""
+_LOG_SOURCE_TYPES_INSERT = (
+    "INSERT INTO log_source_types (type_id, name, last_updated) VALUES (?, ?, ?)"
+)
+# Roll-up diário por (collection_date, logsource_id), somado a cada escrita
+# em event_metrics e a cada zero-fill: os relatórios leem dias × fontes em
+# vez de todas as janelas. Nome/tipo seguem o MAX() do agrupamento original;
+# nome/tipo NULL (id ainda não resolvido no client) nunca substitui um valor
+# já gravado — os relatórios mostram ``LogSource-<id>``/``Unknown`` só se o dia
+# inteiro ficou sem nome/tipo.
+_DAILY_STATS_UPSERT = """INSERT INTO daily_stats
+                   (collection_date, logsource_id, logsource_name, logsource_type,
+                    total_events, aggregated_events,
+                    unparsed_total_events, unparsed_aggregated_events,
+                    total_bytes, collection_count, covered_seconds)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(collection_date, logsource_id) DO UPDATE SET
+                    logsource_name = COALESCE(MAX(logsource_name, excluded.logsource_name),
+                                              logsource_name, excluded.logsource_name),
+                    logsource_type = COALESCE(MAX(logsource_type, excluded.logsource_type),
+                                              logsource_type, excluded.logsource_type),
+                    total_events = total_events + excluded.total_events,
+                    aggregated_events = aggregated_events + excluded.aggregated_events,
+                    unparsed_total_events = unparsed_total_events + excluded.unparsed_total_events,
+                    unparsed_aggregated_events = unparsed_aggregated_events
+                                                 + excluded.unparsed_aggregated_events,
+                    total_bytes = total_bytes + excluded.total_bytes,
+                    collection_count = collection_count + excluded.collection_count,
+                    covered_seconds = covered_seconds + excluded.covered_seconds"""
+_DAILY_STATS_REBUILD = """INSERT INTO daily_stats
+                   SELECT collection_date, logsource_id,
+                          MAX(logsource_name), MAX(logsource_type),
+                          SUM(total_event_count), SUM(aggregated_event_count),
+                          SUM(unparsed_total_events), SUM(unparsed_aggregated_events),
+                          SUM(total_payload_bytes), COUNT(DISTINCT collection_time),
+                          SUM(window_seconds)
+                   FROM event_metrics
+                   GROUP BY collection_date, logsource_id"""
+
+
+class ReportRow(sqlite3.Row):
+    """Linha de consulta de relatório: acesso por coluna em C, com ``get()`` como dict."""
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except IndexError:
+            return default
+
 
 class MetricsDB:
     """Armazena métricas coletadas em SQLite local."""
 
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        # Uma conexão por thread (sqlite3 recusa uso cruzado entre threads);
+        # todas ficam registradas para o close() fechar
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # ":memory:" compartilha uma conexão entre threads (ver conn), mas o
+        # estado de bulk_tx() é por thread: as transações são serializadas para
+        # um tx() de outra thread não fazer commit no meio de um bulk_tx().
+        # RLock porque tx() é chamado dentro de bulk_tx() na mesma thread.
+        self._tx_lock: Optional[threading.RLock] = (
+            threading.RLock() if db_path == ":memory:" else None
+        )
+        # Inventário habilitado (id → (nome, tipo)) usado no zero-fill de cada
+        # ciclo; carregado sob demanda e invalidado a cada gravação de inventário
+        self._inventory_cache: Optional[Dict[int, Tuple[str, str]]] = None
         self._create_tables()
 
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: autocommit; lotes usam tx(). check_same_thread
+        # desligado só para o close() poder fechar conexões de outras threads
+        conn = sqlite3.connect(
+            self.db_path, isolation_level=None, check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Conexão da thread atual (aberta sob demanda, com os PRAGMAs aplicados)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._connections_lock:
+                if self.db_path == ":memory:" and self._connections:
+                    # ":memory:" é um banco por conexão: as threads compartilham a primeira
+                    conn = self._connections[0]
+                else:
+                    conn = self._connect()
+                    self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
     def _create_tables(self):
         cursor = self.conn.cursor()
         cursor.execute("""
@@ -70,22 +189,62 @@ class MetricsDB:
                 PRIMARY KEY (logsource_id)
             )
         """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS log_source_types (
+                type_id INTEGER PRIMARY KEY,
+                name TEXT,
+                last_updated TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                collection_date TEXT NOT NULL,
+                logsource_id INTEGER NOT NULL,
+                logsource_name TEXT,
+                logsource_type TEXT,
+                total_events INTEGER DEFAULT 0,
+                aggregated_events INTEGER DEFAULT 0,
+                unparsed_total_events INTEGER DEFAULT 0,
+                unparsed_aggregated_events INTEGER DEFAULT 0,
+                total_bytes REAL DEFAULT 0,
+                collection_count INTEGER DEFAULT 0,
+                covered_seconds REAL DEFAULT 0,
+                PRIMARY KEY (collection_date, logsource_id)
+            )
+        """)
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_event_metrics_date 
             ON event_metrics(collection_date)
         """)
+        # Casa com o GROUP BY collection_date, logsource_id do recálculo de
+        # daily_stats: agregação em ordem de índice, sem B-tree temporária
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_event_metrics_daily
+            ON event_metrics(collection_date, logsource_id)
+        """)
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_event_metrics_logsource 
             ON event_metrics(logsource_name)
         """)
+        # get_collection_dates: DISTINCT/ORDER BY direto do índice
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_collection_runs_date
+            ON collection_runs(collection_date)
+        """)
         self._ensure_event_metrics_schema(cursor)
+        # Bases anteriores ao roll-up: popula daily_stats a partir do histórico
+        cursor.execute(
+            "SELECT EXISTS(SELECT 1 FROM event_metrics) AND NOT EXISTS(SELECT 1 FROM daily_stats)"
+        )
+        if cursor.fetchone()[0]:
+            self.rebuild_daily_stats()
         self.conn.commit()
 
     def _ensure_event_metrics_schema(self, cursor: sqlite3.Cursor) -> None:
         """Garante que colunas novas existam em bases antigas (migração leve via ALTER TABLE)."""
         try:
             cursor.execute("PRAGMA table_info(event_metrics)")
-            existing = {row[1] for row in cursor.fetchall()}
+            existing = {row[1] for row in cursor}
         except Exception:
             return
 
@@ -116,7 +275,6 @@ class MetricsDB:
             "INSERT INTO collection_runs (collection_time, collection_date, interval_hours) VALUES (?, ?, ?)",
             (collection_time, collection_date, interval_hours),
         )
-        self.conn.commit()
         row_id = cursor.lastrowid
         assert row_id is not None, "INSERT falhou: lastrowid é None"
         return row_id
@@ -132,7 +290,114 @@ class MetricsDB:
             "UPDATE collection_runs SET status = ? WHERE run_id = ?",
             (status, run_id),
         )
-        self.conn.commit()
+
+    @contextlib.contextmanager
+    def tx(self) -> Iterator[sqlite3.Connection]:
+        """Agrupa um lote de escritas numa única transação (BEGIN IMMEDIATE → COMMIT).
+
+        Entrega a conexão da thread atual. IMMEDIATE reserva o lock de escrita
+        logo no início, em vez de na primeira escrita; qualquer exceção faz
+        ROLLBACK do lote inteiro. Dentro de ``bulk_tx()`` só entrega a conexão:
+        o commit fica para o bloco externo. Em ":memory:" espera a transação
+        de outra thread terminar (``_tx_lock``).
+        """
+        with self._tx_lock or contextlib.nullcontext():
+            conn = self.conn
+            if getattr(self._local, "bulk", False):
+                yield conn
+                return
+            if conn.in_transaction:
+                # Transação implícita já aberta: apenas commit/rollback ao final
+                with conn:
+                    yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @contextlib.contextmanager
+    def bulk_tx(self) -> Iterator[sqlite3.Connection]:
+        """Uma única transação para várias escritas (ex.: o ciclo de coleta inteiro).
+
+        Os ``tx()`` internos (save_*, zero-fill) não fazem commit próprio: tudo
+        entra num só BEGIN IMMEDIATE → COMMIT — janelas de catch-up maiores não
+        pagam um commit/checkpoint do WAL por lote — e um erro desfaz o conjunto.
+        """
+        if getattr(self._local, "bulk", False):
+            yield self.conn
+            return
+        with self.tx() as conn:
+            self._local.bulk = True
+            try:
+                yield conn
+            except BaseException:
+                # O cache pode ter sido carregado com linhas que o ROLLBACK desfaz
+                self._inventory_cache = None
+                raise
+            finally:
+                self._local.bulk = False
+
+    @staticmethod
+    def _event_metrics_row(m: Dict, window: tuple, interval_hours: float) -> tuple:
+        """Converte uma métrica no formato unificado em tupla para o INSERT."""
+        aggregated = int(m.get("aggregated_event_count", m.get("event_count", 0)) or 0)
+        total = m.get("total_event_count", None)
+        total = int(total) if total is not None else aggregated
+
+        unparsed_agg = int(m.get("unparsed_aggregated_events", 0) or 0)
+        unparsed_total = m.get("unparsed_total_events", None)
+        unparsed_total = int(unparsed_total) if unparsed_total is not None else 0
+
+        return window + (
+            m.get("logsourceid", 0),
+            m.get("log_source_name", "Unknown"),
+            m.get("log_source_type", "Unknown"),
+            aggregated,
+            aggregated,
+            total,
+            unparsed_agg,
+            unparsed_total,
+            m.get("total_payload_bytes", 0) or 0,
+            m.get("avg_payload_bytes", 0) or 0,
+            interval_hours,
+        )
+
+    @staticmethod
+    def _daily_stats_rows(rows: List[tuple]) -> List[tuple]:
+        """Linhas de event_metrics (ordem de _EVENT_METRICS_INSERT) → upserts de daily_stats.
+
+        ``collection_count`` conta janelas distintas: a primeira linha de cada
+        fonte no lote soma 1, as demais (ex.: vários devicetypes) somam 0.
+        """
+        seen = set()
+        stats = []
+        for row in rows:
+            key = (row[2], row[6])
+            first = key not in seen
+            seen.add(key)
+            stats.append((
+                row[2], row[6], row[7], row[8],
+                row[11], row[10], row[13], row[12], row[14],
+                1 if first else 0, row[5],
+            ))
+        return stats
+
+    def rebuild_daily_stats(self) -> None:
+        """Recalcula daily_stats inteiro a partir de event_metrics.
+
+        Usado para popular o roll-up de bases antigas, cujo zero-fill gravava
+        linhas em event_metrics. A cobertura do zero-fill atual existe só em
+        daily_stats e não é reconstruída aqui.
+        """
+        with self.tx() as conn:
+            conn.execute("DELETE FROM daily_stats")
+            conn.execute(_DAILY_STATS_REBUILD)
+        # Carga em massa: atualiza as estatísticas do planner para os índices
+        self.conn.execute("PRAGMA optimize")
 
     def save_event_metrics(
         self,
@@ -144,48 +409,37 @@ class MetricsDB:
         window_seconds: float,
         metrics: List[Dict],
         interval_hours: float,
-    ):
-        cursor = self.conn.cursor()
+    ) -> Set[int]:
+        """Grava as métricas da janela e retorna os logsource_ids vistos (para o zero-fill)."""
+        # Colunas comuns a todas as linhas da janela, calculadas uma vez
+        window = (
+            run_id, collection_time, collection_date,
+            int(window_start_ms), int(window_end_ms), float(window_seconds),
+        )
+        interval_hours = float(interval_hours)
+        rows: List[tuple] = []
+        seen_ids: Set[int] = set()
         for m in metrics:
-            aggregated = int(m.get("aggregated_event_count", m.get("event_count", 0)) or 0)
-            total = m.get("total_event_count", None)
-            total = int(total) if total is not None else aggregated
-
-            unparsed_agg = int(m.get("unparsed_aggregated_events", 0) or 0)
-            unparsed_total = m.get("unparsed_total_events", None)
-            unparsed_total = int(unparsed_total) if unparsed_total is not None else 0
-
-            cursor.execute(
-                """INSERT INTO event_metrics 
-                   (run_id, collection_time, collection_date,
-                    window_start_ms, window_end_ms, window_seconds,
-                    logsource_id, logsource_name, logsource_type,
-                    event_count, aggregated_event_count, total_event_count,
-                    unparsed_aggregated_events, unparsed_total_events,
-                    total_payload_bytes, avg_payload_bytes, interval_hours)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    run_id,
-                    collection_time,
-                    collection_date,
-                    int(window_start_ms),
-                    int(window_end_ms),
-                    float(window_seconds),
-                    m.get("logsourceid", 0),
-                    m.get("log_source_name", "Unknown"),
-                    m.get("log_source_type", "Unknown"),
-                    aggregated,
-                    aggregated,
-                    total,
-                    unparsed_agg,
-                    unparsed_total,
-                    m.get("total_payload_bytes", 0) or 0,
-                    m.get("avg_payload_bytes", 0) or 0,
-                    float(interval_hours),
-                ),
-            )
-        self.conn.commit()
+            row = self._event_metrics_row(m, window, interval_hours)
+            rows.append(row)
+            seen_ids.add(int(row[6]))  # logsource_id
+        with self.tx() as conn:
+            conn.executemany(_EVENT_METRICS_INSERT, rows)
+            conn.executemany(_DAILY_STATS_UPSERT, self._daily_stats_rows(rows))
         logger.info(f"Salvos {len(metrics)} registros de métricas (run_id={run_id})")
+        return seen_ids
+
+    @staticmethod
+    def _inventory_row(src: Dict, now: str) -> tuple:
+        return (
+            src.get("logsource_id", 0),
+            src.get("name", "Unknown"),
+            src.get("type_name", "Unknown"),
+            src.get("type_id", 0),
+            1 if src.get("enabled", True) else 0,
+            src.get("description", ""),
+            now,
+        )
 
     def save_log_sources_inventory(self, sources: List[Dict]):
         """Salva inventário de log sources no formato unificado.
@@ -198,25 +452,85 @@ class MetricsDB:
         - enabled: bool (opcional, padrão True)
         - description: str (opcional, padrão "")
         """
-        cursor = self.conn.cursor()
         now = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        for src in sources:
-            cursor.execute(
-                """INSERT OR REPLACE INTO log_sources_inventory 
-                   (logsource_id, name, type_name, type_id, enabled, description, last_updated)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    src.get("logsource_id", 0),
-                    src.get("name", "Unknown"),
-                    src.get("type_name", "Unknown"),
-                    src.get("type_id", 0),
-                    1 if src.get("enabled", True) else 0,
-                    src.get("description", ""),
-                    now,
-                ),
+        # Dedup por logsource_id (última ocorrência vence, como no INSERT OR REPLACE)
+        unique = {src.get("logsource_id", 0): src for src in sources}
+        with self.tx() as conn:
+            conn.executemany(
+                _INVENTORY_UPSERT,
+                [self._inventory_row(src, now) for src in unique.values()],
             )
-        self.conn.commit()
-        logger.info(f"Inventário de {len(sources)} sources salvo.")
+        self._inventory_cache = None
+        logger.info(f"Inventário de {len(unique)} sources salvo.")
+
+    def save_log_sources_inventory_iter(self, sources: Iterable[Dict], batch_size: int = 1000) -> int:
+        """Como ``save_log_sources_inventory``, mas consome um iterável em lotes.
+
+        Só ``batch_size`` linhas ficam materializadas por vez — o chamador pode
+        passar um gerador que converte as sources sob demanda (ex.: páginas
+        buscadas na API). Cada lote é lido do iterável *antes* de abrir a
+        transação e gravado na sua própria transação: o lock de escrita do
+        SQLite não fica preso durante a rede. Se o iterável falhar no meio,
+        os lotes já gravados permanecem (upsert idempotente; o próximo
+        inventário completa) e a exceção propaga. Retorna o número de
+        registros gravados.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        rows = (self._inventory_row(src, now) for src in sources)
+        total = 0
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                with self.tx() as conn:
+                    conn.executemany(_INVENTORY_UPSERT, batch)
+                total += len(batch)
+        finally:
+            if total:
+                self._inventory_cache = None
+        logger.info(f"Inventário de {total} sources salvo.")
+        return total
+
+    def save_log_source_types(self, types_map: Dict[int, str]) -> None:
+        """Persiste o mapeamento type_id → nome (substitui o snapshot anterior)."""
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self.tx() as conn:
+            conn.execute("DELETE FROM log_source_types")
+            conn.executemany(
+                _LOG_SOURCE_TYPES_INSERT,
+                [(type_id, name, now) for type_id, name in types_map.items()],
+            )
+
+    def get_log_source_types(self, max_age_seconds: Optional[float] = None) -> Dict[int, str]:
+        """Retorna o mapeamento type_id → nome persistido.
+
+        Com ``max_age_seconds``, retorna ``{}`` se o snapshot for mais antigo
+        que o limite (o chamador deve buscar de novo na API).
+        """
+        cursor = self.conn.cursor()
+        if max_age_seconds is not None:
+            cursor.execute("SELECT MIN(last_updated) FROM log_source_types")
+            oldest = cursor.fetchone()[0]
+            if not oldest:
+                return {}
+            updated = datetime.datetime.fromisoformat(oldest)
+            age = datetime.datetime.now(datetime.timezone.utc) - updated
+            if age.total_seconds() > max_age_seconds:
+                return {}
+        cursor.execute("SELECT type_id, name FROM log_source_types")
+        return dict(cursor.fetchall())
+
+    def _enabled_inventory(self) -> Dict[int, Tuple[str, str]]:
+        """logsource_id → (name, type_name) das fontes habilitadas, em cache."""
+        if self._inventory_cache is None:
+            self._inventory_cache = {
+                ls_id: (ls_name or "Unknown", ls_type or "Unknown")
+                for ls_id, ls_name, ls_type in self.conn.execute(
+                    "SELECT logsource_id, name, type_name FROM log_sources_inventory WHERE enabled = 1"
+                )
+            }
+        return self._inventory_cache
 
     def fill_zero_event_rows(
         self,
@@ -229,132 +543,111 @@ class MetricsDB:
         seen_logsource_ids: set,
         interval_hours: float,
     ) -> int:
-        """Insere linhas com zero eventos para log sources do inventário ausentes na coleta.
+        """Registra janela observada com zero eventos para as fontes do inventário ausentes.
 
         Sem isso, 'covered_seconds' só conta janelas onde houve eventos,
         inflando projeções 24h para fontes intermitentes. Com o zero-fill,
         toda janela observada conta como cobertura — mesmo que sem dados —
         tornando a projeção diária matematicamente correta.
-        """
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT logsource_id, name, type_name FROM log_sources_inventory WHERE enabled = 1"
-        )
-        inventory = cursor.fetchall()
 
-        zero_count = 0
-        for ls_id, ls_name, ls_type in inventory:
-            if ls_id in seen_logsource_ids:
-                continue
-            cursor.execute(
-                """INSERT INTO event_metrics
-                   (run_id, collection_time, collection_date,
-                    window_start_ms, window_end_ms, window_seconds,
-                    logsource_id, logsource_name, logsource_type,
-                    event_count, aggregated_event_count, total_event_count,
-                    unparsed_aggregated_events, unparsed_total_events,
-                    total_payload_bytes, avg_payload_bytes, interval_hours)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, 0, 0, 0, 0, 0, ?)""",
-                (run_id, collection_time, collection_date,
-                 int(window_start_ms), int(window_end_ms), float(window_seconds),
-                 ls_id, ls_name or "Unknown", ls_type or "Unknown",
-                 float(interval_hours)),
-            )
-            zero_count += 1
+        A cobertura vai direto para o roll-up ``daily_stats`` (uma linha por
+        dia e fonte, atualizada no lugar); ``event_metrics`` guarda só as
+        janelas com dados, em vez de janelas × fontes silenciosas linhas de zero.
+        """
+        inventory = self._enabled_inventory()
+        window_seconds = float(window_seconds)
+        missing_ids = inventory.keys() - seen_logsource_ids
+        rows = [
+            (collection_date, ls_id, *inventory[ls_id], 0, 0, 0, 0, 0, 1, window_seconds)
+            for ls_id in missing_ids
+        ]
 
-        if zero_count > 0:
-            self.conn.commit()
-            logger.debug(f"Inseridas {zero_count} linhas zero-event para cobertura completa.")
-        return zero_count
+        if rows:
+            with self.tx() as conn:
+                conn.executemany(_DAILY_STATS_UPSERT, rows)
+            logger.debug(f"Zero-fill de {len(rows)} fontes para cobertura completa.")
+        return len(rows)
 
-    def get_daily_summary(self) -> List[Dict]:
+    def get_daily_summary(self) -> List[ReportRow]:
         """Retorna resumo diário por log source.
 
         Agrupa por logsource_id (não por nome) para evitar mistura quando
         fontes compartilham o mesmo nome ou são renomeadas durante a coleta.
+        Lê o roll-up ``daily_stats`` (uma linha por dia e fonte).
         """
         cursor = self.conn.cursor()
+        cursor.row_factory = ReportRow
         cursor.execute("""
             SELECT 
                 collection_date,
                 logsource_id,
-                MAX(logsource_name) as logsource_name,
-                MAX(logsource_type) as logsource_type,
-                SUM(total_event_count) as total_events,
-                SUM(aggregated_event_count) as aggregated_events,
-                SUM(unparsed_total_events) as unparsed_total_events,
-                SUM(unparsed_aggregated_events) as unparsed_aggregated_events,
-                SUM(total_payload_bytes) as total_bytes,
+                COALESCE(logsource_name, 'LogSource-' || logsource_id) as logsource_name,
+                COALESCE(logsource_type, 'Unknown') as logsource_type,
+                total_events,
+                aggregated_events,
+                unparsed_total_events,
+                unparsed_aggregated_events,
+                total_bytes,
                 CASE 
-                    WHEN SUM(total_event_count) > 0 THEN (SUM(total_payload_bytes) / SUM(total_event_count))
+                    WHEN total_events > 0 THEN (total_bytes / total_events)
                     ELSE 0
                 END as avg_event_size_bytes,
-                COUNT(DISTINCT collection_time) as collection_count,
-                SUM(window_seconds) as covered_seconds
-            FROM event_metrics
-            GROUP BY collection_date, logsource_id
+                collection_count,
+                covered_seconds,
+                covered_seconds / 86400.0 * 100.0 as coverage_pct,
+                total_bytes / 1048576.0 as total_mb,
+                total_bytes / 1073741824.0 as total_gb
+            FROM daily_stats
             ORDER BY collection_date, total_events DESC
         """)
-        columns = [desc[0] for desc in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return cursor.fetchall()
+
+    def get_daily_totals(self) -> Dict[str, Tuple[int, float]]:
+        """Retorna ``{collection_date: (total_eventos, total_bytes)}`` somando todas as fontes."""
+        cursor = self.conn.execute("""
+            SELECT collection_date, SUM(total_events), SUM(total_bytes)
+            FROM daily_stats
+            GROUP BY collection_date
+        """)
+        return {date: (events or 0, total_bytes or 0) for date, events, total_bytes in cursor}
 
-    def get_overall_daily_average(self) -> List[Dict]:
+    def get_overall_daily_average(self) -> List[ReportRow]:
         """Retorna média diária geral por log source (across all days).
 
         Projeta para 24h baseado no tempo efetivamente coberto.
         Agrupa por logsource_id (não por nome) para evitar mistura.
         """
         cursor = self.conn.cursor()
+        cursor.row_factory = ReportRow
         cursor.execute("""
             SELECT 
                 logsource_id,
-                MAX(logsource_name) as logsource_name,
-                MAX(logsource_type) as logsource_type,
-                COUNT(DISTINCT collection_date) as days_collected,
-
-                ROUND(AVG(projected_daily_events), 2) as avg_daily_events,
-                ROUND(AVG(projected_daily_bytes), 2) as avg_daily_bytes_total,
-                ROUND(AVG(projected_daily_bytes) / (1024.0 * 1024.0), 4) as avg_daily_mb,
-                ROUND(AVG(projected_daily_bytes) / (1024.0 * 1024.0 * 1024.0), 6) as avg_daily_gb,
-
-                ROUND(AVG(projected_daily_aggregated_events), 2) as avg_daily_aggregated_events,
-                ROUND(AVG(projected_daily_unparsed_events), 2) as avg_daily_unparsed_events,
-                ROUND(AVG(coverage_pct), 2) as avg_coverage_pct,
-
-                ROUND(AVG(avg_event_size_bytes), 2) as avg_event_size_bytes
-            FROM (
-                SELECT 
-                    collection_date,
-                    logsource_id,
-                    MAX(logsource_name) as logsource_name,
-                    MAX(logsource_type) as logsource_type,
-                    SUM(total_event_count) as daily_events,
-                    SUM(aggregated_event_count) as daily_aggregated_events,
-                    SUM(unparsed_total_events) as daily_unparsed_events,
-                    SUM(total_payload_bytes) as daily_bytes,
-                    CASE 
-                        WHEN SUM(total_event_count) > 0 THEN (SUM(total_payload_bytes) / SUM(total_event_count))
-                        ELSE 0
-                    END as avg_event_size_bytes,
-                    CASE WHEN SUM(window_seconds) > 0 THEN (SUM(window_seconds) / 86400.0) * 100.0 ELSE 0 END as coverage_pct,
-                    CASE WHEN SUM(window_seconds) > 0 THEN (SUM(total_event_count) * 86400.0 / SUM(window_seconds)) ELSE SUM(total_event_count) END as projected_daily_events,
-                    CASE WHEN SUM(window_seconds) > 0 THEN (SUM(aggregated_event_count) * 86400.0 / SUM(window_seconds)) ELSE SUM(aggregated_event_count) END as projected_daily_aggregated_events,
-                    CASE WHEN SUM(window_seconds) > 0 THEN (SUM(unparsed_total_events) * 86400.0 / SUM(window_seconds)) ELSE SUM(unparsed_total_events) END as projected_daily_unparsed_events,
-                    CASE WHEN SUM(window_seconds) > 0 THEN (SUM(total_payload_bytes) * 86400.0 / SUM(window_seconds)) ELSE SUM(total_payload_bytes) END as projected_daily_bytes
-                FROM event_metrics
-                GROUP BY collection_date, logsource_id
-            ) daily
+                COALESCE(MAX(logsource_name), 'LogSource-' || logsource_id) as logsource_name,
+                COALESCE(MAX(logsource_type), 'Unknown') as logsource_type,
+                COUNT(*) as days_collected,
+
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN total_events * 86400.0 / covered_seconds ELSE total_events END), 2) as avg_daily_events,
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN total_bytes * 86400.0 / covered_seconds ELSE total_bytes END), 2) as avg_daily_bytes_total,
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN total_bytes * 86400.0 / covered_seconds ELSE total_bytes END), 2) * 30 as avg_monthly_bytes,
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN total_bytes * 86400.0 / covered_seconds ELSE total_bytes END) / (1024.0 * 1024.0), 4) as avg_daily_mb,
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN total_bytes * 86400.0 / covered_seconds ELSE total_bytes END) / (1024.0 * 1024.0 * 1024.0), 6) as avg_daily_gb,
+
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN aggregated_events * 86400.0 / covered_seconds ELSE aggregated_events END), 2) as avg_daily_aggregated_events,
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN unparsed_total_events * 86400.0 / covered_seconds ELSE unparsed_total_events END), 2) as avg_daily_unparsed_events,
+                ROUND(AVG(CASE WHEN covered_seconds > 0 THEN (covered_seconds / 86400.0) * 100.0 ELSE 0 END), 2) as avg_coverage_pct,
+
+                ROUND(AVG(CASE WHEN total_events > 0 THEN (total_bytes / total_events) ELSE 0 END), 2) as avg_event_size_bytes
+            FROM daily_stats
             GROUP BY logsource_id
             ORDER BY avg_daily_bytes_total DESC
         """)
-        columns = [desc[0] for desc in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return cursor.fetchall()
 
     def get_collection_dates(self) -> List[str]:
         """Retorna lista de datas de coleta únicas."""
         cursor = self.conn.cursor()
         cursor.execute("SELECT DISTINCT collection_date FROM collection_runs ORDER BY collection_date")
-        return [row[0] for row in cursor.fetchall()]
+        return [row[0] for row in cursor]
 
     def get_total_runs(self) -> int:
         cursor = self.conn.cursor()
@@ -362,4 +655,13 @@ class MetricsDB:
         return cursor.fetchone()[0]
 
     def close(self):
-        self.conn.close()
+        # Atualiza estatísticas do planner (sqlite_stat1) só onde compensa
+        try:
+            self.conn.execute("PRAGMA optimize")
+        except sqlite3.Error as exc:
+            logger.debug(f"PRAGMA optimize falhou: {exc}")
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
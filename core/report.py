@@ -7,16 +7,29 @@ Parametrizado por SIEM para gerar relatórios com nomes e colunas
 apropriados (QRadar, Splunk, etc.).
 """
 
+import collections
 import csv
 import datetime
 import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, DefaultDict, Dict, List, Optional, Tuple
 
-from core.db import MetricsDB
+from core.db import MetricsDB, ReportRow
 
 logger = logging.getLogger("siem_collector")
 
+_BYTE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+# Buffer dos CSVs: o csv.writer (em C) despeja as linhas em blocos de 1 MiB
+# em vez de uma escrita a cada 8 KiB do buffer padrão
+_CSV_BUFFER_BYTES = 1 << 20
+
+# Layouts das linhas repetidas do relatório em texto (uma por fonte)
+_TEXT_DAILY_ROW = "│ {name:<35} │ {ltype:<20} │ {events:>12,} │ {total:>15} │ {avg:>12} │\n"
+_TEXT_SUMMARY_ROW = "│ {name:<30} │ {ltype:<18} │ {days:>4} │ {events:>15,.0f} │ {total:>15} │ {avg:>10} │\n"
+_TEXT_MONTHLY_ROW = "  {name:<40}  Diário: {daily:>12}  │  Mensal (30d): {monthly:>12}\n"
+
 
 class ReportGenerator:
     """Gera relatórios em CSV e texto a partir dos dados coletados."""
@@ -41,16 +54,43 @@ class ReportGenerator:
         self.type_label = type_label
         self.include_unparsed = include_unparsed
         self.include_aggregated = include_aggregated
+        # Resultados das consultas agregadas, válidos só durante um
+        # generate_all_reports() (o banco continua mudando entre relatórios)
+        self._query_cache: Optional[Dict[str, Any]] = None
+
+    def _cached_query(self, name: str, query: Callable[[], Any]) -> Any:
+        """Executa ``query`` uma vez por geração de relatórios; fora dela, sempre."""
+        if self._query_cache is None:
+            return query()
+        if name not in self._query_cache:
+            self._query_cache[name] = query()
+        return self._query_cache[name]
+
+    def _daily_summary(self) -> List[ReportRow]:
+        return self._cached_query("daily_summary", self.db.get_daily_summary)
+
+    def _overall_daily_average(self) -> List[ReportRow]:
+        return self._cached_query("overall_daily_average", self.db.get_overall_daily_average)
+
+    def _daily_totals(self) -> Dict[str, Tuple[int, float]]:
+        return self._cached_query("daily_totals", self.db.get_daily_totals)
+
+    def _collection_dates(self) -> List[str]:
+        return self._cached_query("collection_dates", self.db.get_collection_dates)
+
+    def _total_runs(self) -> int:
+        return self._cached_query("total_runs", self.db.get_total_runs)
 
     def _format_bytes(self, bytes_val: float) -> str:
         """Formata bytes em unidade legível."""
         if bytes_val is None or bytes_val == 0:
             return "0 B"
-        for unit in ["B", "KB", "MB", "GB", "TB"]:
-            if abs(bytes_val) < 1024.0:
-                return f"{bytes_val:.2f} {unit}"
-            bytes_val /= 1024.0
-        return f"{bytes_val:.2f} PB"
+        magnitude = abs(bytes_val)
+        # Índice da unidade direto pelo expoente (1024 = 2**10), sem laço de divisões
+        idx = min(max(int(math.log2(magnitude)) // 10, 0), len(_BYTE_UNITS) - 1)
+        if idx and magnitude < 1 << (idx * 10):  # arredondamento do log2 logo abaixo da fronteira
+            idx -= 1
+        return f"{bytes_val / (1 << (idx * 10)):.2f} {_BYTE_UNITS[idx]}"
 
     def generate_all_reports(self):
         """Gera todos os relatórios (CSV diário, CSV resumo, TXT completo)."""
@@ -59,18 +99,34 @@ class ReportGenerator:
         logger.info("GERANDO RELATÓRIOS FINAIS")
         logger.info("=" * 70)
 
-        self._generate_daily_csv(timestamp)
-        self._generate_summary_csv(timestamp)
-        self._generate_text_report(timestamp)
+        self._query_cache = {}
+        try:
+            # Todas as consultas rodam aqui, na thread chamadora; os três
+            # geradores só leem o cache, formatam e gravam o próprio arquivo
+            self._daily_summary()
+            self._overall_daily_average()
+            self._daily_totals()
+            self._collection_dates()
+            self._total_runs()
+            generators = (self._generate_daily_csv, self._generate_summary_csv,
+                          self._generate_text_report)
+            with ThreadPoolExecutor(max_workers=len(generators),
+                                    thread_name_prefix="report") as pool:
+                futures = [pool.submit(generate, timestamp) for generate in generators]
+                for future in futures:
+                    future.result()  # propaga a exceção do gerador que falhou
+        finally:
+            self._query_cache = None
 
         logger.info(f"Relatórios salvos em: {self.report_dir.absolute()}")
 
     def _generate_daily_csv(self, timestamp: str):
         """Gera CSV com detalhamento diário."""
         filepath = self.report_dir / f"{self.siem_name}_daily_report_{timestamp}.csv"
-        daily_data = self.db.get_daily_summary()
+        daily_data = self._daily_summary()
 
-        with open(filepath, "w", newline="", encoding="utf-8-sig") as f:
+        with open(filepath, "w", newline="", encoding="utf-8-sig",
+                  buffering=_CSV_BUFFER_BYTES) as f:
             writer = csv.writer(f, delimiter=";")
 
             # Header
@@ -87,47 +143,52 @@ class ReportGenerator:
             ])
             writer.writerow(headers)
 
-            for row in daily_data:
-                total_bytes = row.get("total_bytes", 0) or 0
-                values = [
-                    row["collection_date"],
-                    row.get("logsource_id", ""),
-                    row["logsource_name"],
-                    row["logsource_type"],
-                    int(row.get("total_events", 0) or 0),
-                ]
-                if self.include_aggregated:
-                    agg = int(row.get("aggregated_events", 0) or 0)
-                    values.append(agg)
-                    # Coalescing ratio: quantos eventos reais cada registro Ariel representa
-                    total_ev = int(row.get("total_events", 0) or 0)
-                    ratio = f"{total_ev / agg:.2f}" if agg > 0 else "N/A"
-                    values.append(ratio)
-                if self.include_unparsed:
-                    values.append(int(row.get("unparsed_total_events", 0) or 0))
-                    values.append("{:.2f}".format(
-                        (float(row.get('unparsed_total_events', 0) or 0) /
-                         float(row.get('total_events', 1) or 1)) * 100.0
-                    ))
-                values.extend([
-                    float(row.get("covered_seconds", 0) or 0),
-                    "{:.2f}".format((float(row.get('covered_seconds', 0) or 0) / 86400.0) * 100.0),
-                    f"{total_bytes:.0f}",
-                    f"{total_bytes / (1024 * 1024):.4f}",
-                    f"{total_bytes / (1024 * 1024 * 1024):.6f}",
-                    f"{row.get('avg_event_size_bytes', 0):.2f}",
-                    row["collection_count"],
-                ])
-                writer.writerow(values)
+            writer.writerows(map(self._daily_csv_row, daily_data))
 
         logger.info(f"Relatório diário CSV: {filepath}")
 
+    def _daily_csv_row(self, row: ReportRow) -> List:
+        """Linha do CSV diário; cada campo é lido e convertido uma única vez."""
+        get = row.get
+        total_events = int(get("total_events", 0) or 0)
+        total_bytes = get("total_bytes", 0) or 0
+        covered = float(get("covered_seconds", 0) or 0)
+        values = [
+            row["collection_date"],
+            get("logsource_id", ""),
+            row["logsource_name"],
+            row["logsource_type"],
+            total_events,
+        ]
+        if self.include_aggregated:
+            agg = int(get("aggregated_events", 0) or 0)
+            # Coalescing ratio: quantos eventos reais cada registro Ariel representa
+            values.append(agg)
+            values.append(f"{total_events / agg:.2f}" if agg > 0 else "N/A")
+        if self.include_unparsed:
+            unparsed = get("unparsed_total_events", 0) or 0
+            values.append(int(unparsed))
+            values.append("{:.2f}".format(
+                (float(unparsed) / float(get("total_events", 1) or 1)) * 100.0
+            ))
+        values.extend([
+            covered,
+            f"{get('coverage_pct') or 0.0:.2f}",
+            f"{total_bytes:.0f}",
+            f"{get('total_mb') or 0.0:.4f}",
+            f"{get('total_gb') or 0.0:.6f}",
+            f"{get('avg_event_size_bytes', 0):.2f}",
+            row["collection_count"],
+        ])
+        return values
+
     def _generate_summary_csv(self, timestamp: str):
         """Gera CSV com resumo de médias por data source."""
         filepath = self.report_dir / f"{self.siem_name}_summary_report_{timestamp}.csv"
-        summary = self.db.get_overall_daily_average()
+        summary = self._overall_daily_average()
 
-        with open(filepath, "w", newline="", encoding="utf-8-sig") as f:
+        with open(filepath, "w", newline="", encoding="utf-8-sig",
+                  buffering=_CSV_BUFFER_BYTES) as f:
             writer = csv.writer(f, delimiter=";")
 
             headers = ["Source ID", self.source_label, self.type_label, "Dias Coletados",
@@ -145,160 +206,181 @@ class ReportGenerator:
             ])
             writer.writerow(headers)
 
-            for row in summary:
-                values = [
-                    row.get("logsource_id", ""),
-                    row["logsource_name"],
-                    row["logsource_type"],
-                    row["days_collected"],
-                    f"{row['avg_daily_events']:.0f}",
-                ]
-                if self.include_aggregated:
-                    avg_agg = float(row.get('avg_daily_aggregated_events', 0) or 0)
-                    values.append(f"{avg_agg:.0f}")
-                    # Coalescing ratio médio
-                    avg_ev = float(row.get('avg_daily_events', 0) or 0)
-                    ratio = f"{avg_ev / avg_agg:.2f}" if avg_agg > 0 else "N/A"
-                    values.append(ratio)
-                if self.include_unparsed:
-                    values.append(f"{row.get('avg_daily_unparsed_events', 0):.0f}")
-                values.extend([
-                    f"{row.get('avg_coverage_pct', 0):.2f}",
-                    f"{row['avg_daily_bytes_total']:.0f}",
-                    f"{row['avg_daily_mb']:.4f}",
-                    f"{row['avg_daily_gb']:.6f}",
-                    f"{row['avg_event_size_bytes']:.2f}",
-                ])
-                writer.writerow(values)
+            writer.writerows(map(self._summary_csv_row, summary))
 
         logger.info(f"Relatório resumo CSV: {filepath}")
 
+    def _summary_csv_row(self, row: ReportRow) -> List:
+        """Linha do CSV resumo (médias projetadas para 24h)."""
+        get = row.get
+        values = [
+            get("logsource_id", ""),
+            row["logsource_name"],
+            row["logsource_type"],
+            row["days_collected"],
+            f"{row['avg_daily_events']:.0f}",
+        ]
+        if self.include_aggregated:
+            avg_agg = float(get("avg_daily_aggregated_events", 0) or 0)
+            values.append(f"{avg_agg:.0f}")
+            # Coalescing ratio médio
+            avg_ev = float(get("avg_daily_events", 0) or 0)
+            values.append(f"{avg_ev / avg_agg:.2f}" if avg_agg > 0 else "N/A")
+        if self.include_unparsed:
+            values.append(f"{get('avg_daily_unparsed_events', 0):.0f}")
+        values.extend([
+            f"{get('avg_coverage_pct', 0):.2f}",
+            f"{row['avg_daily_bytes_total']:.0f}",
+            f"{row['avg_daily_mb']:.4f}",
+            f"{row['avg_daily_gb']:.6f}",
+            f"{row['avg_event_size_bytes']:.2f}",
+        ])
+        return values
+
     def _generate_text_report(self, timestamp: str):
         """Gera relatório em texto formatado."""
         filepath = self.report_dir / f"{self.siem_name}_full_report_{timestamp}.txt"
-        dates = self.db.get_collection_dates()
-        daily_data = self.db.get_daily_summary()
-        summary = self.db.get_overall_daily_average()
-        total_runs = self.db.get_total_runs()
-
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write("=" * 100 + "\n")
-            f.write(f"  RELATÓRIO DE INGESTÃO DE LOGS - {self.siem_display_name}\n")
-            f.write(f"  Gerado em: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 100 + "\n\n")
-
-            f.write("─" * 100 + "\n")
-            f.write("  INFORMAÇÕES DA COLETA\n")
-            f.write("─" * 100 + "\n")
-            f.write(f"  Período de coleta: {dates[0] if dates else 'N/A'} a {dates[-1] if dates else 'N/A'}\n")
-            f.write(f"  Total de dias coletados: {len(dates)}\n")
-            f.write(f"  Total de execuções de coleta: {total_runs}\n")
-            f.write(f"  Total de data sources identificados: {len(summary)}\n\n")
-
-            # ── Detalhamento diário ──────────────────────────────────────
-            f.write("=" * 100 + "\n")
-            f.write("  DETALHAMENTO DIÁRIO POR DATA SOURCE\n")
-            f.write("=" * 100 + "\n\n")
-
-            for date in dates:
-                date_data = [d for d in daily_data if d["collection_date"] == date]
-                total_events_day = sum(d.get("total_events", 0) for d in date_data)
-                total_bytes_day = sum(d.get("total_bytes", 0) or 0 for d in date_data)
-
-                f.write(f"┌{'─' * 98}┐\n")
-                f.write(f"│  DATA: {date:<89}│\n")
-                f.write(f"│  Total de Eventos: {total_events_day:>15,}  │  "
-                        f"Volume Total: {self._format_bytes(total_bytes_day):>15}  │\n")
-                f.write(f"├{'─' * 98}┤\n")
-                f.write(f"│ {self.source_label:<35} │ {self.type_label:<20} │ {'Eventos':>12} │ "
-                        f"{'Volume Total':>15} │ {'Avg/Evento':>12} │\n")
-                f.write(f"├{'─' * 98}┤\n")
-
-                for d in date_data:
-                    name = (d["logsource_name"] or "Unknown")[:35]
-                    ltype = (d["logsource_type"] or "Unknown")[:20]
-                    events = d.get("total_events", 0)
-                    total_b = d.get("total_bytes", 0) or 0
-                    avg_b = d.get("avg_event_size_bytes", 0) or 0
-                    f.write(f"│ {name:<35} │ {ltype:<20} │ {events:>12,} │ "
-                            f"{self._format_bytes(total_b):>15} │ {self._format_bytes(avg_b):>12} │\n")
-
-                f.write(f"└{'─' * 98}┘\n\n")
-
-            # ── Resumo Geral ─────────────────────────────────────────────
-            f.write("=" * 100 + "\n")
-            f.write("  RESUMO - MÉDIA DIÁRIA DE INGESTÃO POR DATA SOURCE\n")
-            f.write("=" * 100 + "\n\n")
-
-            f.write(f"┌{'─' * 98}┐\n")
-            f.write(f"│ {self.source_label:<30} │ {self.type_label:<18} │ {'Dias':>4} │ "
-                    f"{'Avg Eventos/Dia':>15} │ {'Avg Volume/Dia':>15} │ {'Avg/Evento':>10} │\n")
-            f.write(f"├{'─' * 98}┤\n")
-
-            grand_total_avg_events = 0
-            grand_total_avg_bytes = 0
-
-            for s in summary:
-                name = (s["logsource_name"] or "Unknown")[:30]
-                ltype = (s["logsource_type"] or "Unknown")[:18]
-                days = s.get("days_collected", 0)
-                avg_ev = s.get("avg_daily_events", 0)
-                avg_bytes = s.get("avg_daily_bytes_total", 0) or 0
-                avg_evt_size = s.get("avg_event_size_bytes", 0) or 0
-                grand_total_avg_events += avg_ev
-                grand_total_avg_bytes += avg_bytes
-
-                f.write(f"│ {name:<30} │ {ltype:<18} │ {days:>4} │ "
-                        f"{avg_ev:>15,.0f} │ {self._format_bytes(avg_bytes):>15} │ "
-                        f"{self._format_bytes(avg_evt_size):>10} │\n")
-
-            f.write(f"├{'─' * 98}┤\n")
-            f.write(f"│ {'TOTAL (soma das médias)':<30} │ {'':18} │ {'':>4} │ "
-                    f"{grand_total_avg_events:>15,.0f} │ "
-                    f"{self._format_bytes(grand_total_avg_bytes):>15} │ {'':>10} │\n")
-            f.write(f"└{'─' * 98}┘\n\n")
-
-            # ── Estimativa mensal ────────────────────────────────────────
-            f.write("─" * 100 + "\n")
-            f.write("  ESTIMATIVA DE VOLUME MENSAL (baseada nas médias diárias)\n")
-            f.write("─" * 100 + "\n\n")
-
-            for s in summary:
-                name = s["logsource_name"] or "Unknown"
-                avg_daily_bytes = s.get("avg_daily_bytes_total", 0) or 0
-                monthly_bytes = avg_daily_bytes * 30
-                f.write(f"  {name:<40}  "
-                        f"Diário: {self._format_bytes(avg_daily_bytes):>12}  │  "
-                        f"Mensal (30d): {self._format_bytes(monthly_bytes):>12}\n")
-
-            total_monthly = grand_total_avg_bytes * 30
-            f.write(f"\n  {'TOTAL ESTIMADO':<40}  "
-                    f"Diário: {self._format_bytes(grand_total_avg_bytes):>12}  │  "
-                    f"Mensal (30d): {self._format_bytes(total_monthly):>12}\n")
-
-            f.write("\n" + "─" * 100 + "\n")
-            f.write("  NOTAS\n")
-            f.write("─" * 100 + "\n")
-            if self.siem_name == "qradar":
-                f.write("  • Volumes de bytes referem-se ao payload armazenado no Ariel (pode diferir do\n")
-                f.write("    log bruto on-wire devido a coalescing, truncamento e configurações de storage).\n")
-            elif self.siem_name == "splunk":
-                f.write("  • Volumes de bytes são calculados via sum(len(_raw)) — tamanho bruto do evento\n")
-                f.write("    no index (não comprimido). Para bytes licenciados, use get_license_usage().\n")
-            elif self.siem_name == "secops":
-                f.write("  • Volumes de bytes NÃO estão disponíveis via UDM Search do Google SecOps.\n")
-                f.write("    Todas as colunas de bytes estão zeradas. Use o console do SecOps para volumes.\n")
-            else:
-                f.write("  • Volumes de bytes referem-se ao payload armazenado no SIEM (pode diferir do\n")
-                f.write("    log bruto on-wire devido a coalescing, truncamento e configurações de storage).\n")
-            if self.include_aggregated:
-                f.write("  • Coalescing Ratio (Total Eventos / COUNT(*)) indica quantos eventos reais\n")
-                f.write("    cada registro armazenado representa. Valores > 1 indicam coalescing ativo.\n")
-            f.write("  • Projeções 24h são normalizadas pelo tempo efetivamente coberto (zero-fill).\n")
-            f.write("  • Zero-fill aplica-se apenas a fontes habilitadas (enabled=1) no inventário.\n")
-
-            f.write("\n" + "=" * 100 + "\n")
-            f.write("  FIM DO RELATÓRIO\n")
-            f.write("=" * 100 + "\n")
+        dates = self._collection_dates()
+        daily_data = self._daily_summary()
+        summary = self._overall_daily_average()
+        daily_totals = self._daily_totals()
+        total_runs = self._total_runs()
+
+        # Fragmentos acumulados em lista e gravados de uma vez no final
+        parts: List[str] = []
+        write = parts.append
+        fmt_bytes = self._format_bytes
+        daily_row = _TEXT_DAILY_ROW.format
+
+        # Agrupa o detalhamento por dia uma única vez (evita varrer daily_data por data)
+        by_date: DefaultDict[str, List[ReportRow]] = collections.defaultdict(list)
+        for d in daily_data:
+            by_date[d["collection_date"]].append(d)
+
+        write("=" * 100 + "\n")
+        write(f"  RELATÓRIO DE INGESTÃO DE LOGS - {self.siem_display_name}\n")
+        write(f"  Gerado em: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        write("=" * 100 + "\n\n")
+
+        write("─" * 100 + "\n")
+        write("  INFORMAÇÕES DA COLETA\n")
+        write("─" * 100 + "\n")
+        write(f"  Período de coleta: {dates[0] if dates else 'N/A'} a {dates[-1] if dates else 'N/A'}\n")
+        write(f"  Total de dias coletados: {len(dates)}\n")
+        write(f"  Total de execuções de coleta: {total_runs}\n")
+        write(f"  Total de data sources identificados: {len(summary)}\n\n")
+
+        # ── Detalhamento diário ──────────────────────────────────────
+        write("=" * 100 + "\n")
+        write("  DETALHAMENTO DIÁRIO POR DATA SOURCE\n")
+        write("=" * 100 + "\n\n")
+
+        # Cabeçalho de colunas igual em todos os dias: montado uma vez
+        day_columns = (
+            f"├{'─' * 98}┤\n"
+            f"│ {self.source_label:<35} │ {self.type_label:<20} │ {'Eventos':>12} │ "
+            f"{'Volume Total':>15} │ {'Avg/Evento':>12} │\n"
+            f"├{'─' * 98}┤\n"
+        )
+        for date in dates:
+            date_data = by_date[date]
+            total_events_day, total_bytes_day = daily_totals.get(date, (0, 0))
+
+            write(f"┌{'─' * 98}┐\n")
+            write(f"│  DATA: {date:<89}│\n")
+            write(f"│  Total de Eventos: {total_events_day:>15,}  │  "
+                  f"Volume Total: {fmt_bytes(total_bytes_day):>15}  │\n")
+            write(day_columns)
+
+            for d in date_data:
+                write(daily_row(
+                    name=(d["logsource_name"] or "Unknown")[:35],
+                    ltype=(d["logsource_type"] or "Unknown")[:20],
+                    events=d.get("total_events", 0),
+                    total=fmt_bytes(d.get("total_bytes", 0) or 0),
+                    avg=fmt_bytes(d.get("avg_event_size_bytes", 0) or 0),
+                ))
+
+            write(f"└{'─' * 98}┘\n\n")
+
+        # ── Resumo Geral ─────────────────────────────────────────────
+        write("=" * 100 + "\n")
+        write("  RESUMO - MÉDIA DIÁRIA DE INGESTÃO POR DATA SOURCE\n")
+        write("=" * 100 + "\n\n")
+
+        write(f"┌{'─' * 98}┐\n")
+        write(f"│ {self.source_label:<30} │ {self.type_label:<18} │ {'Dias':>4} │ "
+              f"{'Avg Eventos/Dia':>15} │ {'Avg Volume/Dia':>15} │ {'Avg/Evento':>10} │\n")
+        write(f"├{'─' * 98}┤\n")
+
+        grand_total_avg_events = 0
+        grand_total_avg_bytes = 0
+
+        summary_row = _TEXT_SUMMARY_ROW.format
+        for s in summary:
+            avg_ev = s.get("avg_daily_events", 0)
+            avg_bytes = s.get("avg_daily_bytes_total", 0) or 0
+            grand_total_avg_events += avg_ev
+            grand_total_avg_bytes += avg_bytes
+
+            write(summary_row(
+                name=(s["logsource_name"] or "Unknown")[:30],
+                ltype=(s["logsource_type"] or "Unknown")[:18],
+                days=s.get("days_collected", 0),
+                events=avg_ev,
+                total=fmt_bytes(avg_bytes),
+                avg=fmt_bytes(s.get("avg_event_size_bytes", 0) or 0),
+            ))
+
+        write(f"├{'─' * 98}┤\n")
+        write(f"│ {'TOTAL (soma das médias)':<30} │ {'':18} │ {'':>4} │ "
+              f"{grand_total_avg_events:>15,.0f} │ "
+              f"{fmt_bytes(grand_total_avg_bytes):>15} │ {'':>10} │\n")
+        write(f"└{'─' * 98}┘\n\n")
+
+        # ── Estimativa mensal ────────────────────────────────────────
+        write("─" * 100 + "\n")
+        write("  ESTIMATIVA DE VOLUME MENSAL (baseada nas médias diárias)\n")
+        write("─" * 100 + "\n\n")
+
+        monthly_row = _TEXT_MONTHLY_ROW.format
+        for s in summary:
+            write(monthly_row(
+                name=s["logsource_name"] or "Unknown",
+                daily=fmt_bytes(s.get("avg_daily_bytes_total", 0) or 0),
+                monthly=fmt_bytes(s.get("avg_monthly_bytes", 0) or 0),
+            ))
+
+        total_monthly = grand_total_avg_bytes * 30
+        write(f"\n  {'TOTAL ESTIMADO':<40}  "
+              f"Diário: {fmt_bytes(grand_total_avg_bytes):>12}  │  "
+              f"Mensal (30d): {fmt_bytes(total_monthly):>12}\n")
+
+        write("\n" + "─" * 100 + "\n")
+        write("  NOTAS\n")
+        write("─" * 100 + "\n")
+        if self.siem_name == "qradar":
+            write("  • Volumes de bytes referem-se ao payload armazenado no Ariel (pode diferir do\n")
+            write("    log bruto on-wire devido a coalescing, truncamento e configurações de storage).\n")
+        elif self.siem_name == "splunk":
+            write("  • Volumes de bytes são calculados via sum(len(_raw)) — tamanho bruto do evento\n")
+            write("    no index (não comprimido). Para bytes licenciados, use get_license_usage().\n")
+        elif self.siem_name == "secops":
+            write("  • Volumes de bytes NÃO estão disponíveis via UDM Search do Google SecOps.\n")
+            write("    Todas as colunas de bytes estão zeradas. Use o console do SecOps para volumes.\n")
+        else:
+            write("  • Volumes de bytes referem-se ao payload armazenado no SIEM (pode diferir do\n")
+            write("    log bruto on-wire devido a coalescing, truncamento e configurações de storage).\n")
+        if self.include_aggregated:
+            write("  • Coalescing Ratio (Total Eventos / COUNT(*)) indica quantos eventos reais\n")
+            write("    cada registro armazenado representa. Valores > 1 indicam coalescing ativo.\n")
+        write("  • Projeções 24h são normalizadas pelo tempo efetivamente coberto (zero-fill).\n")
+        write("  • Zero-fill aplica-se apenas a fontes habilitadas (enabled=1) no inventário.\n")
+
+        write("\n" + "=" * 100 + "\n")
+        write("  FIM DO RELATÓRIO\n")
+        write("=" * 100 + "\n")
+
+        filepath.write_text("".join(parts), encoding="utf-8")
 
         logger.info(f"Relatório completo em texto: {filepath}")
@@ -6,12 +6,19 @@ Shared utilities for SIEM log collectors.
 Contains: ErrorCounter, retry logic, signal handling, shared constants.
 """
 
+import collections
+import datetime
+import email.utils
+import functools
 import hashlib
+import json
 import logging
+import random
 import signal
 import sys
+import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 try:
     import requests  # type: ignore[import-untyped]
@@ -21,6 +28,11 @@ except ImportError:
     print("ERRO: Módulo 'requests' não encontrado. Instale com: pip install requests")
     sys.exit(1)
 
+try:
+    import orjson  # opcional: decoder JSON nativo, ~5-10x mais rápido
+except ImportError:
+    orjson = None
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Shared constants
@@ -37,9 +49,24 @@ MAX_CATCHUP_WINDOWS = 3
 logger = logging.getLogger("siem_collector")
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# JSON (orjson quando disponível)
+# ─────────────────────────────────────────────────────────────────────────────
+def _json_loads(data: Union[bytes, str]) -> Any:
+    """Decodifica JSON com orjson se instalado; fallback para o json da stdlib.
+
+    Erros de parsing levantam ValueError em ambos os casos
+    (``orjson.JSONDecodeError`` herda de ``json.JSONDecodeError``).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Stable ID generation
 # ─────────────────────────────────────────────────────────────────────────────
+@functools.lru_cache(maxsize=4096)
 def _stable_id(key: str) -> int:
     """Gera um inteiro determinístico (0..999_999_999) a partir de uma string.
 
@@ -47,6 +74,11 @@ def _stable_id(key: str) -> int:
     entre reinícios do processo (Python 3.3+ randomiza hash() por padrão).
     Essencial para Splunk e Google SecOps, cujos logsource_id são gerados
     client-side a partir de strings (source|sourcetype|index, logType, etc.).
+
+    Memoizado: as mesmas chaves se repetem a cada janela de coleta. 4096
+    entradas cobrem com folga a cardinalidade típica (centenas de
+    source|sourcetype|index ou log_type|product); acima disso o LRU só
+    recalcula o SHA-256 das chaves menos usadas.
     """
     digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
     return int(digest[:8], 16) % (10**9)
@@ -56,6 +88,8 @@ def _stable_id(key: str) -> int:
 # Graceful stop (Ctrl+C / SIGTERM)
 # ─────────────────────────────────────────────────────────────────────────────
 STOP_SIGNAL = False
+# Acorda na hora quem está aguardando o próximo ciclo (wait_for_stop)
+STOP_EVENT = threading.Event()
 
 
 def _signal_handler(signum, frame):
@@ -63,6 +97,7 @@ def _signal_handler(signum, frame):
     global STOP_SIGNAL
     logger.warning("Sinal de parada recebido (Ctrl+C). Finalizando após coleta atual...")
     STOP_SIGNAL = True
+    STOP_EVENT.set()
 
 
 def install_signal_handlers():
@@ -77,6 +112,11 @@ def is_stopped() -> bool:
     return STOP_SIGNAL
 
 
+def wait_for_stop(timeout: float) -> bool:
+    """Bloqueia até ``timeout`` segundos ou até o sinal de parada; True se parou."""
+    return STOP_EVENT.wait(timeout)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # ErrorCounter
 # ─────────────────────────────────────────────────────────────────────────────
@@ -84,10 +124,10 @@ class ErrorCounter:
     """Contador simples de erros/avisos por categoria."""
 
     def __init__(self) -> None:
-        self._counts: Dict[str, int] = {}
+        self._counts: "collections.Counter[str]" = collections.Counter()
 
     def inc(self, key: str, amount: int = 1) -> None:
-        self._counts[key] = self._counts.get(key, 0) + amount
+        self._counts[key] += amount
 
     def as_dict(self) -> Dict[str, int]:
         return dict(self._counts)
@@ -102,14 +142,43 @@ class ErrorCounter:
 # ─────────────────────────────────────────────────────────────────────────────
 # Retry with exponential backoff
 # ─────────────────────────────────────────────────────────────────────────────
+def _parse_retry_after(value: Any) -> Optional[float]:
+    """Interpreta o header Retry-After (segundos ou HTTP-date) em segundos.
+
+    Retorna None se o header estiver ausente ou não puder ser interpretado.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return max(0.0, float(text))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    delta = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return max(0.0, delta)
+
+
 def _retry_with_backoff(
     func,
     max_retries: int = RETRY_MAX_ATTEMPTS,
     base_delay: int = RETRY_BASE_DELAY,
+    retryable_statuses: tuple = RETRYABLE_HTTP_STATUSES,
 ):
     """
     Executa func() com retry e backoff exponencial em falhas transitórias.
-    Não faz retry em HTTP 401, 403, 404.
+    Não faz retry em HTTP 401, 403, 404 (nem em status fora de retryable_statuses).
+
+    Sem Retry-After, a espera usa full jitter — random(0, base_delay * 2^n) —
+    para que coletores que falharam juntos não voltem todos no mesmo instante.
+    Retry-After (definido pelo servidor) é respeitado sem jitter.
     """
     last_exc: Optional[BaseException] = None
     for attempt in range(max_retries + 1):
@@ -117,7 +186,7 @@ def _retry_with_backoff(
             return func()
         except requests.exceptions.HTTPError as exc:
             status = exc.response.status_code if exc.response is not None else 0
-            if status not in RETRYABLE_HTTP_STATUSES:
+            if status not in retryable_statuses:
                 raise
             last_exc = exc
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
@@ -133,14 +202,17 @@ def _retry_with_backoff(
         retry_after = None
         if isinstance(last_exc, requests.exceptions.HTTPError) and getattr(last_exc, "response", None) is not None:
             try:
-                ra = last_exc.response.headers.get("Retry-After")
+                ra = _parse_retry_after(last_exc.response.headers.get("Retry-After"))
                 if ra is not None:
-                    retry_after = int(float(ra))
+                    retry_after = int(ra)
             except Exception:
                 retry_after = None
 
-        delay = retry_after if (retry_after is not None and retry_after > 0) else base_delay * (2 ** attempt)
-        logger.debug(f"Retry {attempt + 1}/{max_retries} em {delay}s: {last_exc}")
+        if retry_after is not None and retry_after > 0:
+            delay = retry_after
+        else:
+            delay = random.uniform(0, base_delay * (2 ** attempt))
+        logger.debug(f"Retry {attempt + 1}/{max_retries} em {delay:.2f}s: {last_exc}")
         time.sleep(delay)
 
     assert last_exc is not None
@@ -268,6 +268,8 @@ def run_secops(args):
     verify_ssl = config.get("verify_ssl", True)
     collection_days = args.days or config.get("collection_days", DEFAULT_COLLECTION_DAYS)
     interval_hours = args.interval or config.get("interval_hours", DEFAULT_INTERVAL_HOURS)
+    slice_minutes = args.slice_minutes or config.get("slice_minutes", 0)
+    stats_search = args.stats_search or config.get("stats_search", False)
     db_file = args.db_file or config.get("db_file", "secops_metrics.db")
     report_dir = args.report_dir or config.get("report_dir", DEFAULT_REPORT_DIR)
 
@@ -300,6 +302,8 @@ def run_secops(args):
             token=token,
             region=region,
             verify_ssl=verify_ssl,
+            slice_minutes=slice_minutes,
+            stats_search=stats_search,
         )
     except ImportError as e:
         logger.error(str(e))
@@ -330,6 +334,8 @@ def run_secops(args):
     logger.info(f"  Auth:               {'Service Account' if sa_file else 'Bearer Token'}")
     logger.info(f"  Período de coleta:  {collection_days} dias")
     logger.info(f"  Intervalo:          {interval_hours}h")
+    logger.info(f"  Sub-janelas:        {f'{slice_minutes} min' if slice_minutes else 'desativado'}")
+    logger.info(f"  Statistics search:  {'ativado' if stats_search else 'desativado'}")
     logger.info(f"  Banco de dados:     {db_file}")
     logger.info(f"  Relatórios:         {report_dir}")
     logger.info(f"  SSL Verify:         {verify_ssl}")
@@ -410,6 +416,10 @@ Exemplos:
     secops_parser.add_argument("--days", type=float, help=f"Dias de coleta (default: {DEFAULT_COLLECTION_DAYS})")
     secops_parser.add_argument("--interval", type=float,
                                help=f"Intervalo em horas (default: {DEFAULT_INTERVAL_HOURS})")
+    secops_parser.add_argument("--slice-minutes", type=float,
+                               help="Divide cada janela em sub-janelas de N minutos consultadas em paralelo")
+    secops_parser.add_argument("--stats-search", action="store_true",
+                               help="Agrega no servidor (statistics search), com fallback para lista de eventos")
     secops_parser.add_argument("--db-file", help="Arquivo SQLite (default: secops_metrics.db)")
     secops_parser.add_argument("--report-dir", help=f"Diretório de relatórios (default: {DEFAULT_REPORT_DIR})")
     secops_parser.add_argument("--report-only", action="store_true", help="Apenas gerar relatório do DB existente")
@@ -11,10 +11,15 @@ Execução:
     python -m unittest tests.test_core -v
 """
 
+import calendar
 import datetime
+import json
 import os
+import sqlite3
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 
@@ -23,6 +28,7 @@ import requests
 # Ensure project root is in path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import core.utils as core_utils
 from core.db import MetricsDB
 from core.utils import (
     DEFAULT_COLLECTION_DAYS,
@@ -32,10 +38,14 @@ from core.utils import (
     RETRYABLE_HTTP_STATUSES,
     RETRY_BASE_DELAY,
     RETRY_MAX_ATTEMPTS,
+    _json_loads,
+    _parse_retry_after,
     _retry_with_backoff,
     _stable_id,
+    is_stopped,
+    wait_for_stop,
 )
-from core.collection import run_collection_cycle
+from core.collection import _collection_date, run_collection_cycle
 from core.report import ReportGenerator
 
 
@@ -44,9 +54,32 @@ from core.report import ReportGenerator
 # ─────────────────────────────────────────────────────────────────────────────
 def _epoch_ms(year, month, day, hour=0, minute=0, second=0, ms=0):
     """Cria epoch em milissegundos para um datetime UTC."""
-    dt = datetime.datetime(year, month, day, hour, minute, second,
-                           tzinfo=datetime.timezone.utc)
-    return int(dt.timestamp() * 1000) + ms
+    return calendar.timegm((year, month, day, hour, minute, second)) * 1000 + ms
+
+
+# Instantes usados em vários testes, calculados uma vez no import
+_JAN15_09H_MS = _epoch_ms(2026, 1, 15, 9)
+_JAN15_10H_MS = _epoch_ms(2026, 1, 15, 10)
+_JAN15_11H_MS = _epoch_ms(2026, 1, 15, 11)
+_JAN15_12H_MS = _epoch_ms(2026, 1, 15, 12)
+_JAN15_23H_MS = _epoch_ms(2026, 1, 15, 23)
+_JAN16_00H_MS = _epoch_ms(2026, 1, 16)
+_MAR10_11H_MS = _epoch_ms(2026, 3, 10, 11)
+_MAR10_12H_MS = _epoch_ms(2026, 3, 10, 12)
+
+
+class _StubClient:
+    """Client mínimo para run_collection_cycle: devolve (ou lança) ``result``."""
+
+    def __init__(self):
+        self.result = None
+        self.calls = []
+
+    def get_event_metrics_window(self, start_ms, end_ms):
+        self.calls.append((start_ms, end_ms))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -59,40 +92,37 @@ class TestCollectionDateBoundary(unittest.TestCase):
 
     def test_midnight_boundary_assigns_previous_day(self):
         """Janela 23:00→00:00 do dia 2026-01-16 deve ter collection_date = 2026-01-15."""
-        window_end_ms = _epoch_ms(2026, 1, 16, 0, 0, 0)
-        window_start_ms = _epoch_ms(2026, 1, 15, 23, 0, 0)
+        window_end_ms = _JAN16_00H_MS
+        window_start_ms = _JAN15_23H_MS
 
-        window_end_dt = datetime.datetime.fromtimestamp(
-            (max(window_end_ms - 1, window_start_ms) / 1000.0),
-            tz=datetime.timezone.utc,
-        )
-        collection_date = window_end_dt.strftime("%Y-%m-%d")
+        collection_date = _collection_date(window_start_ms, window_end_ms)
         self.assertEqual(collection_date, "2026-01-15")
 
     def test_one_ms_after_midnight_assigns_current_day(self):
         """Janela que termina 1ms após meia-noite deve ser atribuída ao dia corrente."""
-        window_end_ms = _epoch_ms(2026, 1, 16, 0, 0, 0, ms=1)
-        window_start_ms = _epoch_ms(2026, 1, 15, 23, 0, 0)
+        window_end_ms = _JAN16_00H_MS + 1
+        window_start_ms = _JAN15_23H_MS
 
-        window_end_dt = datetime.datetime.fromtimestamp(
-            (max(window_end_ms - 1, window_start_ms) / 1000.0),
-            tz=datetime.timezone.utc,
-        )
-        collection_date = window_end_dt.strftime("%Y-%m-%d")
+        collection_date = _collection_date(window_start_ms, window_end_ms)
         self.assertEqual(collection_date, "2026-01-16")
 
     def test_midday_window_same_day(self):
         """Janela 11:00→12:00 deve atribuir ao mesmo dia."""
-        window_end_ms = _epoch_ms(2026, 3, 10, 12, 0, 0)
-        window_start_ms = _epoch_ms(2026, 3, 10, 11, 0, 0)
+        window_end_ms = _MAR10_12H_MS
+        window_start_ms = _MAR10_11H_MS
 
-        window_end_dt = datetime.datetime.fromtimestamp(
-            (max(window_end_ms - 1, window_start_ms) / 1000.0),
-            tz=datetime.timezone.utc,
-        )
-        collection_date = window_end_dt.strftime("%Y-%m-%d")
+        collection_date = _collection_date(window_start_ms, window_end_ms)
         self.assertEqual(collection_date, "2026-03-10")
 
+    def test_matches_datetime_across_years_and_leap_days(self):
+        """Aritmética inteira de dias bate com datetime em UTC (inclusive 29/02)."""
+        for ms in (0, 1, _epoch_ms(2024, 2, 29, 23, 59, 59, ms=999),
+                   _epoch_ms(2024, 3, 1), _epoch_ms(2100, 12, 31, 12)):
+            expected = datetime.datetime.fromtimestamp(
+                ms / 1000.0, tz=datetime.timezone.utc
+            ).strftime("%Y-%m-%d")
+            self.assertEqual(_collection_date(ms, ms + 1), expected)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 2. ErrorCounter
@@ -111,6 +141,7 @@ class TestErrorCounter(unittest.TestCase):
         ec.inc("http_error")
         ec.inc("timeout")
         self.assertEqual(ec.as_dict(), {"http_error": 2, "timeout": 1})
+        self.assertIs(type(ec.as_dict()), dict)  # cópia simples, não o Counter interno
 
     def test_summary_line(self):
         ec = ErrorCounter()
@@ -120,6 +151,28 @@ class TestErrorCounter(unittest.TestCase):
         self.assertEqual(ec.summary_line(), "a_err=3, b_err=1")
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# 2a. Parada graciosa (SIGINT/SIGTERM)
+# ─────────────────────────────────────────────────────────────────────────────
+class TestGracefulStop(unittest.TestCase):
+    """O sinal de parada acorda imediatamente quem aguarda o próximo ciclo."""
+
+    def tearDown(self):
+        core_utils.STOP_SIGNAL = False
+        core_utils.STOP_EVENT.clear()
+
+    def test_wait_times_out_without_signal(self):
+        self.assertFalse(wait_for_stop(0.01))
+        self.assertFalse(is_stopped())
+
+    def test_signal_wakes_waiter(self):
+        threading.Timer(0.05, core_utils._signal_handler, args=(2, None)).start()
+        started = time.monotonic()
+        self.assertTrue(wait_for_stop(30.0))
+        self.assertLess(time.monotonic() - started, 5.0)
+        self.assertTrue(is_stopped())
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 2b. _stable_id — hash determinístico para logsource_id
 # ─────────────────────────────────────────────────────────────────────────────
@@ -153,6 +206,14 @@ class TestStableId(unittest.TestCase):
         id2 = _stable_id("source_b|type_b|idx_b")
         self.assertNotEqual(id1, id2)
 
+    def test_memoized(self):
+        """Chaves repetidas vêm do cache LRU, com o mesmo valor."""
+        _stable_id.cache_clear()
+        first = _stable_id("WINEVTLOG|Windows")
+        second = _stable_id("WINEVTLOG|Windows")
+        self.assertEqual(first, second)
+        self.assertEqual(_stable_id.cache_info().hits, 1)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 3. Zero-fill: fill_zero_event_rows()
@@ -161,13 +222,10 @@ class TestZeroFill(unittest.TestCase):
     """Verifica que log sources do inventário sem eventos recebem linhas com zero."""
 
     def setUp(self):
-        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
-        self.db = MetricsDB(self.db_path)
+        self.db = MetricsDB(":memory:")
 
     def tearDown(self):
         self.db.close()
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
 
     def test_zero_fill_inserts_missing_sources(self):
         """Log sources no inventário sem dados devem receber linhas com evento = 0."""
@@ -195,14 +253,15 @@ class TestZeroFill(unittest.TestCase):
 
         cursor = self.db.conn.cursor()
         cursor.execute(
-            "SELECT logsource_id, total_event_count FROM event_metrics WHERE run_id = ?",
-            (run_id,),
+            "SELECT logsource_id, total_events, covered_seconds FROM daily_stats "
+            "WHERE collection_date = ?",
+            ("2026-01-15",),
         )
-        rows = {row[0]: row[1] for row in cursor.fetchall()}
-        self.assertIn(2, rows)
-        self.assertIn(3, rows)
-        self.assertEqual(rows[2], 0)
-        self.assertEqual(rows[3], 0)
+        rows = {row[0]: row[1:] for row in cursor}
+        self.assertEqual(rows, {2: (0, 3600.0), 3: (0, 3600.0)})
+        # Janelas sem dados não viram linhas em event_metrics
+        cursor.execute("SELECT COUNT(*) FROM event_metrics")
+        self.assertEqual(cursor.fetchone()[0], 0)
 
     def test_zero_fill_skips_seen_sources(self):
         """Log sources que apareceram nos dados NÃO devem ser zero-filled."""
@@ -255,12 +314,73 @@ class TestZeroFill(unittest.TestCase):
         self.assertEqual(zero_filled, 2, "Apenas fontes enabled devem ser zero-filled")
 
         cursor = self.db.conn.cursor()
-        cursor.execute("SELECT logsource_id FROM event_metrics WHERE run_id = ?", (run_id,))
-        filled_ids = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT logsource_id FROM daily_stats")
+        filled_ids = {row[0] for row in cursor}
         self.assertIn(1, filled_ids)
         self.assertIn(3, filled_ids)
         self.assertNotIn(2, filled_ids, "Fonte disabled NÃO deve ser zero-filled")
 
+    def _fill(self, run_id: int) -> int:
+        return self.db.fill_zero_event_rows(
+            run_id=run_id,
+            collection_time="2026-01-15T12:00:00",
+            collection_date="2026-01-15",
+            window_start_ms=1000000,
+            window_end_ms=4600000,
+            window_seconds=3600.0,
+            seen_logsource_ids=set(),
+            interval_hours=1.0,
+        )
+
+    def test_zero_fill_inventory_cached_until_next_save(self):
+        """Inventário lido uma vez; nova gravação de inventário invalida o cache."""
+        self.db.save_log_sources_inventory([{"logsource_id": 1, "name": "A", "type_name": "T"}])
+        run_id = self.db.save_collection_run("2026-01-15T12:00:00", "2026-01-15", 1.0)
+        self.assertEqual(self._fill(run_id), 1)
+
+        # Escrita fora da API não é vista: o zero-fill usa o cache em memória
+        self.db.conn.execute(
+            "INSERT INTO log_sources_inventory (logsource_id, name, type_name, enabled) "
+            "VALUES (9, 'X', 'T', 1)"
+        )
+        self.assertEqual(self._fill(run_id), 1)
+
+        self.db.save_log_sources_inventory_iter(iter([{"logsource_id": 2, "name": "B"}]))
+        self.assertEqual(self._fill(run_id), 3)
+
+    def test_zero_fill_set_difference_ignores_unknown_seen_ids(self):
+        """IDs vistos fora do inventário não afetam a diferença; nome vazio vira Unknown."""
+        self.db.save_log_sources_inventory([
+            {"logsource_id": 1, "name": "", "type_name": ""},
+            {"logsource_id": 2, "name": "B", "type_name": "T"},
+        ])
+        run_id = self.db.save_collection_run("2026-01-15T12:00:00", "2026-01-15", 1.0)
+        filled = self.db.fill_zero_event_rows(
+            run_id, "2026-01-15T12:00:00", "2026-01-15", 0, 3600000, 3600.0,
+            seen_logsource_ids={2, 999}, interval_hours=1.0,
+        )
+        self.assertEqual(filled, 1)
+        row = self.db.conn.execute(
+            "SELECT logsource_id, logsource_name, logsource_type FROM daily_stats"
+        ).fetchone()
+        self.assertEqual(row, (1, "Unknown", "Unknown"))
+
+    def test_zero_fill_large_inventory_single_transaction(self):
+        """Milhares de fontes ausentes: um único BEGIN/COMMIT por janela."""
+        self.db.save_log_sources_inventory([
+            {"logsource_id": i, "name": f"S{i}", "type_name": "T"} for i in range(1, 2001)
+        ])
+        run_id = self.db.save_collection_run("2026-01-15T12:00:00", "2026-01-15", 1.0)
+        statements = []
+        self.db.conn.set_trace_callback(statements.append)
+        try:
+            filled = self._fill(run_id)
+        finally:
+            self.db.conn.set_trace_callback(None)
+        self.assertEqual(filled, 2000)
+        self.assertEqual([s for s in statements if s.startswith(("BEGIN", "COMMIT"))],
+                         ["BEGIN IMMEDIATE", "COMMIT"])
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 4. Catch-up cap (MAX_CATCHUP_WINDOWS)
@@ -354,9 +474,10 @@ class TestRetryWithBackoff(unittest.TestCase):
         # Deve ter usado 7s (do Retry-After) em vez do backoff padrão (2s)
         mock_sleep.assert_called_once_with(7)
 
+    @patch("core.utils.random.uniform", side_effect=lambda lo, hi: hi)
     @patch("core.utils.time.sleep", return_value=None)
-    def test_default_backoff_without_retry_after(self, mock_sleep):
-        """Sem Retry-After, deve usar backoff exponencial padrão."""
+    def test_default_backoff_without_retry_after(self, mock_sleep, _mock_uniform):
+        """Sem Retry-After, deve usar backoff exponencial padrão (teto do jitter)."""
         call_count = 0
 
         def server_error():
@@ -374,6 +495,60 @@ class TestRetryWithBackoff(unittest.TestCase):
         # Backoff padrão: base_delay * 2^0 = 2
         mock_sleep.assert_called_once_with(2)
 
+    @patch("core.utils.time.sleep", return_value=None)
+    def test_backoff_full_jitter(self, mock_sleep):
+        """Sem Retry-After, cada espera é sorteada em [0, base_delay * 2^n]."""
+        def server_error():
+            resp = MagicMock()
+            resp.status_code = 503
+            resp.headers = {}
+            raise requests.exceptions.HTTPError(response=resp)
+
+        with patch("core.utils.random.uniform", return_value=0.5) as mock_uniform:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                _retry_with_backoff(server_error, max_retries=3, base_delay=2)
+        self.assertEqual([c[0] for c in mock_uniform.call_args_list], [(0, 2), (0, 4), (0, 8)])
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [0.5, 0.5, 0.5])
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    """Verifica interpretação do header Retry-After."""
+
+    def test_seconds(self):
+        self.assertEqual(_parse_retry_after("12"), 12.0)
+
+    def test_http_date(self):
+        future = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=60)
+        header = future.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        self.assertAlmostEqual(_parse_retry_after(header), 60.0, delta=2.0)
+
+    def test_past_date_is_zero(self):
+        self.assertEqual(_parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(_parse_retry_after(None))
+        self.assertIsNone(_parse_retry_after("soon"))
+
+
+class TestJsonHelpers(unittest.TestCase):
+    """Verifica _json_loads com e sem orjson."""
+
+    DATA = {"events": [{"name": "ação"}], "moreDataAvailable": False}
+
+    def _roundtrip(self):
+        raw = json.dumps(self.DATA, ensure_ascii=False).encode("utf-8")
+        self.assertEqual(_json_loads(raw), self.DATA)
+        self.assertEqual(_json_loads(raw.decode("utf-8")), self.DATA)
+        with self.assertRaises(ValueError):
+            _json_loads(b"<html>")
+
+    def test_roundtrip(self):
+        self._roundtrip()
+
+    def test_roundtrip_stdlib_fallback(self):
+        with patch("core.utils.orjson", None):
+            self._roundtrip()
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 6. Constants
@@ -381,48 +556,35 @@ class TestRetryWithBackoff(unittest.TestCase):
 class TestConstants(unittest.TestCase):
     """Valida valores esperados das constantes compartilhadas."""
 
-    def test_default_collection_days(self):
-        self.assertEqual(DEFAULT_COLLECTION_DAYS, 6)
-
-    def test_max_catchup_windows(self):
-        self.assertEqual(MAX_CATCHUP_WINDOWS, 3)
-
-    def test_retryable_statuses_include_429_500(self):
-        self.assertIn(429, RETRYABLE_HTTP_STATUSES)
-        self.assertIn(500, RETRYABLE_HTTP_STATUSES)
-
-    def test_retryable_statuses_exclude_401_403(self):
-        self.assertNotIn(401, RETRYABLE_HTTP_STATUSES)
-        self.assertNotIn(403, RETRYABLE_HTTP_STATUSES)
-
-    def test_retry_defaults(self):
-        self.assertEqual(RETRY_MAX_ATTEMPTS, 3)
-        self.assertEqual(RETRY_BASE_DELAY, 2)
+    def test_constants(self):
+        self.assertEqual(
+            (DEFAULT_COLLECTION_DAYS, MAX_CATCHUP_WINDOWS, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY),
+            (6, 3, 3, 2),
+        )
+        self.assertLessEqual({429, 500}, set(RETRYABLE_HTTP_STATUSES))
+        self.assertFalse({401, 403} & set(RETRYABLE_HTTP_STATUSES))
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 7. run_collection_cycle (integration with real DB)
 # ─────────────────────────────────────────────────────────────────────────────
 class TestRunCollectionCycle(unittest.TestCase):
-    """Testa run_collection_cycle com mock de client e DB real (SQLite temporário)."""
+    """Testa run_collection_cycle com mock de client e DB real (SQLite em memória)."""
 
     def setUp(self):
-        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
-        self.db = MetricsDB(self.db_path)
+        self.db = MetricsDB(":memory:")
         self.db.save_log_sources_inventory([
             {"logsource_id": 1, "name": "FW-1", "type_name": "Firewall"},
             {"logsource_id": 2, "name": "IDS-1", "type_name": "IDS"},
         ])
-        self.client = MagicMock()
+        self.client = _StubClient()
 
     def tearDown(self):
         self.db.close()
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
 
     def test_cycle_with_partial_data(self):
         """Se query retorna só FW-1, IDS-1 deve ser zero-filled."""
-        self.client.get_event_metrics_window.return_value = [
+        self.client.result = [
             {
                 "logsourceid": 1,
                 "log_source_name": "FW-1",
@@ -434,8 +596,8 @@ class TestRunCollectionCycle(unittest.TestCase):
             }
         ]
 
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         ds_count = run_collection_cycle(
             client=self.client,
@@ -447,19 +609,19 @@ class TestRunCollectionCycle(unittest.TestCase):
         )
 
         self.assertEqual(ds_count, 1)
+        self.assertEqual(self.client.calls, [(window_start, window_end)])
 
         cursor = self.db.conn.cursor()
-        cursor.execute("SELECT logsource_id, total_event_count FROM event_metrics")
-        rows = {r[0]: r[1] for r in cursor.fetchall()}
+        rows = dict(cursor.execute("SELECT logsource_id, total_events FROM daily_stats"))
         self.assertEqual(rows.get(1), 500)
         self.assertEqual(rows.get(2), 0)
 
     def test_cycle_with_no_data(self):
         """Se query retorna None, nenhum dado salvo mas zero-fill ocorre."""
-        self.client.get_event_metrics_window.return_value = None
+        self.client.result = None
 
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         ds_count = run_collection_cycle(
             client=self.client,
@@ -473,13 +635,13 @@ class TestRunCollectionCycle(unittest.TestCase):
         self.assertEqual(ds_count, 0)
 
         cursor = self.db.conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM event_metrics")
+        cursor.execute("SELECT COUNT(*) FROM daily_stats")
         count = cursor.fetchone()[0]
         self.assertEqual(count, 2)  # FW-1 e IDS-1 zero-filled
 
     def test_post_collect_callback_called(self):
         """post_collect_callback deve ser chamado após coleta com dados."""
-        self.client.get_event_metrics_window.return_value = [
+        self.client.result = [
             {
                 "logsourceid": 1,
                 "log_source_name": "FW-1",
@@ -492,8 +654,8 @@ class TestRunCollectionCycle(unittest.TestCase):
         ]
 
         callback = MagicMock()
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         run_collection_cycle(
             client=self.client,
@@ -513,11 +675,11 @@ class TestRunCollectionCycle(unittest.TestCase):
         Isso sinaliza ao loop principal que a janela NÃO deve ser avançada,
         permitindo catch-up no próximo ciclo.
         """
-        self.client.get_event_metrics_window.side_effect = RuntimeError("AQL timeout")
+        self.client.result = RuntimeError("AQL timeout")
 
         error_counter = ErrorCounter()
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         ds_count = run_collection_cycle(
             client=self.client,
@@ -537,10 +699,10 @@ class TestRunCollectionCycle(unittest.TestCase):
 
         Janela vazia é sucesso — o loop deve avançar last_window_end_ms.
         """
-        self.client.get_event_metrics_window.return_value = None
+        self.client.result = None
 
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         ds_count = run_collection_cycle(
             client=self.client,
@@ -559,10 +721,10 @@ class TestRunCollectionCycle(unittest.TestCase):
         Garante que corridas com falha no SIEM sejam distinguíveis de
         coletas bem-sucedidas no banco de dados.
         """
-        self.client.get_event_metrics_window.side_effect = RuntimeError("Connection refused")
+        self.client.result = RuntimeError("Connection refused")
 
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         ds_count = run_collection_cycle(
             client=self.client,
@@ -583,7 +745,7 @@ class TestRunCollectionCycle(unittest.TestCase):
 
     def test_successful_run_keeps_success_status(self):
         """Coleta bem-sucedida deve manter status = 'success' (default)."""
-        self.client.get_event_metrics_window.return_value = [
+        self.client.result = [
             {
                 "logsourceid": 1,
                 "log_source_name": "FW-1",
@@ -595,8 +757,8 @@ class TestRunCollectionCycle(unittest.TestCase):
             }
         ]
 
-        window_start = _epoch_ms(2026, 1, 15, 11, 0, 0)
-        window_end = _epoch_ms(2026, 1, 15, 12, 0, 0)
+        window_start = _JAN15_11H_MS
+        window_end = _JAN15_12H_MS
 
         ds_count = run_collection_cycle(
             client=self.client,
@@ -614,6 +776,24 @@ class TestRunCollectionCycle(unittest.TestCase):
         status = cursor.fetchone()[0]
         self.assertEqual(status, "success", "Status da run bem-sucedida deve ser 'success'")
 
+    def test_cycle_writes_roll_back_together(self):
+        """Run, métricas e zero-fill numa só transação: falha no zero-fill desfaz a janela."""
+        self.client.result = [
+            {"logsourceid": 1, "log_source_name": "FW-1", "aggregated_event_count": 1}
+        ]
+        with patch.object(self.db, "fill_zero_event_rows", side_effect=sqlite3.OperationalError("disk")):
+            with self.assertRaises(sqlite3.OperationalError):
+                run_collection_cycle(
+                    client=self.client, db=self.db, interval_hours=1.0,
+                    window_start_ms=_JAN15_11H_MS,
+                    window_end_ms=_JAN15_12H_MS,
+                    siem_name="test",
+                )
+        cursor = self.db.conn.cursor()
+        self.assertEqual(cursor.execute("SELECT COUNT(*) FROM collection_runs").fetchone()[0], 0)
+        self.assertEqual(cursor.execute("SELECT COUNT(*) FROM event_metrics").fetchone()[0], 0)
+        self.assertFalse(self.db.conn.in_transaction)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 8. MetricsDB schema
@@ -650,6 +830,193 @@ class TestMetricsDB(unittest.TestCase):
         cursor.execute("SELECT COUNT(*) FROM log_sources_inventory")
         self.assertEqual(cursor.fetchone()[0], 2)
 
+    def test_save_inventory_dedups_by_id(self):
+        """IDs repetidos no mesmo lote: última ocorrência vence."""
+        self.db.save_log_sources_inventory([
+            {"logsource_id": 7, "name": "Old", "type_name": "T"},
+            {"logsource_id": 8, "name": "Other", "type_name": "T"},
+            {"logsource_id": 7, "name": "New", "type_name": "T", "enabled": False},
+        ])
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT logsource_id, name, enabled FROM log_sources_inventory ORDER BY 1")
+        self.assertEqual(cursor.fetchall(), [(7, "New", 0), (8, "Other", 1)])
+
+    def test_daily_summary_uses_composite_index(self):
+        """GROUP BY collection_date, logsource_id (recálculo do roll-up) percorre idx_event_metrics_daily."""
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT collection_date, logsource_id, SUM(total_event_count) "
+            "FROM event_metrics GROUP BY collection_date, logsource_id"
+        ).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_event_metrics_daily", details)
+        self.assertNotIn("TEMP B-TREE FOR GROUP BY", details)
+
+    def test_collection_dates_use_index(self):
+        """DISTINCT collection_date de collection_runs vem de idx_collection_runs_date."""
+        plan = self.db.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT DISTINCT collection_date FROM collection_runs "
+            "ORDER BY collection_date"
+        ).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_collection_runs_date", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+    def test_connection_pragmas(self):
+        """WAL + synchronous=NORMAL + autocommit (transações explícitas)."""
+        cursor = self.db.conn.cursor()
+        self.assertEqual(cursor.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(cursor.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(cursor.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        # Agregações/ordenações temporárias em memória e cache de páginas de 64 MB
+        self.assertEqual(cursor.execute("PRAGMA temp_store").fetchone()[0], 2)  # MEMORY
+        self.assertEqual(cursor.execute("PRAGMA cache_size").fetchone()[0], -65536)
+        self.assertIsNone(self.db.conn.isolation_level)
+
+    def test_save_event_metrics_single_transaction(self):
+        """Lote inteiro numa transação: commit ao final, rollback em erro."""
+        run_id = self.db.save_collection_run("2025-01-01T00:00:00", "2025-01-01", 1.0)
+        metrics = [
+            {"logsourceid": i, "log_source_name": f"s{i}", "aggregated_event_count": i}
+            for i in range(1, 4)
+        ]
+        self.db.save_event_metrics(run_id, "t", "2025-01-01", 0, 3600000, 3600.0, metrics, 1.0)
+        self.assertFalse(self.db.conn.in_transaction)
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT logsource_id, total_event_count FROM event_metrics ORDER BY 1")
+        self.assertEqual(cursor.fetchall(), [(1, 1), (2, 2), (3, 3)])
+
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.db.tx() as conn:
+                conn.execute("DELETE FROM event_metrics")
+                conn.execute("INSERT INTO tabela_inexistente VALUES (1)")
+        cursor.execute("SELECT COUNT(*) FROM event_metrics")
+        self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_bulk_tx_single_commit(self):
+        """tx() internos não fazem commit dentro de bulk_tx(); erro desfaz tudo."""
+        with self.db.bulk_tx():
+            run_id = self.db.save_collection_run("2025-01-01T00:00:00", "2025-01-01", 1.0)
+            self.db.save_log_sources_inventory([{"logsource_id": 1, "name": "a"}])
+            self.assertTrue(self.db.conn.in_transaction)
+        self.assertFalse(self.db.conn.in_transaction)
+        self.assertEqual(run_id, 1)
+
+        with self.assertRaises(RuntimeError):
+            with self.db.bulk_tx():
+                self.db.save_collection_run("2025-01-01T01:00:00", "2025-01-01", 1.0)
+                self.db.save_log_sources_inventory([{"logsource_id": 2, "name": "b"}])
+                raise RuntimeError("ciclo falhou")
+        cursor = self.db.conn.cursor()
+        self.assertEqual(cursor.execute("SELECT COUNT(*) FROM collection_runs").fetchone()[0], 1)
+        self.assertEqual(cursor.execute("SELECT COUNT(*) FROM log_sources_inventory").fetchone()[0], 1)
+
+    def test_per_thread_connections(self):
+        """Cada thread usa a própria conexão (com PRAGMAs) e vê as escritas das outras."""
+        run_id = self.db.save_collection_run("2025-01-01T00:00:00", "2025-01-01", 1.0)
+        seen = {}
+
+        def worker():
+            conn = self.db.conn
+            seen["conn"] = conn
+            seen["wal"] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            self.db.save_event_metrics(
+                run_id, "t", "2025-01-01", 0, 3600000, 3600.0,
+                [{"logsourceid": 7, "aggregated_event_count": 1}], 1.0,
+            )
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsNot(seen["conn"], self.db.conn)
+        self.assertEqual(seen["wal"], "wal")
+        count = self.db.conn.execute("SELECT COUNT(*) FROM event_metrics").fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def test_memory_db_tx_waits_for_other_thread_bulk_tx(self):
+        """Em ":memory:" a conexão é compartilhada: tx() de outra thread espera
+        o bulk_tx() terminar em vez de fazer commit no meio dele."""
+        db = MetricsDB(":memory:")
+        self.addCleanup(db.close)
+
+        def worker():
+            db.save_log_sources_inventory([{"logsource_id": 2, "name": "b"}])
+
+        thread = threading.Thread(target=worker)
+        with self.assertRaises(RuntimeError):
+            with db.bulk_tx():
+                db.save_log_sources_inventory([{"logsource_id": 1, "name": "a"}])
+                thread.start()
+                thread.join(timeout=0.2)
+                self.assertTrue(thread.is_alive())
+                raise RuntimeError("ciclo falhou")
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        ids = [r[0] for r in db.conn.execute(
+            "SELECT logsource_id FROM log_sources_inventory").fetchall()]
+        self.assertEqual(ids, [2])
+
+    def test_save_inventory_iter_batches_outside_transaction(self):
+        """Gerador consumido em lotes, sem transação aberta enquanto produz
+        (rede); cada lote tem seu BEGIN/COMMIT e uma falha mantém os anteriores."""
+        in_tx = []
+
+        def sources(ids, fail=False):
+            for i in ids:
+                in_tx.append(self.db.conn.in_transaction)
+                yield {"logsource_id": i, "name": f"src-{i}", "type_name": "T"}
+            if fail:
+                raise RuntimeError("página falhou")
+
+        statements = []
+        self.db.conn.set_trace_callback(statements.append)
+        try:
+            self.assertEqual(
+                self.db.save_log_sources_inventory_iter(sources(range(5)), batch_size=2), 5
+            )
+        finally:
+            self.db.conn.set_trace_callback(None)
+        self.assertEqual(sum(s == "BEGIN IMMEDIATE" for s in statements), 3)
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM log_sources_inventory")
+        self.assertEqual(cursor.fetchone()[0], 5)
+
+        with self.assertRaises(RuntimeError):
+            self.db.save_log_sources_inventory_iter(sources([100, 101, 102], fail=True),
+                                                    batch_size=2)
+        cursor.execute("SELECT logsource_id FROM log_sources_inventory WHERE logsource_id >= 100")
+        self.assertEqual([row[0] for row in cursor.fetchall()], [100, 101])
+        self.assertFalse(any(in_tx))
+        self.assertFalse(self.db.conn.in_transaction)
+
+    def test_save_inventory_single_transaction(self):
+        """Inventário gravado com executemany num único BEGIN/COMMIT (dedup por id)."""
+        statements = []
+        self.db.conn.set_trace_callback(statements.append)
+        try:
+            self.db.save_log_sources_inventory([
+                {"logsource_id": 1, "name": "a", "type_name": "T"},
+                {"logsource_id": 2, "name": "b", "type_name": "T"},
+                {"logsource_id": 1, "name": "a2", "type_name": "T"},
+            ])
+        finally:
+            self.db.conn.set_trace_callback(None)
+        self.assertEqual([s for s in statements if s.startswith(("BEGIN", "COMMIT"))],
+                         ["BEGIN IMMEDIATE", "COMMIT"])
+        self.assertEqual(sum(s.startswith("INSERT") for s in statements), 2)
+        names = self.db.conn.execute(
+            "SELECT name FROM log_sources_inventory ORDER BY logsource_id"
+        ).fetchall()
+        self.assertEqual([row[0] for row in names], ["a2", "b"])
+
+    def test_log_source_types_roundtrip_and_staleness(self):
+        """Snapshot de tipos é substituído por inteiro e expira por idade."""
+        self.db.save_log_source_types({1: "Old", 2: "Gone"})
+        self.db.save_log_source_types({1: "Linux OS", 3: "Windows"})
+        self.assertEqual(self.db.get_log_source_types(), {1: "Linux OS", 3: "Windows"})
+        self.assertEqual(self.db.get_log_source_types(max_age_seconds=3600), {1: "Linux OS", 3: "Windows"})
+        self.db.conn.execute("UPDATE log_source_types SET last_updated = '2000-01-01T00:00:00+00:00'")
+        self.assertEqual(self.db.get_log_source_types(max_age_seconds=3600), {})
+
     def test_group_by_logsource_id_not_name(self):
         """Fontes com mesmo nome mas IDs diferentes devem ficar separadas no resumo."""
         # Duas fontes com MESMO nome mas IDs distintos
@@ -658,8 +1025,8 @@ class TestMetricsDB(unittest.TestCase):
             {"logsource_id": 200, "name": "Firewall", "type_name": "FortiGate"},
         ])
         run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
-        w_start = _epoch_ms(2026, 1, 15, 9, 0, 0)
-        w_end = _epoch_ms(2026, 1, 15, 10, 0, 0)
+        w_start = _JAN15_09H_MS
+        w_end = _JAN15_10H_MS
         # Salvar métricas com mesmo nome mas IDs diferentes
         self.db.save_event_metrics(
             run_id, "2026-01-15T10:00:00", "2026-01-15",
@@ -685,10 +1052,10 @@ class TestMetricsDB(unittest.TestCase):
         self.db.save_log_sources_inventory([
             {"logsource_id": 42, "name": "OldName", "type_name": "Syslog"},
         ])
-        w1_start = _epoch_ms(2026, 1, 15, 9, 0, 0)
-        w1_end = _epoch_ms(2026, 1, 15, 10, 0, 0)
-        w2_start = _epoch_ms(2026, 1, 15, 10, 0, 0)
-        w2_end = _epoch_ms(2026, 1, 15, 11, 0, 0)
+        w1_start = _JAN15_09H_MS
+        w1_end = _JAN15_10H_MS
+        w2_start = _JAN15_10H_MS
+        w2_end = _JAN15_11H_MS
 
         run1 = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
         self.db.save_event_metrics(
@@ -713,6 +1080,130 @@ class TestMetricsDB(unittest.TestCase):
         self.assertEqual(len(daily), 1, "Fonte renomeada deve permanecer agrupada por ID")
         self.assertEqual(daily[0]["total_events"], 250)
 
+    def test_daily_stats_rollup_matches_rebuild(self):
+        """Roll-up incremental == recálculo a partir de event_metrics (fora o zero-fill)."""
+        self.db.save_log_sources_inventory([
+            {"logsource_id": 1, "name": "A", "type_name": "T"},
+            {"logsource_id": 2, "name": "B", "type_name": "T"},
+        ])
+        for hour, metrics in ((10, [{"logsourceid": 1, "log_source_name": "A",
+                                     "total_event_count": 10, "total_payload_bytes": 100.0}]),
+                              (11, [{"logsourceid": 1, "log_source_name": "A",
+                                     "total_event_count": 4, "total_payload_bytes": 50.0},
+                                    {"logsourceid": 1, "log_source_name": "A2",
+                                     "total_event_count": 1, "total_payload_bytes": 5.0}])):
+            ct = f"2026-01-15T{hour}:00:00"
+            run_id = self.db.save_collection_run(ct, "2026-01-15", 1.0)
+            self.db.save_event_metrics(run_id, ct, "2026-01-15", 0, 3600000, 3600.0, metrics, 1.0)
+
+        incremental = (self.db.get_daily_summary(), self.db.get_overall_daily_average())
+        self.db.rebuild_daily_stats()
+        self.assertEqual(incremental, (self.db.get_daily_summary(), self.db.get_overall_daily_average()))
+        by_id = {row["logsource_id"]: row for row in incremental[0]}
+        self.assertEqual(by_id[1]["total_events"], 15)
+        self.assertEqual(by_id[1]["collection_count"], 2)
+        self.assertEqual(by_id[1]["logsource_name"], "A2")
+
+        # Zero-fill soma cobertura só no roll-up
+        for hour in (10, 11):
+            ct = f"2026-01-15T{hour}:00:00"
+            self.db.fill_zero_event_rows(0, ct, "2026-01-15", 0, 3600000, 3600.0, {1}, 1.0)
+        by_id = {row["logsource_id"]: row for row in self.db.get_daily_summary()}
+        self.assertEqual(by_id[2]["total_events"], 0)
+        self.assertEqual(by_id[2]["covered_seconds"], 7200.0)
+        self.assertEqual(by_id[2]["collection_count"], 2)
+
+    def test_daily_stats_backfilled_for_existing_db(self):
+        """Banco antigo (event_metrics sem roll-up) é populado ao abrir."""
+        run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
+        self.db.save_event_metrics(run_id, "2026-01-15T10:00:00", "2026-01-15", 0, 3600000, 3600.0,
+                                   [{"logsourceid": 5, "total_event_count": 7}], 1.0)
+        self.db.conn.execute("DELETE FROM daily_stats")
+        self.db.close()
+        self.db = MetricsDB(self.db_path)
+        self.assertEqual([row["total_events"] for row in self.db.get_daily_summary()], [7])
+
+    def test_report_rows_support_mapping_access(self):
+        """Linhas de relatório (sqlite3.Row) aceitam row[col], get() com default e dict()."""
+        run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
+        self.db.save_event_metrics(run_id, "2026-01-15T10:00:00", "2026-01-15", 0, 3600000, 3600.0,
+                                   [{"logsourceid": 5, "total_event_count": 7}], 1.0)
+        row = self.db.get_daily_summary()[0]
+        self.assertEqual(row["total_events"], 7)
+        self.assertEqual(row.get("logsource_id"), 5)
+        self.assertEqual(row.get("nao_existe", "x"), "x")
+        self.assertEqual(dict(row)["collection_date"], "2026-01-15")
+        self.assertEqual(self.db.get_overall_daily_average()[0].get("days_collected"), 1)
+
+    def test_daily_summary_derived_figures_on_plain_schema(self):
+        """MB/GB/cobertura saem do SELECT: base sem colunas extras funciona (SQLite < 3.31)."""
+        self.db.close()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DROP TABLE daily_stats")
+        conn.execute("CREATE TABLE daily_stats (collection_date TEXT NOT NULL, "
+                     "logsource_id INTEGER NOT NULL, logsource_name TEXT, logsource_type TEXT, "
+                     "total_events INTEGER DEFAULT 0, aggregated_events INTEGER DEFAULT 0, "
+                     "unparsed_total_events INTEGER DEFAULT 0, "
+                     "unparsed_aggregated_events INTEGER DEFAULT 0, total_bytes REAL DEFAULT 0, "
+                     "collection_count INTEGER DEFAULT 0, covered_seconds REAL DEFAULT 0, "
+                     "PRIMARY KEY (collection_date, logsource_id))")
+        conn.commit()
+        conn.close()
+        self.db = MetricsDB(self.db_path)
+
+        run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
+        self.db.save_event_metrics(run_id, "2026-01-15T10:00:00", "2026-01-15", 0, 3600000, 21600.0,
+                                   [{"logsourceid": 5, "total_payload_bytes": 3 * 1024 ** 3}], 1.0)
+        row = self.db.get_daily_summary()[0]
+        self.assertEqual((row["total_mb"], row["total_gb"], row["coverage_pct"]), (3072.0, 3.0, 25.0))
+        self.assertEqual(self.db.get_overall_daily_average()[0]["avg_monthly_bytes"],
+                         3 * 1024 ** 3 * 4 * 30)
+
+    def test_unresolved_name_never_overwrites_real_name(self):
+        """Nome/tipo None (id não resolvido no client) mantém o valor real do dia;
+        sem nome vira LogSource-<id> e sem tipo vira Unknown."""
+        run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
+        for start, name, ltype in ((0, "Alpha-FW", "Palo Alto"), (3600000, None, None)):
+            self.db.save_event_metrics(
+                run_id, "2026-01-15T10:00:00", "2026-01-15", start, start + 3600000, 3600.0,
+                [{"logsourceid": 5, "log_source_name": name, "log_source_type": ltype,
+                  "total_event_count": 1},
+                 {"logsourceid": 9, "log_source_name": None, "log_source_type": None,
+                  "total_event_count": 1}], 1.0,
+            )
+        expected = {5: ("Alpha-FW", "Palo Alto"), 9: ("LogSource-9", "Unknown")}
+        for report in (self.db.get_daily_summary, self.db.get_overall_daily_average):
+            rows = {r["logsource_id"]: (r["logsource_name"], r["logsource_type"]) for r in report()}
+            self.assertEqual(rows, expected)
+
+        self.db.rebuild_daily_stats()
+        row = self.db.conn.execute(
+            "SELECT logsource_name, logsource_type FROM daily_stats WHERE logsource_id = 5"
+        ).fetchone()
+        self.assertEqual(tuple(row), ("Alpha-FW", "Palo Alto"))
+
+    def test_save_event_metrics_returns_seen_ids(self):
+        run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
+        seen = self.db.save_event_metrics(
+            run_id, "2026-01-15T10:00:00", "2026-01-15", 0, 3600000, 3600.0,
+            [{"logsourceid": 5}, {"logsourceid": "7"}, {"logsourceid": 5}, {}], 1.0,
+        )
+        self.assertEqual(seen, {0, 5, 7})
+
+    def test_get_daily_totals(self):
+        """Totais por dia somam todas as fontes daquele dia."""
+        for date, metrics in (("2026-01-15", [{"logsourceid": 1, "total_event_count": 10,
+                                               "total_payload_bytes": 100.0},
+                                              {"logsourceid": 2, "total_event_count": 5,
+                                               "total_payload_bytes": 20.0}]),
+                              ("2026-01-16", [{"logsourceid": 1, "total_event_count": 3}])):
+            ct = f"{date}T10:00:00"
+            run_id = self.db.save_collection_run(ct, date, 1.0)
+            self.db.save_event_metrics(run_id, ct, date, 0, 3600000, 3600.0, metrics, 1.0)
+
+        self.assertEqual(self.db.get_daily_totals(),
+                         {"2026-01-15": (15, 120.0), "2026-01-16": (3, 0)})
+
     def test_update_collection_run_status(self):
         """Verifica que update_collection_run_status() atualiza o status corretamente."""
         run_id = self.db.save_collection_run("2026-01-15T10:00:00", "2026-01-15", 1.0)
@@ -740,8 +1231,7 @@ class TestReportNotasPerSiem(unittest.TestCase):
     """Verifica que a seção NOTAS usa texto correto por SIEM."""
 
     def setUp(self):
-        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
-        self.db = MetricsDB(self.db_path)
+        self.db = MetricsDB(":memory:")
         self.report_dir = tempfile.mkdtemp()
 
         # Inserir dados mínimos para gerar relatório
@@ -766,8 +1256,6 @@ class TestReportNotasPerSiem(unittest.TestCase):
 
     def tearDown(self):
         self.db.close()
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
         import shutil
         shutil.rmtree(self.report_dir, ignore_errors=True)
 
@@ -781,6 +1269,77 @@ class TestReportNotasPerSiem(unittest.TestCase):
         with open(txt_files[0], "r", encoding="utf-8") as f:
             return f.read()
 
+    def test_aggregates_queried_once_per_report_run(self):
+        """Resumo diário e média geral: uma consulta cada por generate_all_reports()."""
+        rpt = ReportGenerator(self.db, self.report_dir, siem_name="qradar")
+        with patch.object(self.db, "get_daily_summary", wraps=self.db.get_daily_summary) as daily, \
+             patch.object(self.db, "get_overall_daily_average",
+                          wraps=self.db.get_overall_daily_average) as overall:
+            rpt.generate_all_reports()
+            self.assertEqual((daily.call_count, overall.call_count), (1, 1))
+            rpt.generate_all_reports()  # nova geração relê o banco
+            self.assertEqual((daily.call_count, overall.call_count), (2, 2))
+
+    def test_parallel_generation_reuses_caller_connection(self):
+        """Geradores em paralelo não abrem conexões SQLite nas threads do pool."""
+        import glob
+        connections = len(self.db._connections)
+        ReportGenerator(self.db, self.report_dir, siem_name="qradar").generate_all_reports()
+        self.assertEqual(len(self.db._connections), connections)
+        self.assertEqual(len(glob.glob(os.path.join(self.report_dir, "qradar_*"))), 3)
+
+    def test_generator_failure_propagates(self):
+        rpt = ReportGenerator(self.db, self.report_dir, siem_name="qradar")
+        with patch.object(rpt, "_generate_summary_csv", side_effect=OSError("disco cheio")):
+            with self.assertRaises(OSError):
+                rpt.generate_all_reports()
+        self.assertIsNone(rpt._query_cache)
+
+    def test_text_report_groups_sources_under_their_day(self):
+        """Cada dia lista só as próprias fontes; dia sem dados sai com total zero."""
+        for date, ls_id, name in (("2025-01-16", 2, "outra"), ("2025-01-17", None, None)):
+            run_id = self.db.save_collection_run(f"{date}T10:00:00", date, 1.0)
+            if ls_id:
+                self.db.save_event_metrics(
+                    run_id, f"{date}T10:00:00", date, 0, 3600000, 3600.0,
+                    [{"logsourceid": ls_id, "log_source_name": name, "total_event_count": 7}], 1.0,
+                )
+        txt = self._get_report_text("qradar")
+        blocks = txt.split("│  DATA: ")[1:]
+        self.assertEqual([b.split()[0] for b in blocks], ["2025-01-15", "2025-01-16", "2025-01-17"])
+        self.assertIn("│ test ", blocks[0])
+        self.assertNotIn("│ outra ", blocks[0])
+        self.assertIn("│ outra ", blocks[1])
+        self.assertNotIn("│ test ", blocks[1])
+        self.assertIn("Total de Eventos:               0", blocks[2])
+
+    def test_daily_csv_rows(self):
+        """CSV diário: cabeçalho + uma linha por (dia, source) com valores formatados."""
+        import csv
+        import glob
+        rpt = ReportGenerator(self.db, self.report_dir, siem_name="qradar",
+                              include_unparsed=True, include_aggregated=True)
+        rpt.generate_all_reports()
+        daily = glob.glob(os.path.join(self.report_dir, "qradar_daily_report_*.csv"))
+        with open(daily[0], newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.reader(f, delimiter=";"))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(rows[1]), len(rows[0]))
+        self.assertEqual(rows[1][:7], ["2025-01-15", "1", "test", "syslog", "10", "10", "1.00"])
+        self.assertEqual(rows[1][-2:], ["10.00", "1"])
+
+    def test_format_bytes_units(self):
+        fmt = ReportGenerator(self.db, self.report_dir)._format_bytes
+        self.assertEqual(fmt(None), "0 B")
+        self.assertEqual(fmt(0), "0 B")
+        self.assertEqual(fmt(0.5), "0.50 B")
+        self.assertEqual(fmt(1023), "1023.00 B")
+        self.assertEqual(fmt(1024), "1.00 KB")
+        self.assertEqual(fmt(1024 ** 2 - 1e-9), "1024.00 KB")
+        self.assertEqual(fmt(5 * 1024 ** 3), "5.00 GB")
+        self.assertEqual(fmt(-2048), "-2.00 KB")
+        self.assertEqual(fmt(3 * 1024 ** 6), "3072.00 PB")
+
     def test_qradar_notas(self):
         txt = self._get_report_text("qradar")
         self.assertIn("Ariel", txt)
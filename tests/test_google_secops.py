@@ -13,6 +13,7 @@ Execução:
     python -m unittest tests.test_google_secops -v
 """
 
+import io
 import json
 import os
 import sys
@@ -26,21 +27,33 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from collectors.google_secops.client import (
     BACKSTORY_ENDPOINTS,
+    RATE_LIMIT_RETRY_AFTER_MAX,
     SCOPES,
     UDM_SEARCH_MAX_EVENTS,
     UDM_SEARCH_TIMEOUT,
     GoogleSecOpsClient,
+    QuotaWaitInterrupted,
+    _iter_stream_metadata,
+    _metadata_key,
+    _ms_to_iso,
     collect_inventory,
+    collect_inventory_multi,
     create_sample_config,
     update_inventory_from_results,
 )
 from core.db import MetricsDB
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 
 # ─── Helper: build a GoogleSecOpsClient with token auth (no real HTTP) ───────
 def _make_client(**kwargs):
     """Cria um GoogleSecOpsClient com token fake para testes."""
-    defaults = {"token": "fake-token", "region": "us", "verify_ssl": False}
+    defaults = {"token": "fake-token", "region": "us", "verify_ssl": False,
+                "stream_json": False}
     defaults.update(kwargs)
     return GoogleSecOpsClient(**defaults)
 
@@ -60,6 +73,21 @@ class TestGoogleSecOpsAuth(unittest.TestCase):
             client.session.headers["Authorization"], "Bearer my_token_123"
         )
 
+    def test_session_requests_gzip(self):
+        """Sessão deve anunciar compressão gzip para as respostas UDM."""
+        client = _make_client()
+        self.assertEqual(client.session.headers["Accept-Encoding"], "gzip")
+        self.assertEqual(client.session.headers["Accept"], "application/json")
+
+    def test_https_adapter_pool_sized_for_slices(self):
+        """Pool HTTPS comporta as sub-janelas paralelas sem fila no urllib3."""
+        from collectors.google_secops.client import HTTP_POOL_MAXSIZE, UDM_SEARCH_MAX_PARALLEL
+        client = _make_client()
+        adapter = client.session.get_adapter("https://backstory.googleapis.com")
+        self.assertEqual(adapter._pool_maxsize, HTTP_POOL_MAXSIZE)
+        self.assertGreaterEqual(HTTP_POOL_MAXSIZE, UDM_SEARCH_MAX_PARALLEL)
+        self.assertEqual(adapter.max_retries.total, 0)
+
     def test_no_credentials_raises(self):
         """Sem credenciais deve levantar ValueError."""
         with self.assertRaises(ValueError) as ctx:
@@ -91,6 +119,27 @@ class TestGoogleSecOpsAuth(unittest.TestCase):
                 client._init_service_account("/fake/sa.json")
             self.assertIn("google-auth", str(ctx.exception))
 
+    def test_sa_credentials_cached_across_clients(self):
+        """Mesmo arquivo/scopes reaproveita as credenciais; arquivo alterado recarrega."""
+        from collectors.google_secops.client import _SA_CACHE, _load_sa_credentials
+        fake_cls = MagicMock()
+        fd, sa_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            first = _load_sa_credentials(fake_cls, sa_path, tuple(SCOPES))
+            second = _load_sa_credentials(fake_cls, sa_path, tuple(SCOPES))
+            self.assertIs(first, second)
+            fake_cls.from_service_account_file.assert_called_once_with(
+                os.path.abspath(sa_path), scopes=SCOPES,
+            )
+            st = os.stat(sa_path)
+            os.utime(sa_path, (st.st_atime, st.st_mtime + 10))
+            _load_sa_credentials(fake_cls, sa_path, tuple(SCOPES))
+            self.assertEqual(fake_cls.from_service_account_file.call_count, 2)
+        finally:
+            os.unlink(sa_path)
+            _SA_CACHE.clear()
+
     def test_region_sets_base_url(self):
         """Region deve selecionar o endpoint correto."""
         client = _make_client(region="southamerica-east1")
@@ -145,6 +194,137 @@ class TestCheckResponse(unittest.TestCase):
         self.client._check_response(resp, "v1/events:udmSearch")
         resp.raise_for_status.assert_called_once()
 
+    def test_429_attaches_retry_after(self):
+        resp = MagicMock()
+        resp.status_code = 429
+        resp.headers = {"Retry-After": "17"}
+        with self.assertRaises(requests.exceptions.HTTPError) as ctx:
+            self.client._check_response(resp, "v1/events:udmSearch")
+        self.assertEqual(ctx.exception.retry_after, 17.0)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 2b. HTTP 429 — Retry-After + full jitter em _get
+# ─────────────────────────────────────────────────────────────────────────────
+class TestRateLimitRetry(unittest.TestCase):
+    """Verifica o loop de retry específico para HTTP 429."""
+
+    def _resp(self, status, headers=None, body=None):
+        resp = MagicMock()
+        resp.status_code = status
+        resp.headers = headers or {}
+        resp.content = json.dumps(body or {}).encode()
+        return resp
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=False)
+    def test_429_honors_retry_after(self, mock_sleep):
+        client = _make_client()
+        responses = [self._resp(429, {"Retry-After": "20"}), self._resp(200, body={"events": []})]
+        with patch.object(client.session, "get", side_effect=responses):
+            result = client._get("v1/events:udmSearch")
+        self.assertEqual(result, {"events": []})
+        # Retry-After (20s) domina o jitter (<= 1s na primeira tentativa)
+        mock_sleep.assert_called_once_with(20.0)
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=False)
+    def test_429_jitter_bounded_without_header(self, mock_sleep):
+        client = _make_client()
+        responses = [self._resp(429), self._resp(429), self._resp(200)]
+        with patch.object(client.session, "get", side_effect=responses):
+            client._get("v1/events:udmSearch")
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertLessEqual(delays[0], 1.0)
+        self.assertLessEqual(delays[1], 2.0)
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=False)
+    @patch("core.utils.time.sleep", return_value=None)
+    def test_429_exhausted_not_retried_by_outer_layer(self, _outer_sleep, _wait):
+        from collectors.google_secops.client import RATE_LIMIT_MAX_ATTEMPTS
+        client = _make_client()
+        with patch.object(client.session, "get", return_value=self._resp(429)) as mock_get:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client._get("v1/events:udmSearch")
+        self.assertEqual(mock_get.call_count, RATE_LIMIT_MAX_ATTEMPTS + 1)
+        self.assertEqual(client.rate_limit_stats.as_dict()["http_429"], RATE_LIMIT_MAX_ATTEMPTS + 1)
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=False)
+    def test_429_long_retry_after_capped_and_response_closed(self, mock_wait):
+        """Retry-After enorme é limitado; a resposta 429 é fechada antes da espera."""
+        client = _make_client()
+        throttled = self._resp(429, {"Retry-After": "86400"})
+        responses = [throttled, self._resp(200, body={"events": []})]
+        with patch.object(client.session, "get", side_effect=responses):
+            self.assertEqual(client._get("v1/events:udmSearch"), {"events": []})
+        mock_wait.assert_called_once_with(RATE_LIMIT_RETRY_AFTER_MAX)
+        throttled.close.assert_called_once()
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=True)
+    def test_429_wait_aborts_on_stop(self, mock_wait):
+        """SIGINT/SIGTERM durante a espera do 429 aborta sem nova tentativa."""
+        client = _make_client()
+        with patch.object(client.session, "get", return_value=self._resp(429)) as mock_get:
+            with self.assertRaises(QuotaWaitInterrupted):
+                client._get("v1/events:udmSearch")
+        self.assertEqual(mock_get.call_count, 1)
+        mock_wait.assert_called_once()
+
+    @patch("collectors.google_secops.client.wait_for_stop")
+    @patch("collectors.google_secops.client.time.monotonic")
+    def test_client_side_quota_throttles_before_sending(self, mock_clock, mock_wait):
+        """Com a cota da janela de 1h esgotada, espera (fora do lock) antes de enviar."""
+        client = _make_client(rate_limit_per_hour=2)
+        mock_clock.side_effect = [0.0, 10.0, 20.0, 3601.0]
+        # Registra se o lock estava preso durante a espera (deve estar livre)
+        mock_wait.side_effect = lambda _delay: client._rate_lock.locked()
+        with patch.object(client.session, "get", return_value=self._resp(200)) as mock_get:
+            client._get("v1/events:udmSearch")
+            client._get("v1/events:udmSearch")
+            client._get("v1/events:udmSearch")
+        self.assertEqual(mock_get.call_count, 3)
+        mock_wait.assert_called_once()
+        # 3600 - (20 - 0) + jitter em [0, 1)
+        self.assertGreaterEqual(mock_wait.call_args[0][0], 3580.0)
+        self.assertLess(mock_wait.call_args[0][0], 3581.0)
+        self.assertEqual(client.rate_limit_stats.as_dict(), {"throttle_preventivo": 1})
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=True)
+    @patch("collectors.google_secops.client.time.monotonic", return_value=0.0)
+    def test_client_side_quota_wait_aborts_on_stop(self, mock_clock, mock_wait):
+        """SIGINT/SIGTERM durante a espera por cota aborta sem enviar."""
+        client = _make_client(rate_limit_per_hour=1)
+        with patch.object(client.session, "get", return_value=self._resp(200)) as mock_get:
+            client._get("v1/events:udmSearch")
+            with self.assertRaises(QuotaWaitInterrupted):
+                client._get("v1/events:udmSearch")
+        self.assertEqual(mock_get.call_count, 1)
+        mock_wait.assert_called_once()
+        self.assertFalse(client._rate_lock.locked())
+
+    @patch("core.utils.time.sleep", return_value=None)
+    def test_quota_acquired_once_per_request_across_5xx_retries(self, mock_sleep):
+        """Retry de 5xx não consome (nem espera por) uma nova cota."""
+        client = _make_client(rate_limit_per_hour=10)
+        unavailable = self._resp(503)
+        unavailable.raise_for_status.side_effect = requests.exceptions.HTTPError(
+            "503 Service Unavailable", response=unavailable
+        )
+        responses = [unavailable, self._resp(200, body={"events": []})]
+        with patch.object(client.session, "get", side_effect=responses) as mock_get:
+            result = client._get("v1/events:udmSearch")
+        self.assertEqual(result, {"events": []})
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(len(client._call_log), 1)
+
+    @patch("collectors.google_secops.client.wait_for_stop", return_value=False)
+    def test_client_side_quota_disabled(self, mock_sleep):
+        client = _make_client(rate_limit_per_hour=0)
+        with patch.object(client.session, "get", return_value=self._resp(200)):
+            for _ in range(5):
+                client._get("v1/events:udmSearch")
+        mock_sleep.assert_not_called()
+        self.assertEqual(len(client._call_log), 0)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 3. test_connection
@@ -199,6 +379,35 @@ class TestTestConnection(unittest.TestCase):
             with self.assertRaises(requests.exceptions.ConnectionError):
                 client.test_connection()
 
+    def test_connection_cached_within_ttl(self):
+        """Segunda chamada dentro do TTL não consome outra UDM Search."""
+        client = _make_client()
+        with patch.object(client, "_get", return_value={"events": []}) as mock_get:
+            first = client.test_connection()
+            second = client.test_connection()
+            self.assertEqual(first, second)
+            mock_get.assert_called_once()
+            client.test_connection(force=True)
+            self.assertEqual(mock_get.call_count, 2)
+
+    def test_connection_cache_expires(self):
+        client = _make_client(test_cache_ttl=0)
+        with patch.object(client, "_get", return_value={"events": []}) as mock_get:
+            client.test_connection()
+            client.test_connection()
+            self.assertEqual(mock_get.call_count, 2)
+
+    def test_connection_failure_not_cached(self):
+        client = _make_client()
+        with patch.object(
+            client, "_get",
+            side_effect=[requests.exceptions.ConnectionError("DNS fail"), {"events": []}],
+        ) as mock_get:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                client.test_connection()
+            client.test_connection()
+            self.assertEqual(mock_get.call_count, 2)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 4. UDM Search
@@ -342,6 +551,22 @@ class TestGetEventMetricsWindow(unittest.TestCase):
             self.assertEqual(len(metrics), 1)
             self.assertEqual(metrics[0]["aggregated_event_count"], 5)
 
+    def test_same_product_different_vendor_single_row(self):
+        """Mesmo log_type|product com vendors distintos deve gerar 1 linha (ID único)."""
+        events = [
+            self._make_event("SYSLOG", "Linux", "Canonical"),
+            self._make_event("SYSLOG", "Linux", "RedHat"),
+            self._make_event("SYSLOG", "Linux", "Canonical"),
+        ]
+        with patch.object(
+            self.client, "udm_search",
+            return_value={"events": events, "moreDataAvailable": False},
+        ):
+            metrics = self.client.get_event_metrics_window(1000, 2000)
+        self.assertEqual(len(metrics), 1)
+        self.assertEqual(metrics[0]["aggregated_event_count"], 3)
+        self.assertEqual(metrics[0]["log_source_name"], "Linux (Canonical)")
+
     def test_unknown_vendor_format(self):
         """Vendor 'Unknown' não deve aparecer no log_source_name."""
         events = [self._make_event("CUSTOM_LOG", "MyApp", "Unknown")]
@@ -385,6 +610,187 @@ class TestGetEventMetricsWindow(unittest.TestCase):
             self.assertIn("2025-06-01T12:00:00Z", start_iso)
             self.assertIn("2025-06-01T13:00:00Z", end_iso)
 
+    def test_ms_to_iso_truncates_millis(self):
+        """_ms_to_iso usa UTC e descarta milissegundos (sem arredondar)."""
+        self.assertEqual(_ms_to_iso(0), "1970-01-01T00:00:00Z")
+        self.assertEqual(_ms_to_iso(1748779200999), "2025-06-01T12:00:00Z")
+
+    def test_iter_event_metrics_window_is_lazy(self):
+        """Versão iterador produz as mesmas métricas; None em caso de falha."""
+        events = {"events": [
+            {"udm": {"metadata": {"logType": "FW", "productName": "PA"}}},
+            {"udm": {"metadata": {"logType": "DNS", "productName": "Bind"}}},
+        ]}
+        with patch.object(self.client, "udm_search", return_value=events):
+            it = self.client.iter_event_metrics_window(0, 3600000)
+            expected = self.client.get_event_metrics_window(0, 3600000)
+        self.assertNotIsInstance(it, list)
+        self.assertEqual(list(it), expected)
+        with patch.object(self.client, "udm_search", return_value=None):
+            self.assertIsNone(self.client.iter_event_metrics_window(0, 3600000))
+
+    def test_events_without_udm_metadata_count_as_unknown(self):
+        """Eventos sem ``udm``/``metadata`` continuam contados (UNKNOWN)."""
+        events = {"events": [
+            {"udm": {"metadata": {"logType": "FW", "productName": "PA"}}},
+            {"udm": {}},
+            {},
+        ]}
+        with patch.object(self.client, "udm_search", return_value=events):
+            metrics = self.client.get_event_metrics_window(0, 3600000)
+        counts = {m["log_source_type"]: m["total_event_count"] for m in metrics}
+        self.assertEqual(counts, {"FW": 1, "UNKNOWN": 2})
+
+    def test_metadata_key_interned(self):
+        """Strings iguais de eventos distintos viram o mesmo objeto."""
+        a = _metadata_key(json.loads('{"logType": "WINEVTLOG", "productName": "Win"}'))
+        b = _metadata_key(json.loads('{"log_type": "WINEVTLOG", "product_name": "Win"}'))
+        self.assertEqual(a, ("WINEVTLOG", "Win", "Unknown"))
+        self.assertIs(a[0], b[0])
+        self.assertIs(a[1], b[1])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5b. slice_minutes — sub-janelas em paralelo
+# ─────────────────────────────────────────────────────────────────────────────
+class TestSlicedWindow(unittest.TestCase):
+    """Verifica divisão da janela em sub-janelas e merge dos resultados."""
+
+    def _event(self, log_type):
+        return {"udm": {"metadata": {"logType": log_type, "productName": "P"}}}
+
+    def test_split_window_contiguous(self):
+        client = _make_client(slice_minutes=15)
+        slices = client._split_window(0, 3600000)
+        self.assertEqual(len(slices), 4)
+        self.assertEqual(slices[0], (0, 900000))
+        self.assertEqual(slices[-1], (2700000, 3600000))
+        for (_, a_end), (b_start, _) in zip(slices, slices[1:]):
+            self.assertEqual(a_end, b_start)
+
+    def test_split_window_disabled(self):
+        client = _make_client()
+        self.assertIsNone(client.slice_minutes)
+        self.assertEqual(client._split_window(0, 3600000), [(0, 3600000)])
+
+    def test_slices_merged_before_aggregation(self):
+        client = _make_client(slice_minutes=30)
+        results = [
+            {"events": [self._event("A"), self._event("B")]},
+            {"events": [self._event("A")], "moreDataAvailable": False},
+        ]
+        with patch.object(client, "udm_search", side_effect=results) as mock:
+            metrics = client.get_event_metrics_window(0, 3600000)
+        self.assertEqual(mock.call_count, 2)
+        counts = {m["log_source_type"]: m["aggregated_event_count"] for m in metrics}
+        self.assertEqual(counts, {"A": 2, "B": 1})
+
+    def test_failed_slice_returns_none(self):
+        client = _make_client(slice_minutes=30)
+        with patch.object(client, "udm_search", side_effect=[{"events": []}, None]):
+            self.assertIsNone(client.get_event_metrics_window(0, 3600000))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5c. stream_json — parsing incremental com ijson
+# ─────────────────────────────────────────────────────────────────────────────
+@unittest.skipIf(ijson is None, "ijson não instalado")
+class TestStreamingMetadata(unittest.TestCase):
+    """Verifica a agregação direto do stream, sem materializar os eventos."""
+
+    BODY = json.dumps({
+        "events": [
+            {"udm": {"metadata": {"logType": "FW", "productName": "PA",
+                                  "vendorName": "Palo", "extra": {"x": 1}},
+                     "principal": {"ip": ["10.0.0.1"]}}},
+            {"udm": {"metadata": {"log_type": "FW", "product_name": "PA"}}},
+            {"udm": {}},
+        ],
+        "moreDataAvailable": True,
+    }).encode()
+
+    def test_iter_stream_metadata(self):
+        state = {}
+        items = list(_iter_stream_metadata(io.BytesIO(self.BODY), state))
+        self.assertEqual(len(items), 3)
+        self.assertEqual(items[0], {"logType": "FW", "productName": "PA", "vendorName": "Palo"})
+        self.assertEqual(items[2], {})
+        self.assertTrue(state["moreDataAvailable"])
+
+    def test_window_from_stream(self):
+        client = _make_client(stream_json=True)
+        resp = MagicMock(status_code=200)
+        resp.raw = io.BytesIO(self.BODY)
+        with patch.object(client.session, "get", return_value=resp) as mock_get:
+            metrics = client.get_event_metrics_window(0, 3600000)
+        self.assertTrue(mock_get.call_args[1]["stream"])
+        resp.close.assert_called_once()
+        counts = {m["log_source_type"]: m["aggregated_event_count"] for m in metrics}
+        self.assertEqual(counts, {"FW": 2, "UNKNOWN": 1})
+
+    def test_stream_error_returns_none(self):
+        client = _make_client(stream_json=True)
+        resp = MagicMock(status_code=200)
+        resp.raw = io.BytesIO(b'{"events": [{"udm"')
+        with patch.object(client.session, "get", return_value=resp):
+            self.assertIsNone(client.get_event_metrics_window(0, 3600000))
+
+    def test_stream_json_requires_ijson(self):
+        with patch("collectors.google_secops.client.ijson", None):
+            with self.assertRaises(ImportError):
+                _make_client(stream_json=True)
+            self.assertFalse(_make_client(stream_json=None).stream_json)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 5d. stats_search — agregação no servidor com fallback
+# ─────────────────────────────────────────────────────────────────────────────
+class TestStatsSearch(unittest.TestCase):
+    """Verifica a statistics search e o fallback para lista de eventos."""
+
+    STATS = {"stats": {"results": [
+        {"column": "metadata.log_type",
+         "values": [{"value": {"stringVal": "FW"}}, {"value": {"stringVal": "DNS"}}]},
+        {"column": "metadata.product_name",
+         "values": [{"value": {"stringVal": "PA"}}, {}]},
+        {"column": "metadata.vendor_name",
+         "values": [{"value": {"stringVal": "Palo"}}, {}]},
+        {"column": "event_count",
+         "values": [{"value": {"int64Val": "25000"}}, {"value": {"int64Val": "7"}}]},
+    ]}}
+
+    def test_stats_rows_normalized(self):
+        client = _make_client(stats_search=True)
+        with patch.object(client, "_get", return_value=self.STATS) as mock_get, \
+                patch.object(client, "udm_search") as mock_udm:
+            metrics = client.get_event_metrics_window(0, 3600000)
+        mock_udm.assert_not_called()
+        self.assertIn("match:", mock_get.call_args[1]["params"]["query"])
+        rows = {m["log_source_type"]: m for m in metrics}
+        self.assertEqual(rows["FW"]["total_event_count"], 25000)
+        self.assertEqual(rows["FW"]["log_source_name"], "PA (Palo)")
+        self.assertEqual(rows["DNS"]["log_source_name"], "Unknown")
+
+    def test_unsupported_falls_back_and_disables(self):
+        client = _make_client(stats_search=True)
+        resp = MagicMock(status_code=400)
+        err = requests.exceptions.HTTPError(response=resp)
+        events = {"events": [{"udm": {"metadata": {"logType": "FW"}}}]}
+        with patch.object(client, "_get", side_effect=err), \
+                patch.object(client, "udm_search", return_value=events) as mock_udm:
+            metrics = client.get_event_metrics_window(0, 3600000)
+        mock_udm.assert_called_once()
+        self.assertEqual(metrics[0]["total_event_count"], 1)
+        self.assertFalse(client.stats_search)
+
+    def test_response_without_stats_falls_back(self):
+        client = _make_client(stats_search=True)
+        with patch.object(client, "_get", return_value={"events": []}), \
+                patch.object(client, "udm_search", return_value={"events": []}) as mock_udm:
+            self.assertEqual(client.get_event_metrics_window(0, 3600000), [])
+        mock_udm.assert_called_once()
+        self.assertFalse(client.stats_search)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 6. get_log_types
@@ -443,13 +849,10 @@ class TestInventory(unittest.TestCase):
     """Testa collect_inventory e update_inventory_from_results."""
 
     def setUp(self):
-        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
-        self.db = MetricsDB(self.db_path)
+        self.db = MetricsDB(":memory:")
 
     def tearDown(self):
         self.db.close()
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
 
     def test_collect_inventory_saves_to_db(self):
         client = _make_client()
@@ -479,6 +882,24 @@ class TestInventory(unittest.TestCase):
             count = collect_inventory(client, self.db)
             self.assertEqual(count, 0)
 
+    def test_collect_inventory_multi_regions(self):
+        """Várias regiões em paralelo; uma falha não derruba as demais."""
+        us = _make_client(region="us")
+        eu = _make_client(region="europe")
+        br = _make_client(region="southamerica-east1")
+        with patch.object(us, "get_log_types", return_value=["WINDOWS_EVENT", "GCP_DNS"]), \
+                patch.object(eu, "get_log_types", return_value=["WINDOWS_EVENT"]), \
+                patch.object(br, "get_log_types", side_effect=RuntimeError("API down")):
+            counts = collect_inventory_multi([us, eu, br], self.db)
+        self.assertEqual(counts, {"us": 2, "europe": 1, "southamerica-east1": 0})
+
+        cursor = self.db.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM log_sources_inventory")
+        self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_collect_inventory_multi_empty(self):
+        self.assertEqual(collect_inventory_multi([], self.db), {})
+
     def test_update_inventory_from_results(self):
         """Callback deve atualizar inventário com sources dos resultados."""
         metrics = [
@@ -567,6 +988,17 @@ class TestSecOpsConstants(unittest.TestCase):
         """Deve ter 19 endpoints regionais conforme documentação."""
         self.assertEqual(len(BACKSTORY_ENDPOINTS), 19)
 
+    def test_backstory_endpoints_read_only(self):
+        with self.assertRaises(TypeError):
+            BACKSTORY_ENDPOINTS["us"] = "https://example.invalid"  # type: ignore[index]
+
+    def test_search_url_precomputed(self):
+        client = _make_client(region="europe")
+        self.assertEqual(
+            client._search_url,
+            "https://europe-backstory.googleapis.com/v1/events:udmSearch",
+        )
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 10. _stable_id — logsourceid determinístico
@@ -11,41 +11,153 @@ Execução:
     python -m unittest tests.test_qradar -v
 """
 
+import io
 import json
 import os
+import ssl
 import sys
+import threading
+import time
 import unittest
+from urllib.parse import urlsplit
 from unittest.mock import MagicMock, patch
 
 import requests
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from collectors.qradar.client import (
-    AQL_POLL_INTERVAL,
+    ACCEPT_ENCODING,
+    AQL_LAST_MAX_LAG_MINUTES,
+    AQL_LAST_SLACK_MINUTES,
+    AQL_POLL_BACKOFF,
+    AQL_POLL_INITIAL_DELAY,
+    AQL_POLL_MAX_DELAY,
+    AQL_PREFER_WAIT,
+    AQL_RESULT_PAGE,
     AQL_TIMEOUT_SECONDS,
     ARIEL_MAX_RESULTS,
+    LOG_SOURCE_NAMES_REFRESH_SECONDS,
+    LOG_SOURCE_TYPES_REFRESH_SECONDS,
+    AQLQueryRejected,
     QRadarClient,
+    _TYPES_CACHE,
+    _TypeMap,
+    _validate_json_response,
     collect_inventory,
     create_sample_config,
 )
+from core.db import MetricsDB
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────────────────────────────────────
+_EMPTY_JSON = "{}"
+
+
+class _FakeResponse:
+    """Dublê leve de requests.Response (sem a instrumentação do MagicMock).
+
+    O corpo só é serializado quando ``text``/``content`` é lido — muitos
+    dublês (status de polling, erros HTTP) nunca têm o corpo consumido.
+    """
+
+    __slots__ = ("status_code", "_json_data", "_text", "headers", "raw")
+
+    def __init__(self, status_code, json_data, text, headers):
+        self.status_code = status_code
+        self._json_data = json_data
+        self._text = text
+        self.headers = headers
+        self.raw = None
+
+    @property
+    def text(self):
+        if not self._text:
+            self._text = json.dumps(self._json_data) if self._json_data else _EMPTY_JSON
+        return self._text
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self):
+        return self._json_data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def close(self):
+        pass
+
+
 def _make_mock_response(status_code=200, json_data=None, text="", headers=None):
-    """Cria um mock de requests.Response."""
-    resp = MagicMock()
-    resp.status_code = status_code
-    resp.json.return_value = json_data or {}
-    resp.text = text or json.dumps(json_data or {})
-    resp.headers = headers or {}
-    resp.raise_for_status = MagicMock()
-    if status_code >= 400:
-        http_error = requests.exceptions.HTTPError(response=resp)
-        resp.raise_for_status.side_effect = http_error
-    return resp
+    """Cria um dublê de requests.Response."""
+    return _FakeResponse(status_code, json_data or {}, text, headers or {})
+
+
+# Nenhum teste deste módulo depende de espera real: durante o módulo,
+# time.sleep vira no-op simples (sem o custo de um MagicMock por chamada).
+# Testes que verificam os delays continuam aplicando o próprio patch.
+_REAL_SLEEP = time.sleep
+
+
+def setUpModule():
+    time.sleep = lambda *_args, **_kwargs: None
+
+
+def tearDownModule():
+    time.sleep = _REAL_SLEEP
+
+
+def _assert_fragments(test, text, required=(), forbidden=()):
+    """Checa todos os trechos de uma vez e falha listando todos os divergentes."""
+    missing = [fragment for fragment in required if fragment not in text]
+    present = [fragment for fragment in forbidden if fragment in text]
+    if missing or present:
+        test.fail(f"ausentes={missing} proibidos={present} em: {text}")
+
+
+class _StubAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter que serve respostas pré-registradas por método + path.
+
+    Montado na sessão do client, substitui a rede no nível do adapter: o
+    client percorre o caminho real do ``requests`` (headers, stream, retry).
+    Respostas registradas para a mesma rota saem em ordem; a última se repete.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._routes = {}
+        self.calls = []
+
+    def add(self, method, path, json_data, status=200):
+        body = json.dumps(json_data).encode("utf-8")
+        self._routes.setdefault((method, path), []).append((status, body))
+
+    def send(self, request, **kwargs):
+        self.calls.append(request)
+        queue = self._routes[(request.method, urlsplit(request.url).path)]
+        status, body = queue.pop(0) if len(queue) > 1 else queue[0]
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers = requests.structures.CaseInsensitiveDict(
+            {"Content-Type": "application/json"}
+        )
+        resp.raw = io.BytesIO(body)
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -54,43 +166,229 @@ def _make_mock_response(status_code=200, json_data=None, text="", headers=None):
 class TestAQLQueries(unittest.TestCase):
     """Verifica que as queries AQL usam as funções e cláusulas corretas."""
 
-    def setUp(self):
-        self.client = QRadarClient(
+    @classmethod
+    def setUpClass(cls):
+        cls.client = QRadarClient(
             "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
         )
 
+    def setUp(self):
+        # Estado por instância volta ao inicial a cada teste (client compartilhado)
+        self.client._supports_unparsed = None
+        # Nomes resolvidos localmente: inventário e tipos já "carregados"
+        # (paginação recente, então ids desconhecidos não re-paginam)
+        self.client._log_source_names = {1: "Source-1"}
+        self.client._log_source_names_refreshed = time.monotonic()
+        self.client._log_source_types_refreshed = time.monotonic()
+        types_patcher = patch.object(self.client, "_cached_log_source_types", return_value=_TypeMap())
+        types_patcher.start()
+        self.addCleanup(types_patcher.stop)
+
+    @patch.object(QRadarClient, "iter_aql_query", return_value=[])
     @patch.object(QRadarClient, "run_aql_query", return_value=[])
-    def test_event_metrics_uses_devicetype_in_logsourcetypename(self, mock_aql):
-        """LOGSOURCETYPENAME deve receber devicetype, não logsourceid."""
+    def test_event_metrics_aql_shape(self, mock_run, mock_iter):
+        """Forma do AQL: ids projetados (nomes resolvidos localmente), janela
+        half-open ``starttime >= start AND starttime < end`` e GROUP BY por
+        logsourceid + devicetype; o método deprecated também usa devicetype."""
+        cases = (
+            ("metrics", self.client.get_event_metrics_window, (1000000, 2000000), mock_iter,
+             ("SELECT logsourceid, devicetype,", "starttime >= 1000000",
+              "starttime < 2000000", "GROUP BY logsourceid, devicetype"),
+             ("LOGSOURCENAME", "LOGSOURCETYPENAME", "BETWEEN")),
+            ("deprecated", self.client.get_event_counts_by_logsource, (1000, 2000), mock_run,
+             ("LOGSOURCETYPENAME(devicetype)", "GROUP BY logsourceid, devicetype"),
+             ()),
+        )
+        for name, method, args, mock_aql, required, forbidden in cases:
+            with self.subTest(case=name):
+                mock_aql.reset_mock()
+                method(*args)
+                aql = mock_aql.call_args_list[0][0][0]
+                _assert_fragments(self, aql, required)
+                _assert_fragments(self, aql.upper(), forbidden=forbidden)
+
+    @patch.object(QRadarClient, "iter_aql_query")
+    def test_event_metrics_names_resolved_locally(self, mock_aql):
+        """Nome vem do inventário e tipo do mapa de tipos (devicetype → nome)."""
+        mock_aql.return_value = [
+            {"logsourceid": 7, "devicetype": 12, "total_event_count": 5},
+            {"logsourceid": 8, "devicetype": 99, "total_event_count": 1},
+        ]
+        self.client._log_source_names = {7: "FW-Borda"}
+        with patch.object(self.client, "_cached_log_source_types",
+                          return_value=_TypeMap({12: "Cisco ASA"})):
+            rows = self.client.get_event_metrics_window(1000, 2000)
+        self.assertEqual(rows[0]["log_source_name"], "FW-Borda")
+        self.assertEqual(rows[0]["log_source_type"], "Cisco ASA")
+        self.assertIsNone(rows[1]["log_source_name"])  # sem nome: placeholder só no relatório
+        self.assertIsNone(rows[1]["log_source_type"])  # idem para o tipo
+        self.assertNotIn("devicetype", rows[0])
+
+    @patch.object(QRadarClient, "iter_aql_query", return_value=[{"logsourceid": 3, "devicetype": 1}])
+    def test_event_metrics_loads_inventory_names_once(self, _mock_aql):
+        """Sem inventário nesta instância, as log sources são paginadas uma única vez."""
+        self.client._log_source_names = {}
+        self.client._log_source_names_refreshed = None
+        with patch.object(self.client, "_iter_paginated",
+                          return_value=iter([[{"id": 3, "name": "DNS-1"}]])) as mock_pages:
+            rows = self.client.get_event_metrics_window(1000, 2000)
+            self.client.get_event_metrics_window(2000, 3000)
+        self.assertEqual(rows[0]["log_source_name"], "DNS-1")
+        mock_pages.assert_called_once()
+
+    @patch.object(QRadarClient, "iter_aql_query")
+    def test_unknown_id_refreshes_names_rate_limited(self, mock_aql):
+        """Id fora do mapa (fonte nova) re-pagina as log sources, no máximo uma vez por intervalo."""
+        mock_aql.return_value = [{"logsourceid": 1}, {"logsourceid": 42}]
+        self.client._log_source_names_refreshed = 0.0
+        pages = [[{"id": 1, "name": "Source-1"}, {"id": 42, "name": "Nova-Fonte"}]]
+        clock = [LOG_SOURCE_NAMES_REFRESH_SECONDS + 1.0]
+        with patch.object(self.client, "_iter_paginated",
+                          side_effect=lambda *a, **k: iter(pages)) as mock_pages, \
+             patch("collectors.qradar.client.time.monotonic", side_effect=lambda: clock[0]):
+            rows = self.client.get_event_metrics_window(1000, 2000)
+            self.assertEqual([r["log_source_name"] for r in rows], ["Source-1", "Nova-Fonte"])
+            self.assertEqual(mock_pages.call_count, 1)
+
+            # Id ainda desconhecido dentro do intervalo: sem nova paginação
+            mock_aql.return_value = [{"logsourceid": 77}]
+            clock[0] += LOG_SOURCE_NAMES_REFRESH_SECONDS - 1
+            self.assertIsNone(self.client.get_event_metrics_window(2000, 3000)[0]["log_source_name"])
+            self.assertEqual(mock_pages.call_count, 1)
+
+            # Passado o intervalo, tenta de novo
+            mock_aql.return_value = [{"logsourceid": 77}]
+            clock[0] += 2
+            self.client.get_event_metrics_window(3000, 4000)
+            self.assertEqual(mock_pages.call_count, 2)
+
+    @patch.object(QRadarClient, "iter_aql_query")
+    def test_failed_types_fetch_leaves_type_none_rate_limited(self, mock_aql):
+        """Busca de tipos falhou: tipo None (sem Type-<id>) e nova busca só após o intervalo."""
+        mock_aql.side_effect = lambda *_a, **_k: [{"logsourceid": 1, "devicetype": 12}]
+        self.client._log_source_types_refreshed = None
+        clock = [1000.0]
+        with patch.object(self.client, "_paginate_endpoint",
+                          side_effect=requests.exceptions.ConnectionError("down")) as mock_pag, \
+             patch("collectors.qradar.client.time.monotonic", side_effect=lambda: clock[0]):
+            rows = self.client.get_event_metrics_window(1000, 2000)
+            self.assertIsNone(rows[0]["log_source_type"])
+            self.client.get_event_metrics_window(2000, 3000)
+            self.assertEqual(mock_pag.call_count, 1)
+
+            clock[0] += LOG_SOURCE_TYPES_REFRESH_SECONDS + 1
+            mock_pag.side_effect = None
+            mock_pag.return_value = [{"id": 12, "name": "Cisco ASA"}]
+            rows = self.client.get_event_metrics_window(3000, 4000)
+        self.assertEqual(mock_pag.call_count, 2)
+        self.assertEqual(rows[0]["log_source_type"], "Cisco ASA")
+
+    @patch.object(QRadarClient, "iter_aql_query")
+    def test_unparsed_verdict_cached(self, mock_aql):
+        """isunparsed rejeitado uma vez → próximas janelas vão direto ao fallback."""
+        mock_aql.side_effect = [AQLQueryRejected("HTTP 422"),
+                                [{"logsourceid": 1}], [{"logsourceid": 2}]]
         self.client.get_event_metrics_window(1000, 2000)
-        aql = mock_aql.call_args_list[0][0][0]
-        self.assertIn("LOGSOURCETYPENAME(devicetype)", aql)
-        self.assertNotIn("LOGSOURCETYPENAME(logsourceid)", aql)
-
-    @patch.object(QRadarClient, "run_aql_query", return_value=[])
-    def test_event_metrics_uses_half_open_interval(self, mock_aql):
-        """WHERE deve usar starttime >= start AND starttime < end (half-open)."""
-        start_ms, end_ms = 1000000, 2000000
-        self.client.get_event_metrics_window(start_ms, end_ms)
-        aql = mock_aql.call_args_list[0][0][0]
-        self.assertIn(f"starttime >= {start_ms}", aql)
-        self.assertIn(f"starttime < {end_ms}", aql)
-        self.assertNotIn("BETWEEN", aql.upper())
+        self.assertIs(self.client._supports_unparsed, False)
+        self.client.get_event_metrics_window(2000, 3000)
+        self.assertEqual(mock_aql.call_count, 3)
+        self.assertNotIn("isunparsed", mock_aql.call_args_list[2][0][0])
+
+    @patch.object(QRadarClient, "iter_aql_query")
+    def test_unparsed_verdict_not_set_on_transient_failure(self, mock_aql):
+        """Timeout na tentativa 1 com fallback OK: a próxima janela tenta unparsed de novo."""
+        mock_aql.side_effect = [None, [{"logsourceid": 1}], [{"logsourceid": 2}]]
+        self.assertEqual(len(self.client.get_event_metrics_window(1000, 2000)), 1)
+        self.assertIsNone(self.client._supports_unparsed)
+        self.client.get_event_metrics_window(2000, 3000)
+        self.assertEqual(mock_aql.call_count, 3)
+        self.assertIn("isunparsed", mock_aql.call_args_list[2][0][0])
+        self.assertIs(self.client._supports_unparsed, True)
+
+    @patch.object(QRadarClient, "iter_aql_query", return_value=None)
+    def test_unparsed_verdict_not_set_when_both_fail(self, mock_aql):
+        """Falha nas duas variantes (rede/timeout) não desativa unparsed."""
+        self.assertIsNone(self.client.get_event_metrics_window(1000, 2000))
+        self.assertIsNone(self.client._supports_unparsed)
+
+    @patch("collectors.qradar.client.time.time", return_value=10_000.0)
+    def test_last_minutes_hint_covers_window(self, _mock_time):
+        """Dica LAST N MINUTES antes do WHERE cobre a janela a partir de agora."""
+        # Janela recente de 1h terminando agora: 60 min + folga
+        aql = QRadarClient._event_metrics_aql(10_000_000 - 3_600_000, 10_000_000, False)
+        self.assertIn(
+            f"FROM events LAST {60 + AQL_LAST_SLACK_MINUTES} MINUTES WHERE starttime >=", aql
+        )
+        # Fim um pouco atrás de agora (dentro do limite): dica vai até agora
+        lag_ms = AQL_LAST_MAX_LAG_MINUTES * 60_000
+        aql = QRadarClient._event_metrics_aql(10_000_000 - lag_ms - 3_600_000,
+                                              10_000_000 - lag_ms, False)
+        self.assertIn(
+            f"LAST {60 + AQL_LAST_MAX_LAG_MINUTES + AQL_LAST_SLACK_MINUTES} MINUTES", aql
+        )
 
-    @patch.object(QRadarClient, "run_aql_query", return_value=[])
-    def test_event_metrics_groups_by_logsourceid_and_devicetype(self, mock_aql):
-        """GROUP BY deve incluir ambos logsourceid e devicetype."""
-        self.client.get_event_metrics_window(1000, 2000)
-        aql = mock_aql.call_args_list[0][0][0]
-        self.assertIn("GROUP BY logsourceid, devicetype", aql)
+    @patch("collectors.qradar.client.time.time", return_value=10_000.0)
+    def test_catch_up_window_omits_last_hint(self, _mock_time):
+        """Catch-up antigo: sem LAST (varreria até agora), só o filtro em ms."""
+        start_ms = 10_000_000 - 3 * 3_600_000
+        end_ms = 10_000_000 - 2 * 3_600_000
+        for with_unparsed in (True, False):
+            for bucket_ms in (None, 3_600_000):
+                aql = QRadarClient._event_metrics_aql(start_ms, end_ms, with_unparsed, bucket_ms)
+                self.assertNotIn("LAST", aql)
+                self.assertIn(
+                    f"FROM events WHERE starttime >= {start_ms} AND starttime < {end_ms} ", aql
+                )
+        with patch.object(QRadarClient, "run_aql_query", return_value=[]) as mock_aql:
+            self.client.get_event_counts_by_logsource(start_ms, end_ms)
+        self.assertNotIn("LAST", mock_aql.call_args[0][0])
+
+    def test_aql_templates_fully_formatted(self):
+        """Templates pré-montados: nenhum placeholder sobra após format."""
+        for with_unparsed in (True, False):
+            for bucket_ms in (None, 3600000):
+                aql = QRadarClient._event_metrics_aql(1000, 2000, with_unparsed, bucket_ms)
+                self.assertNotIn("{", aql)
+                self.assertIn("starttime >= 1000 AND starttime < 2000", aql)
+                self.assertEqual("unparsed_total_events" in aql, with_unparsed)
+
+    @patch.object(QRadarClient, "iter_aql_query")
+    def test_windows_single_search_split_by_bucket(self, mock_aql):
+        """Várias janelas numa só busca: GROUP BY bucket e split em Python."""
+        hour = 3600 * 1000
+        mock_aql.return_value = [
+            {"logsourceid": 1, "total_event_count": 10, "bucket": 0},
+            {"logsourceid": 1, "total_event_count": 7, "bucket": 2.0},
+            {"logsourceid": 2, "total_event_count": 3, "bucket": 2},
+        ]
+        windows = self.client.get_event_metrics_windows(0, 3 * hour - 1000)
+        mock_aql.assert_called_once()
+        aql = mock_aql.call_args[0][0]
+        self.assertIn(f"LONG((starttime - 0) / {hour}) as bucket", aql)
+        self.assertIn("GROUP BY logsourceid, devicetype, bucket", aql)
+        self.assertEqual([(w[0], w[1]) for w in windows], [(0, hour), (hour, 2 * hour), (2 * hour, 3 * hour - 1000)])
+        self.assertEqual([len(w[2]) for w in windows], [1, 0, 2])
+        self.assertNotIn("bucket", windows[2][2][0])
 
     @patch.object(QRadarClient, "run_aql_query", return_value=[])
-    def test_deprecated_method_also_correct(self, mock_aql):
-        """get_event_counts_by_logsource (deprecated) deve usar devicetype também."""
-        self.client.get_event_counts_by_logsource(1000, 2000)
+    def test_flow_counts_window_in_where_clause(self, mock_aql):
+        """Flows: janela no WHERE (sem LAST após ORDER BY), horas > 24 exatas."""
+        with patch("collectors.qradar.client.time.time", return_value=1_700_000_000.0):
+            self.client.get_flow_counts_by_logsource(hours=30)
         aql = mock_aql.call_args[0][0]
-        self.assertIn("LOGSOURCETYPENAME(devicetype)", aql)
-        self.assertIn("GROUP BY logsourceid, devicetype", aql)
+        end_ms = 1_700_000_000_000
+        self.assertIn(f"WHERE starttime >= {end_ms - 30 * 3600 * 1000} AND starttime < {end_ms}", aql)
+        self.assertNotIn("LAST", aql)
+        self.assertTrue(aql.endswith("ORDER BY flow_count DESC"))
+
+    @patch.object(QRadarClient, "get_event_metrics_window", return_value=[])
+    def test_last_n_hours_window_is_exact(self, mock_window):
+        """Janela de N horas derivada de um único time.time(): exatamente N × 3.600.000 ms."""
+        with patch("collectors.qradar.client.time.time", return_value=1_700_000_000.1234):
+            self.client.get_event_counts_last_n_hours(hours=3)
+        start_ms, end_ms = mock_window.call_args[0]
+        self.assertEqual(end_ms, 1_700_000_000_123)
+        self.assertEqual(end_ms - start_ms, 3 * 3600 * 1000)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -99,15 +397,28 @@ class TestAQLQueries(unittest.TestCase):
 class TestArielAsyncFlow(unittest.TestCase):
     """Simula POST /ariel/searches → poll → GET /results."""
 
-    def setUp(self):
-        self.client = QRadarClient(
+    @classmethod
+    def setUpClass(cls):
+        cls.client = QRadarClient(
             "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
         )
 
-    @patch("time.sleep", return_value=None)
-    def test_full_aql_flow(self, _mock_sleep):
+    def setUp(self):
+        # Adapter novo por teste; o prefixo do host vence o "https://" do client
+        self.transport = _StubAdapter()
+        self.client.session.mount("https://qradar.test", self.transport)
+        self.addCleanup(self.client.session.adapters.pop, "https://qradar.test")
+
+    def _register_search(self, search_id, statuses, events):
+        searches = "/api/ariel/searches"
+        self.transport.add("POST", searches, {"search_id": search_id}, status=201)
+        for status in statuses:
+            self.transport.add("GET", f"{searches}/{search_id}",
+                               {"status": status, "search_id": search_id})
+        self.transport.add("GET", f"{searches}/{search_id}/results", {"events": events})
+
+    def test_full_aql_flow(self):
         """POST cria search → poll WAIT→COMPLETED → GET results."""
-        search_id = "abc-123-search"
         expected_events = [
             {
                 "logsourceid": 100,
@@ -119,39 +430,54 @@ class TestArielAsyncFlow(unittest.TestCase):
                 "avg_payload_bytes": 240,
             },
         ]
+        self._register_search("abc-123-search", ["WAIT", "COMPLETED"], expected_events)
 
-        post_resp = _make_mock_response(201, {"search_id": search_id})
-        status_wait = _make_mock_response(200, {"status": "WAIT", "search_id": search_id})
-        status_complete = _make_mock_response(200, {"status": "COMPLETED", "search_id": search_id})
-        results_resp = _make_mock_response(200, {"events": expected_events})
-
-        with patch.object(self.client.session, "post", return_value=post_resp):
-            with patch.object(self.client.session, "get") as mock_get:
-                mock_get.side_effect = [status_wait, status_complete, results_resp]
-                events = self.client.run_aql_query("SELECT * FROM events LAST 1 HOURS")
+        events = self.client.run_aql_query("SELECT * FROM events LAST 1 HOURS")
 
         self.assertIsNotNone(events)
         assert events is not None  # narrow type for Pylance
         self.assertEqual(len(events), 1)
         self.assertEqual(events[0]["logsourceid"], 100)
         self.assertEqual(events[0]["total_event_count"], 5000)
+        self.assertEqual([r.method for r in self.transport.calls], ["POST", "GET", "GET", "GET"])
 
-    @patch("time.sleep", return_value=None)
-    def test_results_request_includes_range_header(self, _mock_sleep):
+    def test_results_request_includes_range_header(self):
         """Verifica que o GET /results inclui Range header."""
-        search_id = "range-test-id"
-        post_resp = _make_mock_response(201, {"search_id": search_id})
-        status_complete = _make_mock_response(200, {"status": "COMPLETED", "search_id": search_id})
-        results_resp = _make_mock_response(200, {"events": []})
-
-        with patch.object(self.client.session, "post", return_value=post_resp):
-            with patch.object(self.client.session, "get") as mock_get:
-                mock_get.side_effect = [status_complete, results_resp]
-                self.client.run_aql_query("SELECT 1")
-
-        last_get_call = mock_get.call_args_list[-1]
-        headers_sent = last_get_call.kwargs.get("headers") or last_get_call[1].get("headers", {})
-        self.assertIn("Range", headers_sent or {})
+        self._register_search("range-test-id", ["COMPLETED"], [])
+
+        self.client.run_aql_query("SELECT 1")
+
+        last_request = self.transport.calls[-1]
+        self.assertTrue(last_request.url.endswith("/range-test-id/results"))
+        self.assertIn("Range", last_request.headers)
+
+    def test_timeout_uses_monotonic_clock(self):
+        """Timeout medido com time.monotonic (time.time pode saltar com NTP)."""
+        running = _make_mock_response(200, {"status": "EXECUTE"})
+        clock = iter([0, 1, AQL_TIMEOUT_SECONDS + 1])
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get", return_value=running), \
+             patch("collectors.qradar.client.time.monotonic", side_effect=lambda: next(clock)):
+            self.assertIsNone(self.client.run_aql_query("SELECT 1"))
+
+    def test_rejected_aql_reported_separately(self):
+        """POST 422 (AQL inválida) levanta AQLQueryRejected só com raise_on_reject; 5xx vira None."""
+        rejected = _make_mock_response(422, {"message": "Invalid field isunparsed"})
+        with patch.object(self.client.session, "post", return_value=rejected):
+            self.assertIsNone(self.client.run_aql_query("SELECT 1"))
+            with self.assertRaises(AQLQueryRejected):
+                self.client.run_aql_query("SELECT 1", raise_on_reject=True)
+        with patch.object(self.client.session, "post", return_value=_make_mock_response(503)):
+            self.assertIsNone(self.client.run_aql_query("SELECT 1", raise_on_reject=True))
+
+    def test_run_aql_queries_preserves_order(self):
+        """Queries concorrentes retornam na ordem de entrada (None por falha)."""
+        answers = {"Q1": [{"n": 1}], "Q2": None, "Q3": [{"n": 3}]}
+        with patch.object(self.client, "run_aql_query", side_effect=answers.get) as mock_run:
+            results = self.client.run_aql_queries(["Q1", "Q2", "Q3"])
+        self.assertEqual(results, [[{"n": 1}], None, [{"n": 3}]])
+        self.assertEqual(mock_run.call_count, 3)
+        self.assertEqual(self.client.run_aql_queries([]), [])
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -160,8 +486,9 @@ class TestArielAsyncFlow(unittest.TestCase):
 class TestCheckResponse(unittest.TestCase):
     """Verifica mensagens acionáveis para 401/403."""
 
-    def setUp(self):
-        self.client = QRadarClient(
+    @classmethod
+    def setUpClass(cls):
+        cls.client = QRadarClient(
             "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
         )
 
@@ -183,6 +510,67 @@ class TestCheckResponse(unittest.TestCase):
         resp = _make_mock_response(200)
         self.client._check_response(resp, "test_endpoint")
 
+    def test_validate_json_decodes_content(self):
+        """JSON é decodificado a partir de resp.content (bytes)."""
+        resp = _make_mock_response(200, text='[{"id": 1, "name": "Ação"}]')
+        with patch.object(_FakeResponse, "json") as mock_json:
+            self.assertEqual(
+                _validate_json_response(resp, "test_endpoint"), [{"id": 1, "name": "Ação"}]
+            )
+        mock_json.assert_not_called()
+
+    def test_validate_json_rejects_html(self):
+        resp = _make_mock_response(200, text="  \n<!DOCTYPE html><html>Login</html>")
+        with self.assertRaises(ValueError) as ctx:
+            _validate_json_response(resp, "test_endpoint")
+        self.assertIn("HTML", str(ctx.exception))
+        self.assertIn("Login", str(ctx.exception))
+
+    def test_validate_json_html_sniff_limited_to_head(self):
+        """Sniff só olha os primeiros 200 bytes; HTML dentro de strings JSON passa."""
+        for text in ("<HTML><body>x</body></HTML>", "\t<head></head>"):
+            with self.assertRaises(ValueError):
+                _validate_json_response(_make_mock_response(200, text=text), "ep")
+        body = json.dumps({"pad": " " * 300, "html": "<html>"})
+        self.assertEqual(_validate_json_response(_make_mock_response(200, text=body), "ep")["html"], "<html>")
+        late = " " * 250 + "<html>"
+        with self.assertRaises(ValueError) as ctx:  # não é HTML no início → erro de JSON, não de HTML
+            _validate_json_response(_make_mock_response(200, text=late), "ep")
+        self.assertNotIn("recebeu HTML", str(ctx.exception))
+
+    def test_validate_json_does_not_decode_text(self):
+        """Checagem de HTML usa bytes; resp.text (decode completo) não é acessado."""
+        resp = MagicMock()
+        type(resp).text = property(lambda _: self.fail("resp.text acessado"))
+        resp.content = b'{"ok": true}'
+        self.assertEqual(_validate_json_response(resp, "test_endpoint"), {"ok": True})
+
+    @patch("collectors.qradar.client._HTML_SNIFF")
+    def test_validate_json_skips_sniff_for_json_start(self, mock_sniff):
+        """Corpo começando com { ou [ não passa pelo regex de HTML."""
+        mock_sniff.match.return_value = None
+        for body in (b'{"a": 1}', b"[1]"):
+            resp = MagicMock()
+            resp.headers = {}
+            resp.content = body
+            _validate_json_response(resp, "ep")
+        mock_sniff.match.assert_not_called()
+        resp.content = b' {"a": 1}'
+        _validate_json_response(resp, "ep")
+        mock_sniff.match.assert_called_once()
+
+    @patch("collectors.qradar.client._HTML_SNIFF")
+    def test_validate_json_skips_sniff_for_json_content_type(self, mock_sniff):
+        """Content-Type application/json dispensa o sniff; outros tipos ainda são checados."""
+        mock_sniff.match.return_value = None
+        body = '\n {"a": 1}'
+        resp = _make_mock_response(200, text=body, headers={"Content-Type": "application/json;charset=UTF-8"})
+        self.assertEqual(_validate_json_response(resp, "ep"), {"a": 1})
+        mock_sniff.match.assert_not_called()
+        resp = _make_mock_response(200, text=body, headers={"Content-Type": "text/html"})
+        _validate_json_response(resp, "ep")
+        mock_sniff.match.assert_called_once()
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 4. test_connection
@@ -190,8 +578,9 @@ class TestCheckResponse(unittest.TestCase):
 class TestTestConnection(unittest.TestCase):
     """Verifica o método test_connection()."""
 
-    def setUp(self):
-        self.client = QRadarClient(
+    @classmethod
+    def setUpClass(cls):
+        cls.client = QRadarClient(
             "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
         )
 
@@ -212,8 +601,11 @@ class TestQRadarConstants(unittest.TestCase):
     def test_aql_timeout(self):
         self.assertEqual(AQL_TIMEOUT_SECONDS, 300)
 
-    def test_aql_poll_interval(self):
-        self.assertEqual(AQL_POLL_INTERVAL, 5)
+    def test_aql_poll_backoff(self):
+        self.assertEqual(AQL_POLL_INITIAL_DELAY, 0.25)
+        self.assertEqual(AQL_POLL_BACKOFF, 1.5)
+        self.assertEqual(AQL_POLL_MAX_DELAY, 10)
+        self.assertEqual(AQL_PREFER_WAIT, 30)
 
     def test_ariel_max_results(self):
         self.assertEqual(ARIEL_MAX_RESULTS, 50000)
@@ -230,9 +622,8 @@ class TestArielResultsPagination(unittest.TestCase):
             "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
         )
 
-    @patch("time.sleep", return_value=None)
-    def test_single_page_returns_all(self, _mock_sleep):
-        """Página única (<ARIEL_MAX_RESULTS) retorna tudo sem paginar."""
+    def test_single_page_returns_all(self):
+        """Página única (<AQL_RESULT_PAGE) retorna tudo sem paginar."""
         search_id = "single-page"
         fake_events = [{"logsourceid": i} for i in range(10)]
 
@@ -247,12 +638,11 @@ class TestArielResultsPagination(unittest.TestCase):
 
         self.assertEqual(len(events), 10)
 
-    @patch("time.sleep", return_value=None)
-    def test_multi_page_concatenates_all(self, _mock_sleep):
-        """Quando página 1 retorna ARIEL_MAX_RESULTS, deve buscar página 2."""
+    def test_multi_page_concatenates_all(self):
+        """Quando página 1 retorna AQL_RESULT_PAGE, deve buscar página 2."""
         search_id = "multi-page"
-        page1_events = [{"logsourceid": i} for i in range(ARIEL_MAX_RESULTS)]
-        page2_events = [{"logsourceid": ARIEL_MAX_RESULTS + i} for i in range(5)]
+        page1_events = [{"logsourceid": i} for i in range(AQL_RESULT_PAGE)]
+        page2_events = [{"logsourceid": AQL_RESULT_PAGE + i} for i in range(5)]
 
         post_resp = _make_mock_response(201, {"search_id": search_id})
         status_complete = _make_mock_response(200, {"status": "COMPLETED"})
@@ -264,16 +654,15 @@ class TestArielResultsPagination(unittest.TestCase):
                 mock_get.side_effect = [status_complete, page1_resp, page2_resp]
                 events = self.client.run_aql_query("SELECT * FROM events")
 
-        self.assertEqual(len(events), ARIEL_MAX_RESULTS + 5)
+        self.assertEqual(len(events), AQL_RESULT_PAGE + 5)
         # Verifica que todos os IDs estão presentes
         ids = {e["logsourceid"] for e in events}
-        self.assertEqual(len(ids), ARIEL_MAX_RESULTS + 5)
+        self.assertEqual(len(ids), AQL_RESULT_PAGE + 5)
 
-    @patch("time.sleep", return_value=None)
-    def test_range_headers_incremented(self, _mock_sleep):
-        """Range headers devem incrementar offset por ARIEL_MAX_RESULTS."""
+    def test_range_headers_incremented(self):
+        """Range headers devem incrementar offset por AQL_RESULT_PAGE."""
         search_id = "range-check"
-        page1_events = [{"logsourceid": i} for i in range(ARIEL_MAX_RESULTS)]
+        page1_events = [{"logsourceid": i} for i in range(AQL_RESULT_PAGE)]
 
         post_resp = _make_mock_response(201, {"search_id": search_id})
         status_complete = _make_mock_response(200, {"status": "COMPLETED"})
@@ -288,32 +677,44 @@ class TestArielResultsPagination(unittest.TestCase):
         # GET calls: [status_complete, page1_results, page2_results]
         get_calls = mock_get.call_args_list
 
-        # Page 1: Range: items=0-49999
+        # Page 1: Range: items=0-1999
         page1_headers = get_calls[1].kwargs.get("headers") or get_calls[1][1].get("headers", {})
-        self.assertEqual(page1_headers.get("Range"), f"items=0-{ARIEL_MAX_RESULTS - 1}")
+        self.assertEqual(page1_headers.get("Range"), f"items=0-{AQL_RESULT_PAGE - 1}")
 
-        # Page 2: Range: items=50000-99999
+        # Page 2: Range: items=2000-3999
         page2_headers = get_calls[2].kwargs.get("headers") or get_calls[2][1].get("headers", {})
         self.assertEqual(
             page2_headers.get("Range"),
-            f"items={ARIEL_MAX_RESULTS}-{2 * ARIEL_MAX_RESULTS - 1}"
+            f"items={AQL_RESULT_PAGE}-{2 * AQL_RESULT_PAGE - 1}"
         )
 
+    def test_416_ends_pagination(self):
+        """Página cheia seguida de HTTP 416 (offset além do fim) encerra sem erro."""
+        page1_events = [{"logsourceid": i} for i in range(AQL_RESULT_PAGE)]
+        with patch.object(self.client, "_post", return_value={"search_id": "s416"}):
+            with patch.object(self.client.session, "get") as mock_get:
+                mock_get.side_effect = [
+                    _make_mock_response(200, {"status": "COMPLETED"}),
+                    _make_mock_response(200, {"events": page1_events}),
+                    _make_mock_response(416),
+                ]
+                events = self.client.run_aql_query("SELECT * FROM events")
+        self.assertEqual(len(events), AQL_RESULT_PAGE)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 6b. Prefer: wait header no polling
 # ─────────────────────────────────────────────────────────────────────────────
 class TestPreferWaitHeader(unittest.TestCase):
-    """Verifica que polling de status usa Prefer: wait=10."""
+    """Verifica que polling de status usa Prefer: wait=30 e backoff adaptativo."""
 
     def setUp(self):
         self.client = QRadarClient(
             "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
         )
 
-    @patch("time.sleep", return_value=None)
-    def test_prefer_wait_in_polling(self, _mock_sleep):
-        """GET de status deve incluir Prefer: wait=10."""
+    def test_prefer_wait_in_polling(self):
+        """GET de status deve incluir Prefer: wait=30."""
         search_id = "prefer-test"
         post_resp = _make_mock_response(201, {"search_id": search_id})
         status_complete = _make_mock_response(200, {"status": "COMPLETED"})
@@ -327,7 +728,366 @@ class TestPreferWaitHeader(unittest.TestCase):
         # Primeiro GET é o polling de status
         status_call = mock_get.call_args_list[0]
         headers_sent = status_call.kwargs.get("headers") or status_call[1].get("headers", {})
-        self.assertEqual(headers_sent.get("Prefer"), "wait=10")
+        self.assertEqual(headers_sent.get("Prefer"), "wait=30")
+
+    def test_poll_echoes_etag_and_reuses_status_on_304(self):
+        """ETag do status volta em If-None-Match; 304 reaproveita o último status."""
+        post_resp = _make_mock_response(201, {"search_id": "etag"})
+        first = _make_mock_response(200, {"status": "EXECUTE", "progress": 10},
+                                    headers={"ETag": '"v1"'})
+        not_modified = _make_mock_response(304, text=" ")
+        status_complete = _make_mock_response(200, {"status": "COMPLETED"})
+        results_resp = _make_mock_response(200, {"events": []})
+
+        with patch.object(self.client.session, "post", return_value=post_resp):
+            with patch.object(self.client.session, "get") as mock_get:
+                mock_get.side_effect = [first, not_modified, status_complete, results_resp]
+                self.assertEqual(self.client.run_aql_query("SELECT 1"), [])
+
+        sent = [c.kwargs["headers"] for c in mock_get.call_args_list[:3]]
+        self.assertNotIn("If-None-Match", sent[0])
+        self.assertEqual(sent[1]["If-None-Match"], '"v1"')
+        self.assertEqual(sent[2]["If-None-Match"], '"v1"')  # 304 mantém o ETag
+
+    @patch("collectors.qradar.client.time.sleep", return_value=None)
+    def test_poll_delay_grows_and_caps(self, mock_sleep):
+        """Intervalo entre polls: 0,25s × 1,5 a cada volta, limitado a 10s."""
+        post_resp = _make_mock_response(201, {"search_id": "backoff"})
+        waits = [_make_mock_response(200, {"status": "EXECUTE"}) for _ in range(12)]
+        status_complete = _make_mock_response(200, {"status": "COMPLETED"})
+        results_resp = _make_mock_response(200, {"events": []})
+
+        with patch.object(self.client.session, "post", return_value=post_resp), \
+             patch("collectors.qradar.client.random.uniform", side_effect=lambda lo, hi: hi):
+            with patch.object(self.client.session, "get") as mock_get:
+                mock_get.side_effect = waits + [status_complete, results_resp]
+                self.client.run_aql_query("SELECT 1")
+
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 12)
+        self.assertEqual(delays[0], 0.25)
+        self.assertAlmostEqual(delays[1], 0.375)
+        self.assertEqual(max(delays), 10)
+        self.assertEqual(delays, sorted(delays))
+
+
+    @patch("collectors.qradar.client.time.sleep")
+    def test_poll_full_jitter_and_progress_reset(self, mock_sleep):
+        """Sleep sorteado em [0, teto]; teto volta a 0,25s quando o progresso avança."""
+        statuses = [{"status": "EXECUTE", "progress": p} for p in (0, 0, 0, 5, 30, 30)]
+        responses = [_make_mock_response(200, st) for st in statuses]
+        responses += [_make_mock_response(200, {"status": "COMPLETED"}),
+                      _make_mock_response(200, {"events": []})]
+        bounds = []
+
+        def fake_uniform(lo, hi):
+            bounds.append((lo, hi))
+            return hi / 2
+
+        with patch.object(self.client, "_post", return_value={"search_id": "j"}), \
+             patch.object(self.client.session, "get", side_effect=responses), \
+             patch("collectors.qradar.client.random.uniform", side_effect=fake_uniform):
+            self.client.run_aql_query("SELECT 1")
+
+        caps = [hi for _, hi in bounds]
+        self.assertTrue(all(lo == 0 for lo, _ in bounds))
+        self.assertEqual(caps[4], AQL_POLL_INITIAL_DELAY)  # progresso 5 → 30: reset
+        self.assertGreater(caps[3], caps[0])
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [c / 2 for c in caps])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 6c. Paginação de endpoints REST (Content-Range)
+# ─────────────────────────────────────────────────────────────────────────────
+class TestPaginateEndpoint(unittest.TestCase):
+    """Verifica _paginate_endpoint com e sem Content-Range."""
+
+    def setUp(self):
+        self.client = QRadarClient(
+            "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
+        )
+        self.items = [{"id": i} for i in range(23)]
+
+    def _fake_get(self, with_total):
+        def fake_get(url, params=None, headers=None, timeout=None):
+            start, end = map(int, headers["Range"].split("=")[1].split("-"))
+            page = self.items[start:end + 1]
+            resp_headers = {}
+            if with_total and page:
+                resp_headers["Content-Range"] = (
+                    f"items {start}-{start + len(page) - 1}/{len(self.items)}"
+                )
+            return _make_mock_response(200, page, headers=resp_headers)
+        return fake_get
+
+    def test_parallel_pages_keep_order(self):
+        with patch.object(self.client.session, "get", side_effect=self._fake_get(True)) as mock_get:
+            result = self.client._paginate_endpoint("config/x", page_size=5)
+        self.assertEqual(result, self.items)
+        self.assertEqual(mock_get.call_count, 5)
+
+    def test_pages_after_first_fetched_concurrently(self):
+        """Com Content-Range, as páginas restantes ficam em voo ao mesmo tempo."""
+        barrier = threading.Barrier(4, timeout=5)  # páginas 5, 10, 15, 20
+        fake = self._fake_get(True)
+
+        def concurrent_get(url, params=None, headers=None, timeout=None):
+            if not headers["Range"].startswith("items=0-"):
+                barrier.wait()  # serial → BrokenBarrierError
+            return fake(url, params=params, headers=headers, timeout=timeout)
+
+        with patch.object(self.client.session, "get", side_effect=concurrent_get):
+            result = self.client._paginate_endpoint("config/x", page_size=5)
+        self.assertEqual(result, self.items)
+
+    def test_sequential_without_content_range(self):
+        with patch.object(self.client.session, "get", side_effect=self._fake_get(False)) as mock_get:
+            result = self.client._paginate_endpoint("config/x", page_size=5)
+        self.assertEqual(result, self.items)
+        self.assertEqual(mock_get.call_count, 5)
+
+    def test_sequential_prefetches_next_page(self):
+        """Sem Content-Range a próxima página já está em voo enquanto a atual é processada."""
+        requested = []
+        fetched_10 = threading.Event()
+        fake = self._fake_get(False)
+
+        def tracking_get(url, params=None, headers=None, timeout=None):
+            offset = int(headers["Range"].split("=")[1].split("-")[0])
+            requested.append(offset)
+            resp = fake(url, params=params, headers=headers, timeout=timeout)
+            if offset == 10:
+                fetched_10.set()
+            return resp
+
+        with patch.object(self.client.session, "get", side_effect=tracking_get):
+            pages = self.client._iter_paginated("config/x", page_size=5)
+            self.assertEqual(next(pages), self.items[0:5])
+            self.assertEqual(next(pages), self.items[5:10])
+            self.assertTrue(fetched_10.wait(5))  # buscada antes de pedirmos a 3ª página
+            rest = [item for page in pages for item in page]
+        self.assertEqual(rest, self.items[10:])
+        self.assertEqual(sorted(requested), [0, 5, 10, 15, 20])
+
+    def test_single_short_page(self):
+        with patch.object(self.client.session, "get", side_effect=self._fake_get(True)) as mock_get:
+            result = self.client._paginate_endpoint("config/x", page_size=50)
+        self.assertEqual(result, self.items)
+        mock_get.assert_called_once()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 6d. Resultados AQL em streaming (iter_aql_query)
+# ─────────────────────────────────────────────────────────────────────────────
+class TestIterAqlQuery(unittest.TestCase):
+    """Verifica o iterador lazy de resultados Ariel."""
+
+    def setUp(self):
+        self.client = QRadarClient(
+            "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
+        )
+        self.rows = [{"logsourceid": 1, "total_bytes": 10.5}, {"logsourceid": 2, "total_bytes": 3.0}]
+
+    def _stream_resp(self, body):
+        resp = _make_mock_response(200, body)
+        resp.raw = io.BytesIO(json.dumps(body).encode("utf-8"))
+        return resp
+
+    @unittest.skipIf(ijson is None, "ijson não instalado")
+    def test_streams_rows_from_raw(self):
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get", side_effect=[
+                 _make_mock_response(200, {"status": "COMPLETED"}),
+                 self._stream_resp({"events": self.rows}),
+             ]) as mock_get:
+            rows = self.client.iter_aql_query("SELECT * FROM events")
+            self.assertEqual(mock_get.call_count, 1)  # resultados só sob demanda
+            result = list(rows)
+        self.assertEqual(result, self.rows)
+        self.assertTrue(mock_get.call_args.kwargs["stream"])
+        self.assertIsInstance(result[0]["total_bytes"], float)
+
+    @unittest.skipIf(ijson is None, "ijson não instalado")
+    def test_flows_query_uses_flows_prefix(self):
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get", side_effect=[
+                 _make_mock_response(200, {"status": "COMPLETED"}),
+                 self._stream_resp({"flows": self.rows}),
+             ]):
+            rows = list(self.client.iter_aql_query("SELECT * FROM flows"))
+        self.assertEqual(rows, self.rows)
+
+    @patch("collectors.qradar.client.ijson", None)
+    def test_fallback_without_ijson(self):
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get", side_effect=[
+                 _make_mock_response(200, {"status": "COMPLETED"}),
+                 _make_mock_response(200, {"events": self.rows}),
+             ]):
+            rows = list(self.client.iter_aql_query("SELECT * FROM events"))
+        self.assertEqual(rows, self.rows)
+
+    def test_failed_search_returns_none(self):
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get",
+                          return_value=_make_mock_response(200, {"status": "ERROR"})):
+            self.assertIsNone(self.client.iter_aql_query("SELECT * FROM events"))
+
+    def test_get_stream_closes_rejected_responses(self):
+        """Tentativas recusadas (5xx, 416) liberam a conexão do pool antes do retry/raise."""
+        def rejected(status):
+            resp = MagicMock(status_code=status)
+            resp.raise_for_status.side_effect = requests.exceptions.HTTPError(response=resp)
+            return resp
+
+        unavailable, ok = rejected(503), MagicMock(status_code=200)
+        with patch.object(self.client.session, "get", side_effect=[unavailable, ok]):
+            self.assertIs(self.client._get_stream("ariel/searches/s1/results"), ok)
+        unavailable.close.assert_called_once()
+        ok.close.assert_not_called()
+
+        past_end = rejected(416)
+        with patch.object(self.client.session, "get", return_value=past_end):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.client._get_stream("ariel/searches/s1/results")
+        past_end.close.assert_called_once()
+
+    def _metrics_client(self):
+        """Nomes/tipos já carregados: as métricas não paginam inventário nem tipos."""
+        self.client._log_source_names = {1: "FW-Borda"}
+        self.client._log_source_names_refreshed = time.monotonic()
+        self.client._log_source_types_refreshed = time.monotonic()
+        patcher = patch.object(self.client, "_cached_log_source_types",
+                               return_value=_TypeMap({12: "Cisco ASA"}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_event_metrics_consume_iterator(self):
+        """get_event_metrics_window lê os resultados via iter_aql_query."""
+        self._metrics_client()
+        body = {"events": [{"logsourceid": 1, "devicetype": 12, "total_event_count": 5}]}
+        stream = self._stream_resp(body) if ijson is not None else _make_mock_response(200, body)
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get", side_effect=[
+                 _make_mock_response(200, {"status": "COMPLETED"}), stream,
+             ]) as mock_get, \
+             patch.object(self.client, "run_aql_query") as mock_run:
+            rows = self.client.get_event_metrics_window(1000, 2000)
+        mock_run.assert_not_called()
+        self.assertEqual(rows, [{"logsourceid": 1, "total_event_count": 5,
+                                 "log_source_name": "FW-Borda", "log_source_type": "Cisco ASA"}])
+        self.assertEqual(mock_get.call_args.kwargs.get("stream", False), ijson is not None)
+        self.assertIs(self.client._supports_unparsed, True)
+
+    @unittest.skipIf(ijson is None, "ijson não instalado")
+    def test_event_metrics_stream_error_is_failure(self):
+        """Erro no meio da leitura vira falha da janela (None), sem veredito de unparsed."""
+        self._metrics_client()
+
+        def broken():
+            resp = _make_mock_response(200)
+            resp.raw = io.BytesIO(b'{"events": [{"logsourceid": 1,')
+            return resp
+
+        with patch.object(self.client, "_post", return_value={"search_id": "s1"}), \
+             patch.object(self.client.session, "get", side_effect=[
+                 _make_mock_response(200, {"status": "COMPLETED"}), broken(),
+                 _make_mock_response(200, {"status": "COMPLETED"}), broken(),
+             ]):
+            self.assertIsNone(self.client.get_event_metrics_window(1000, 2000))
+        self.assertIsNone(self.client._supports_unparsed)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 6e. Cache de tipos de log source
+# ─────────────────────────────────────────────────────────────────────────────
+class TestLogSourceTypesCache(unittest.TestCase):
+    """Verifica o cache TTL (memória + MetricsDB) de get_log_source_types."""
+
+    TYPES = [{"id": 11, "name": "Linux OS"}, {"id": 12, "name": "Windows"}]
+
+    def setUp(self):
+        _TYPES_CACHE.clear()
+        self.addCleanup(_TYPES_CACHE.clear)
+        self.client = QRadarClient(
+            "https://qradar.test", "FAKE_TOKEN", verify_ssl=False
+        )
+
+    def test_second_call_uses_memory_cache(self):
+        with patch.object(self.client, "_paginate_endpoint", return_value=self.TYPES) as mock_pag:
+            first = self.client.get_log_source_types()
+            second = self.client.get_log_source_types()
+        self.assertEqual(first, {11: "Linux OS", 12: "Windows"})
+        self.assertEqual(second, first)
+        mock_pag.assert_called_once()
+
+    def test_unknown_type_id_resolves_to_placeholder(self):
+        with patch.object(self.client, "_paginate_endpoint", return_value=self.TYPES):
+            types = self.client.get_log_source_types()
+        self.assertEqual(types[11], "Linux OS")
+        self.assertEqual(types[99], "Type-99")
+        self.assertNotIn(99, types)  # placeholder não entra no mapa cacheado
+
+    def test_force_refresh_bypasses_cache(self):
+        with patch.object(self.client, "_paginate_endpoint", return_value=self.TYPES) as mock_pag:
+            self.client.get_log_source_types()
+            self.client.get_log_source_types(force_refresh=True)
+        self.assertEqual(mock_pag.call_count, 2)
+
+    def test_failure_not_cached(self):
+        with patch.object(self.client, "_paginate_endpoint",
+                          side_effect=[RuntimeError("boom"), self.TYPES]) as mock_pag:
+            self.assertEqual(self.client.get_log_source_types(), {})
+            self.assertEqual(len(self.client.get_log_source_types()), 2)
+        self.assertEqual(mock_pag.call_count, 2)
+
+    def test_persisted_snapshot_survives_restart(self):
+        db = MetricsDB(":memory:")
+        self.addCleanup(db.close)
+        with patch.object(self.client, "_paginate_endpoint", return_value=self.TYPES):
+            self.client.get_log_source_types(db=db)
+        _TYPES_CACHE.clear()  # simula novo processo
+        with patch.object(self.client, "_paginate_endpoint") as mock_pag:
+            result = self.client.get_log_source_types(db=db)
+        mock_pag.assert_not_called()
+        self.assertEqual(result, {11: "Linux OS", 12: "Windows"})
+
+    def test_collect_inventory_overlaps_types_and_first_page(self):
+        """Cache expirado: tipos e 1ª página de log sources são buscados em paralelo."""
+        db = MetricsDB(":memory:")
+        self.addCleanup(db.close)
+        barrier = threading.Barrier(2, timeout=5)  # sequencial → BrokenBarrierError
+
+        def fake_paginate(endpoint, page_size=500):
+            barrier.wait()
+            return self.TYPES
+
+        def fake_sources():
+            barrier.wait()
+            yield {"id": 1, "name": "a", "type_id": 11}
+            yield {"id": 2, "name": "b", "type_id": 12}
+
+        with patch.object(self.client, "_paginate_endpoint", side_effect=fake_paginate), \
+             patch.object(self.client, "iter_log_sources", side_effect=fake_sources):
+            self.assertEqual(collect_inventory(self.client, db), 2)
+        self.assertEqual(db.get_log_source_types(), {11: "Linux OS", 12: "Windows"})
+        names = db.conn.execute("SELECT type_name FROM log_sources_inventory ORDER BY 1").fetchall()
+        self.assertEqual(names, [("Linux OS",), ("Windows",)])
+
+    def test_collect_inventory_unified_format(self):
+        db = MetricsDB(":memory:")
+        self.addCleanup(db.close)
+        sources = [
+            {"id": 1, "name": "syslog-a", "type_id": 11, "enabled": True},
+            {"id": 2, "name": "custom", "type_id": 99},
+        ]
+        with patch.object(self.client, "iter_log_sources", return_value=iter(sources)), \
+             patch.object(self.client, "_paginate_endpoint", return_value=self.TYPES):
+            self.assertEqual(collect_inventory(self.client, db), 2)
+        rows = db.conn.execute(
+            "SELECT logsource_id, name, type_name, type_id, enabled FROM log_sources_inventory ORDER BY 1"
+        ).fetchall()
+        self.assertEqual(rows, [(1, "syslog-a", "Linux OS", 11, 1), (2, "custom", "Type-99", 99, 0)])
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -344,6 +1104,75 @@ class TestQRadarAuth(unittest.TestCase):
         client = QRadarClient("https://qradar.test", "TOKEN", api_version="20.0")
         self.assertEqual(client.session.headers["Version"], "20.0")
 
+    def test_unverified_clients_share_ssl_context(self):
+        """verify_ssl=False: um SSLContext sem verificação compartilhado entre clients."""
+        a = QRadarClient("https://qradar.test", "TOKEN", verify_ssl=False)
+        b = QRadarClient("https://other.test", "TOKEN", verify_ssl=False)
+        ctx_a = a.session.get_adapter("https://qradar.test").poolmanager.connection_pool_kw["ssl_context"]
+        ctx_b = b.session.get_adapter("https://other.test").poolmanager.connection_pool_kw["ssl_context"]
+        self.assertIs(ctx_a, ctx_b)
+        self.assertEqual(ctx_a.verify_mode, ssl.CERT_NONE)
+        self.assertFalse(ctx_a.check_hostname)
+        verified = QRadarClient("https://qradar.test", "TOKEN", verify_ssl=True)
+        pool_kw = verified.session.get_adapter("https://qradar.test").poolmanager.connection_pool_kw
+        self.assertNotIn("ssl_context", pool_kw)
+
+    def test_accept_encoding_negotiates_compression(self):
+        """Accept-Encoding explícito com todas as codificações decodificáveis."""
+        client = QRadarClient("https://qradar.test", "TOKEN")
+        encodings = client.session.headers["Accept-Encoding"]
+        self.assertEqual(encodings, ACCEPT_ENCODING)
+        self.assertIn("gzip", encodings)
+
+    def test_pooled_adapter_mounted(self):
+        """Adapter com pool dimensionado e bloqueante em http e https."""
+        client = QRadarClient("https://qradar.test", "TOKEN", pool_maxsize=8)
+        for url in ("https://qradar.test", "http://qradar.test"):
+            adapter = client.session.get_adapter(url)
+            self.assertEqual(adapter._pool_maxsize, 8)
+            self.assertTrue(adapter._pool_block)
+            self.assertEqual(adapter.max_retries.total, 0)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 8. Precedência do token em main.run_qradar
+# ─────────────────────────────────────────────────────────────────────────────
+class TestMainTokenPrecedence(unittest.TestCase):
+    """run_qradar resolve o token na ordem CLI > config.json > env QRADAR_TOKEN."""
+
+    def _token_used(self, cli_token, config_token, env_token):
+        """Roda run_qradar até o QRadarClient e retorna o token que chegou nele."""
+        import main
+
+        argv = ["qradar", "--url", "https://qradar.test"]
+        if cli_token:
+            argv += ["--token", cli_token]
+        args = main.build_parser().parse_args(argv)
+        config = {"api_token": config_token} if config_token else {}
+        env = {"QRADAR_TOKEN": env_token} if env_token else {}
+        with patch.object(main, "setup_logging"), \
+             patch.object(main, "load_config", return_value=config), \
+             patch.dict(os.environ, env, clear=False), \
+             patch("collectors.qradar.client.QRadarClient") as mock_client, \
+             patch("main.getpass.getpass", side_effect=AssertionError("prompt inesperado")):
+            if not env_token:
+                os.environ.pop("QRADAR_TOKEN", None)
+            # Falha no test_connection encerra antes de abrir banco/coleta
+            mock_client.return_value.test_connection.side_effect = RuntimeError("offline")
+            with self.assertRaises(SystemExit):
+                main.run_qradar(args)
+        return mock_client.call_args[0][1]
+
+    def test_token_precedence(self):
+        cases = (
+            (("cli", "cfg", "env"), "cli"),
+            ((None, "cfg", "env"), "cfg"),
+            ((None, None, "env"), "env"),
+        )
+        for sources, expected in cases:
+            with self.subTest(sources=sources):
+                self.assertEqual(self._token_used(*sources), expected)
+
 
 if __name__ == "__main__":
     unittest.main()
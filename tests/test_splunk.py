@@ -14,7 +14,6 @@ Execução:
 import json
 import os
 import sys
-import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
@@ -101,28 +100,22 @@ class TestSPLQueries(unittest.TestCase):
 class TestTokenPrecedence(unittest.TestCase):
     """Verifica a cadeia de prioridade: CLI > config > ENV > prompt."""
 
-    def test_cli_over_config(self):
-        cli_token = "cli_token_123"
-        config_token = "config_token_456"
-        result = cli_token or config_token or ""
-        self.assertEqual(result, "cli_token_123")
+    @staticmethod
+    def _resolve_token(cli_token, config_token):
+        return cli_token or config_token or os.environ.get("SPLUNK_TOKEN", "")
 
-    def test_config_over_env(self):
-        config_token = "config_token_456"
-        with patch.dict(os.environ, {"SPLUNK_TOKEN": "env_token_789"}):
-            result = "" or config_token or os.environ.get("SPLUNK_TOKEN", "")
-            self.assertEqual(result, "config_token_456")
-
-    def test_env_when_others_empty(self):
-        with patch.dict(os.environ, {"SPLUNK_TOKEN": "env_token_789"}):
-            result = "" or "" or os.environ.get("SPLUNK_TOKEN", "")
-            self.assertEqual(result, "env_token_789")
-
-    def test_all_empty(self):
-        with patch.dict(os.environ, {}, clear=True):
-            os.environ.pop("SPLUNK_TOKEN", None)
-            result = "" or "" or os.environ.get("SPLUNK_TOKEN", "")
-            self.assertEqual(result, "")
+    def test_resolution_matrix(self):
+        cases = (
+            ("cli_token_123", "config_token_456", "env_token_789", "cli_token_123"),
+            ("", "config_token_456", "env_token_789", "config_token_456"),
+            ("", "", "env_token_789", "env_token_789"),
+            ("", "", None, ""),
+        )
+        for cli_token, config_token, env_token, expected in cases:
+            env = {"SPLUNK_TOKEN": env_token} if env_token is not None else {}
+            with self.subTest(cli=cli_token, config=config_token, env=env_token), \
+                    patch.dict(os.environ, env, clear=True):
+                self.assertEqual(self._resolve_token(cli_token, config_token), expected)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -294,13 +287,10 @@ class TestInventoryCallback(unittest.TestCase):
     """Testa o callback de atualização de inventário."""
 
     def setUp(self):
-        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
-        self.db = MetricsDB(self.db_path)
+        self.db = MetricsDB(":memory:")
 
     def tearDown(self):
         self.db.close()
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
 
     def test_update_inventory_from_results(self):
         """Callback deve atualizar inventário com sources de resultados SPL."""